@@ -0,0 +1,93 @@
+"""
+Cost of the answer log on the quiz path and write throughput of a flush.
+
+Usage:
+    python benchmarks/bench_answer_log.py
+    DATABASE_URL=postgresql://localhost/quizbot_bench python benchmarks/bench_answer_log.py
+
+Times AnswerLog.record, the only part a handler pays for, and building the
+COPY stream for a batch. When DATABASE_URL is set it also writes batches to
+answer_events with COPY and with a multi-row INSERT, inside a transaction
+that is rolled back. Point it at a scratch database with migrations applied.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from answer_log import COLUMNS, AnswerLog, copy_events
+
+MODES = ('classic', 'timed', 'survival')
+
+
+class StreamSink:
+    """Stands in for a cursor: reads the COPY stream and throws it away."""
+
+    def copy_expert(self, sql, buffer):
+        buffer.read()
+
+
+def make_events(count):
+    now = time.time()
+    return [
+        (now + i / 1000, random.randrange(1_000_000), random.randrange(100_000), random.randrange(4),
+         random.random() < 0.6, random.randrange(500, 20_000), random.choice(MODES))
+        for i in range(count)
+    ]
+
+
+def bench_record(rounds):
+    log = AnswerLog(max_pending=rounds + 1)
+    start = time.perf_counter()
+    for i in range(rounds):
+        log.record(i, i % 100_000, i % 4, True, 1500, 'classic')
+    return (time.perf_counter() - start) / rounds * 1e9
+
+
+def bench_database(events):
+    from datetime import datetime, timezone
+    from psycopg2.extras import execute_values
+    from answer_log import maintain_partitions
+    from database import Database
+
+    Database.initialize()
+    maintain_partitions(retention_days=365)
+    rows = [(datetime.fromtimestamp(event[0], timezone.utc), *event[1:]) for event in events]
+    results = {}
+    with Database.connection() as conn, conn.cursor() as cur:
+        start = time.perf_counter()
+        copy_events(cur, events)
+        results['COPY'] = len(events) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        execute_values(cur, f"INSERT INTO answer_events ({', '.join(COLUMNS)}) VALUES %s", rows, page_size=1000)
+        results['INSERT ... VALUES'] = len(events) / (time.perf_counter() - start)
+        conn.rollback()
+    Database.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer log benchmark")
+    parser.add_argument('--rounds', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=100_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"record(): {bench_record(args.rounds):,.0f} ns per answer")
+
+    events = make_events(args.batch)
+    start = time.perf_counter()
+    copy_events(StreamSink(), events)
+    print(f"build COPY stream: {args.batch / (time.perf_counter() - start):,.0f} events/s")
+
+    if os.getenv('DATABASE_URL'):
+        for method, rate in bench_database(events).items():
+            print(f"{method:>18}: {rate:,.0f} events/s")
+
+
+if __name__ == '__main__':
+    main()
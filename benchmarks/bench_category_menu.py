@@ -0,0 +1,76 @@
+"""
+Cost of building the /quiz menu: rendering the keyboard on every call
+against the category catalog's cached keyboards.
+
+Usage:
+    python benchmarks/bench_category_menu.py
+    python benchmarks/bench_category_menu.py --categories 200 --subcategories 5
+
+Needs no database: the catalog is filled from generated rows and the
+question bank from generated questions, a few per subcategory.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from categories import CategoryCatalog
+from models import Question
+from question_bank import QuestionBank
+from quiz_engine import MODE_ROWS
+
+
+def make_catalog(top, per_parent, questions_per_category):
+    bank = QuestionBank()
+    rows = []
+    question_id = 0
+    for i in range(top):
+        parent_id = len(rows) + 1
+        rows.append((parent_id, f"topic-{i}", f"Topic {i}", None, i))
+        for j in range(per_parent):
+            rows.append((len(rows) + 1, f"topic-{i}-{j}", f"Topic {i}.{j}", parent_id, j))
+            for _ in range(questions_per_category):
+                question_id += 1
+                bank.add(Question(question_id, f"topic-{i}-{j}", f"Question {question_id}?", ('A', 'B', 'C', 'D'), 0))
+    catalog = CategoryCatalog(bank)
+    catalog.apply(rows)
+    return catalog
+
+
+def per_call(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Category menu benchmark")
+    parser.add_argument('--categories', type=int, default=40, help="top-level categories")
+    parser.add_argument('--subcategories', type=int, default=4, help="subcategories of each")
+    parser.add_argument('--questions', type=int, default=25, help="questions per subcategory")
+    parser.add_argument('--rounds', type=int, default=20_000)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.categories, args.subcategories, args.questions)
+    print(f"{len(catalog.categories)} categories, {catalog.question_bank.count()} questions")
+
+    rendered = per_call(lambda: catalog._render(None, 0, MODE_ROWS), args.rounds)
+    cached = per_call(lambda: catalog.keyboard(footer=MODE_ROWS), args.rounds)
+    print(f"render every /quiz: {rendered:8.2f} µs")
+    print(f"cached keyboard:    {cached:8.2f} µs")
+
+    # A question toggle changes the counts, so the next /quiz renders again
+    question_ids = list(catalog.question_bank.questions)
+
+    def after_change():
+        catalog.question_bank.set_active(question_ids[0], True)
+        catalog.keyboard(footer=MODE_ROWS)
+
+    print(f"after a bank change: {per_call(after_change, args.rounds // 10):7.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare the in-memory QuestionBank with ORDER BY RANDOM() LIMIT n.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/quizbot_bench python benchmarks/bench_question_bank.py
+
+The SQL side seeds a scratch ``bench_questions`` table for each size and drops
+it afterwards. Without DATABASE_URL only the in-memory numbers are reported.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from models import Question
+from question_bank import QuestionBank
+
+SIZES = [10_000, 100_000, 1_000_000]
+CATEGORIES = ['general', 'science', 'history', 'movies', 'music']
+LIMIT = 10
+ROUNDS = 200
+
+
+def make_rows(size):
+    for i in range(1, size + 1):
+        yield (i, CATEGORIES[i % len(CATEGORIES)], f"Question {i}?", 'A', 'B', 'C', 'D', i % 4, i % 10 != 0)
+
+
+def bench_memory(size):
+    bank = QuestionBank()
+    start = time.perf_counter()
+    for row in make_rows(size):
+        bank.add(Question.from_row(row), row[8])
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        bank.sample(CATEGORIES[i % len(CATEGORIES)], LIMIT)
+    per_call = (time.perf_counter() - start) / ROUNDS
+    return load_time, per_call
+
+
+def bench_sql(conn, size):
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS bench_questions")
+        cur.execute("""
+            CREATE TABLE bench_questions (
+                question_id INTEGER PRIMARY KEY, category TEXT, question_text TEXT,
+                option1 TEXT, option2 TEXT, option3 TEXT, option4 TEXT,
+                correct_option INTEGER, is_active BOOLEAN
+            )
+        """)
+        execute_values(cur, "INSERT INTO bench_questions VALUES %s", make_rows(size), page_size=10_000)
+        cur.execute("CREATE INDEX ON bench_questions (category, is_active)")
+        cur.execute("ANALYZE bench_questions")
+        conn.commit()
+
+        query = """
+            SELECT question_id, question_text, option1, option2, option3, option4, correct_option
+            FROM bench_questions
+            WHERE category = %s AND is_active = TRUE
+            ORDER BY RANDOM()
+            LIMIT %s
+        """
+        rounds = max(5, ROUNDS * 10_000 // size)
+        start = time.perf_counter()
+        for i in range(rounds):
+            cur.execute(query, (CATEGORIES[i % len(CATEGORIES)], LIMIT))
+            cur.fetchall()
+        per_call = (time.perf_counter() - start) / rounds
+
+        cur.execute("DROP TABLE bench_questions")
+        conn.commit()
+    return per_call
+
+
+def main():
+    conn = None
+    database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        import psycopg2
+        conn = psycopg2.connect(database_url.replace('postgres://', 'postgresql://', 1))
+
+    print(f"{'questions':>10} {'bank load':>12} {'bank sample':>14} {'sql sample':>14} {'speedup':>9}")
+    for size in SIZES:
+        load_time, memory_call = bench_memory(size)
+        sql_call = bench_sql(conn, size) if conn else None
+        print(
+            f"{size:>10,} {load_time:>11.2f}s {memory_call * 1e6:>12.1f}us "
+            + (f"{sql_call * 1e3:>12.2f}ms {sql_call / memory_call:>8.0f}x" if sql_call else f"{'-':>14} {'-':>9}")
+        )
+
+    if conn:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
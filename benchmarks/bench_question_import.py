@@ -0,0 +1,82 @@
+"""
+Rows per second for bulk question imports of 100k and 1M rows.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/quizbot_bench python benchmarks/bench_question_import.py
+
+Generates a synthetic CSV per size, then times parse + validate + hash on
+its own and, when DATABASE_URL is set, the full COPY import. Point it at a
+scratch database with the schema applied: imported rows are deleted again
+afterwards, but the questions table is written to.
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from question_io import FIELDS, read_rows, validate, import_questions
+
+SIZES = [100_000, 1_000_000]
+CATEGORIES = ['general', 'science', 'history', 'movies', 'music']
+
+
+def write_file(path, size):
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for i in range(size):
+            writer.writerow((
+                CATEGORIES[i % len(CATEGORIES)],
+                f"Benchmark question number {i}?",
+                f"Answer {i}a", f"Answer {i}b", f"Answer {i}c", f"Answer {i}d",
+                i % 4 + 1
+            ))
+
+
+def bench_parse(path):
+    start = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as stream:
+        for _, row in read_rows(stream, 'csv'):
+            validate(row)
+    return time.perf_counter() - start
+
+
+def bench_import(path):
+    start = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as stream:
+        stats = import_questions(stream, 'csv')
+    return time.perf_counter() - start, stats
+
+
+def main():
+    use_database = bool(os.getenv('DATABASE_URL'))
+    if use_database:
+        from database import Database
+        Database.initialize()
+
+    print(f"{'rows':>10} {'parse+validate':>16} {'full import':>14} {'inserted':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            path = os.path.join(directory, f"questions_{size}.csv")
+            write_file(path, size)
+            parse_time = bench_parse(path)
+            line = f"{size:>10,} {size / parse_time:>11,.0f} r/s"
+
+            if use_database:
+                import_time, stats = bench_import(path)
+                line += f" {size / import_time:>10,.0f} r/s {stats['inserted']:>10,}"
+                Database.execute_query(
+                    "DELETE FROM questions WHERE question_text LIKE %s",
+                    ('Benchmark question number %',)
+                )
+            print(line)
+
+    if use_database:
+        Database.close()
+
+
+if __name__ == '__main__':
+    main()
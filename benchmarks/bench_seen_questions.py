@@ -0,0 +1,120 @@
+"""
+Memory per user and pick latency for per-user seen-question filters.
+
+Usage:
+    python benchmarks/bench_seen_questions.py
+    python benchmarks/bench_seen_questions.py --users 100000 --picks 50000
+
+Builds one encoded SeenFilter per user (the bytes the Redis store keeps)
+for --users players, each with between 0 and CAPACITY questions seen, over
+a bank of 100k rated questions. Memory is measured with tracemalloc over
+the whole population. Pick latency is one quiz start: decode the user's
+filter, pick 10 unseen questions near their skill, mark them seen and
+encode it again, against the same pick with no filter.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from models import Question
+from question_bank import QuestionBank
+from seen import CAPACITY, SeenFilter
+
+QUESTIONS = 100_000
+CATEGORIES = ['general', 'science', 'history', 'movies', 'music']
+TEMPLATES = 1000
+LIMIT = 10
+
+
+def make_bank():
+    bank = QuestionBank()
+    for i in range(1, QUESTIONS + 1):
+        bank.add(Question(i, CATEGORIES[i % len(CATEGORIES)], f"Question {i}?", ('A', 'B', 'C', 'D'), i % 4,
+                          random.gauss(1000, 200)))
+    return bank
+
+
+def make_filters(users):
+    # Building a million filters one add at a time would dominate the run, so
+    # users share a pool of template contents but each holds its own copy
+    templates = []
+    for _ in range(TEMPLATES):
+        seen = SeenFilter()
+        for question_id in random.sample(range(1, QUESTIONS + 1), random.randint(0, CAPACITY - LIMIT)):
+            seen.add(question_id)
+        templates.append(seen.to_bytes())
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    filters = {user_id: bytes(bytearray(templates[user_id % TEMPLATES])) for user_id in range(users)}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return filters, used / users
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (
+        statistics.median(samples) * 1e6,
+        samples[int(len(samples) * 0.99)] * 1e6
+    )
+
+
+def bench_picks(bank, filters, picks):
+    users = list(filters)
+    with_filter = []
+    without_filter = []
+    short = 0
+    for _ in range(picks):
+        user_id = random.choice(users)
+        category = random.choice(CATEGORIES)
+        skill = random.gauss(1000, 200)
+
+        start = time.perf_counter()
+        seen = SeenFilter.from_bytes(filters[user_id])
+        questions = bank.sample_near(skill, category, LIMIT, seen)
+        for question in questions:
+            seen.add(question.question_id)
+        filters[user_id] = seen.to_bytes()
+        with_filter.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        bank.sample_near(skill, category, LIMIT)
+        without_filter.append(time.perf_counter() - start)
+
+        short += len(questions) < LIMIT
+    return percentiles(with_filter), percentiles(without_filter), short
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seen-question filter benchmark")
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--picks', type=int, default=20_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    bank = make_bank()
+    filters, per_user = make_filters(args.users)
+    filter_object = SeenFilter()
+    in_process = sys.getsizeof(filter_object) + sys.getsizeof(filter_object.bits)
+
+    print(f"{args.users:,} users, {QUESTIONS:,} questions, filter for the last {CAPACITY} seen per category")
+    print(f"encoded filter: {len(filter_object.to_bytes())} bytes "
+          f"({per_user:,.0f} bytes/user resident in a dict, {per_user * args.users / 2**20:,.0f} MiB total)")
+    print(f"decoded SeenFilter object: {in_process} bytes")
+
+    (p50, p99), (base_p50, base_p99), short = bench_picks(bank, filters, args.picks)
+    print(f"\npick {LIMIT} questions, {args.picks:,} quiz starts:")
+    print(f"  with seen filter:    p50 {p50:,.0f} us  p99 {p99:,.0f} us")
+    print(f"  without (baseline):  p50 {base_p50:,.0f} us  p99 {base_p99:,.0f} us")
+    print(f"  picks that fell short of {LIMIT} unseen nearby questions: {short}")
+
+
+if __name__ == '__main__':
+    main()
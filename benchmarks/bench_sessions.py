@@ -0,0 +1,161 @@
+"""
+Memory and throughput of 100k live quiz sessions: the old dict layout
+against the slotted QuizSession and the encoded form the session store keeps.
+
+Usage:
+    python benchmarks/bench_sessions.py
+    python benchmarks/bench_sessions.py --sessions 500000
+
+Memory is measured with tracemalloc and excludes the question bank itself,
+which every layout shares. Throughput is one answered question: read the
+session, update score and streak, move to the next question, and (for the
+encoded form) write it back. Also compares the old zip-and-shuffle option
+shuffle against the permutation index.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from models import Question, QuizSession
+from session_store import encode_session, decode_session
+
+QUESTIONS = 10_000
+PER_QUIZ = 10
+
+
+def make_bank():
+    return {
+        i: Question(i, 'science', f"Question {i}?", ('A', 'B', 'C', 'D'), i % 4)
+        for i in range(1, QUESTIONS + 1)
+    }
+
+
+def row(question):
+    return (question.question_id, question.text, *question.options, question.correct)
+
+
+def dict_sessions(bank, rows, count):
+    # The layout context.user_data['quiz'] used to hold
+    sessions = {}
+    for user_id in range(count):
+        ids = random.sample(range(1, QUESTIONS + 1), PER_QUIZ)
+        sessions[user_id] = {'quiz': {
+            'category': 'science',
+            'score': 0,
+            'streak': 0,
+            'question_index': 0,
+            'start_time': datetime.now(),
+            'questions': [rows[i] for i in ids],
+            'current_correct': 2
+        }}
+    return sessions
+
+
+def slotted_sessions(bank, rows, count):
+    return {
+        user_id: QuizSession('science', random.sample(range(1, QUESTIONS + 1), PER_QUIZ))
+        for user_id in range(count)
+    }
+
+
+def encoded_sessions(bank, rows, count):
+    return {
+        user_id: encode_session(QuizSession('science', random.sample(range(1, QUESTIONS + 1), PER_QUIZ)))
+        for user_id in range(count)
+    }
+
+
+def measure(build, bank, rows, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = build(bank, rows, count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return sessions, used / count
+
+
+def answer_dict(sessions, user_id):
+    quiz = sessions[user_id]['quiz']
+    quiz['score'] += 10
+    quiz['streak'] += 1
+    quiz['question_index'] = (quiz['question_index'] + 1) % PER_QUIZ
+
+
+def answer_slotted(sessions, user_id):
+    quiz = sessions[user_id]
+    quiz.score += 10
+    quiz.streak += 1
+    quiz.index = (quiz.index + 1) % PER_QUIZ
+
+
+def answer_encoded(sessions, user_id):
+    quiz = decode_session(sessions[user_id])
+    quiz.score = (quiz.score + 10) % 60000
+    quiz.streak = (quiz.streak + 1) % 200
+    quiz.index = (quiz.index + 1) % PER_QUIZ
+    sessions[user_id] = encode_session(quiz)
+
+
+def throughput(answer, sessions, rounds):
+    users = list(sessions)
+    start = time.perf_counter()
+    for i in range(rounds):
+        answer(sessions, users[i % len(users)])
+    return rounds / (time.perf_counter() - start)
+
+
+def shuffle_zip(question_row):
+    options = [question_row[2], question_row[3], question_row[4], question_row[5]]
+    shuffled = list(zip(options, [0, 1, 2, 3]))
+    random.shuffle(shuffled)
+    shuffled_options, original_indices = zip(*shuffled)
+    return shuffled_options, original_indices.index(question_row[6])
+
+
+def bench_shuffle(rounds):
+    question = Question(1, 'science', "Question?", ('A', 'B', 'C', 'D'), 2)
+    question_row = row(question)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        shuffle_zip(question_row)
+    zip_rate = rounds / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        question.shuffle()
+    return zip_rate, rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz session layout benchmark")
+    parser.add_argument('--sessions', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=500_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    bank = make_bank()
+    rows = {question_id: row(question) for question_id, question in bank.items()}
+
+    print(f"{args.sessions:,} live sessions of {PER_QUIZ} questions")
+    print(f"{'layout':>22} {'bytes/session':>14} {'answers/s':>12}")
+    for name, build, answer in (
+        ('dict (user_data)', dict_sessions, answer_dict),
+        ('slotted QuizSession', slotted_sessions, answer_slotted),
+        ('encoded (store)', encoded_sessions, answer_encoded)
+    ):
+        sessions, per_session = measure(build, bank, rows, args.sessions)
+        rate = throughput(answer, sessions, args.rounds)
+        print(f"{name:>22} {per_session:>14,.0f} {rate:>12,.0f}")
+        del sessions
+
+    zip_rate, permutation_rate = bench_shuffle(args.rounds)
+    print(f"\noption shuffle: zip lists {zip_rate:,.0f}/s, permutation index {permutation_rate:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+"""
+Offline load harness: the real bot Application, fake players, no Telegram.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/quizbot_bench python benchmarks/harness.py --migrate
+    python benchmarks/harness.py --players 500 --workloads quiz,battle --json run.json
+    python benchmarks/harness.py --json new.json --compare run.json --tolerance 0.2
+
+Builds the Application exactly as bot/main.py does (build_application, so
+QuizBot.setup_handlers and the keyed update processor), but with an
+in-process Bot API in place of HTTP. Simulated players read the messages
+the bot sends them and tap the buttons on them, so every update goes
+through the real handlers, stores and database. --webhook posts updates
+to the web process's WSGI app instead, and a worker consumer takes them
+from the update queue: the Redis stream with REDIS_URL set, otherwise the
+in-memory stand-in.
+
+Workloads, run in the order given:
+    quiz         every player plays --quizzes classic quizzes
+    battle       every player queues for --battles random battles
+    leaderboard  every player sends /leaderboard --repeat times at once
+    group        players split into --rooms group chats answer every round
+    broadcast    one admin broadcast to every seeded user
+
+Each workload reports updates per second, end-to-end latency (queued to
+handled, including time waiting behind the same user's updates), handler
+time, database connection checkouts, queries and Bot API calls per update.
+--memory also reports traced bot memory per live quiz session; tracing
+slows everything down, so don't compare latencies from such a run.
+
+Point DATABASE_URL at a scratch database. Players and their questions
+use ids from HARNESS_BASE and text starting "Harness question"; rows from
+an earlier run are deleted first, so runs start from the same state. Leave
+REDIS_URL unset unless Redis is part of what you're measuring: the Redis
+stores keep their state between runs. --pause 0 (the default) removes
+the pause before the next question so the bot, not the timer, is measured.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bot'))
+sys.path.insert(0, BOT_DIR)
+
+from telegram import Update
+from telegram.request import BaseRequest
+import battle_mode
+import group_quiz
+import metrics
+import quiz_engine
+from concurrency import KeyedUpdateProcessor
+from database import Database
+from main import QuizBot, build_application
+from update_queue import UpdateConsumer, create_update_queue
+from utils import get_redis, get_sync_redis
+from web import WEBHOOK_PATH, create_app
+
+# Every job run and Bot API call is logged at INFO, which would drown the report
+logging.getLogger('apscheduler').setLevel(logging.WARNING)
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+HARNESS_BASE = 8_000_000_000_000
+WEBHOOK_SECRET = 'harness-secret'
+CATEGORIES = ('general', 'science', 'history', 'movies', 'music')
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Harness', 'username': 'harness_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+# Compared by --compare: higher is better for rates, lower for everything else
+HIGHER_IS_BETTER = ('updates_per_s', 'sends_per_s')
+COMPARED = ('updates_per_s', 'sends_per_s', 'e2e_p99_ms', 'handler_p99_ms', 'db_per_update')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def buttons(message):
+    markup = message.get('reply_markup') or {}
+    return [button['callback_data'] for row in markup.get('inline_keyboard', []) for button in row
+            if 'callback_data' in button]
+
+
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls in-process and hands each message to its recipient's inbox."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.inboxes = {}
+        self.calls = 0
+        self.sends = 0
+        self.message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def inbox(self, chat_id):
+        inbox = self.inboxes.get(chat_id)
+        if inbox is None:
+            inbox = self.inboxes[chat_id] = asyncio.Queue()
+        return inbox
+
+    def message(self, chat_id, text, reply_markup=None, message_id=None):
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        message = {
+            'message_id': message_id or next(self.message_ids),
+            'date': int(time.time()),
+            # Group chat ids are negative
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': BOT_USER,
+            'text': text
+        }
+        if reply_markup:
+            message['reply_markup'] = reply_markup
+        # Only simulated players read their messages; the rest are just counted
+        inbox = self.inboxes.get(chat_id)
+        if inbox is not None:
+            inbox.put_nowait(message)
+        return message
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint == 'getUpdates':
+            result = []
+        elif endpoint == 'sendMessage':
+            self.sends += 1
+            result = self.message(int(params['chat_id']), params['text'], params.get('reply_markup'))
+        elif endpoint == 'editMessageText' and 'chat_id' in params:
+            result = self.message(int(params['chat_id']), params['text'], params.get('reply_markup'),
+                                  params['message_id'])
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class TimedUpdateProcessor(KeyedUpdateProcessor):
+    """The bot's update processor, also timing each update from when the harness queued it."""
+
+    def __init__(self, max_concurrent_updates, queued_at, latencies):
+        super().__init__(max_concurrent_updates)
+        self.queued_at = queued_at
+        self.latencies = latencies
+
+    async def process_update(self, update, coroutine):
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            queued = self.queued_at.pop(update.update_id, None)
+            if queued is not None:
+                self.latencies.append(time.perf_counter() - queued)
+
+
+class Harness:
+    def __init__(self, bot, application, api, processor, args):
+        self.bot = bot
+        self.application = application
+        self.api = api
+        self.args = args
+        self.queued_at = processor.queued_at
+        self.latencies = processor.latencies
+        self.update_ids = itertools.count(1)
+        self.sent = 0
+        self.webhook = None
+
+    async def send(self, data):
+        update_id = next(self.update_ids)
+        data['update_id'] = update_id
+        self.queued_at[update_id] = time.perf_counter()
+        self.sent += 1
+        if self.webhook:
+            await asyncio.to_thread(self.post, json.dumps(data).encode())
+        else:
+            await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+
+    def post(self, body):
+        statuses = []
+        self.webhook({
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': WEBHOOK_PATH,
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN': WEBHOOK_SECRET,
+            'wsgi.input': io.BytesIO(body)
+        }, lambda status, headers: statuses.append(status))
+        if statuses[0] != '200 OK':
+            raise RuntimeError(f"Webhook answered {statuses[0]}")
+
+    @staticmethod
+    def queries():
+        # Every traced statement lands in exactly one bucket of the histogram
+        return sum(sum(series[:-1]) for _, series in metrics.db_query_seconds.collect()[1])
+
+    async def drain(self):
+        while self.queued_at:
+            await asyncio.sleep(0.01)
+
+    async def measure(self, players):
+        """Run player coroutines and report what the bot did for them."""
+        self.latencies.clear()
+        metrics.handler_latency = metrics.LatencyTracker(size=10 ** 7)
+        checkouts = Database.pool_stats()['checkouts']
+        calls, sends, sent = self.api.calls, self.api.sends, self.sent
+        queries = self.queries()
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*players, return_exceptions=True)
+        await self.drain()
+        elapsed = time.perf_counter() - start
+
+        for inbox in self.api.inboxes.values():
+            while not inbox.empty():
+                inbox.get_nowait()
+        failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if failures:
+            print(f"{len(failures)} players failed, first: {failures[0]!r}")
+        updates = self.sent - sent
+        handler = list(metrics.handler_latency.samples)
+        return {
+            'updates': updates,
+            'seconds': round(elapsed, 3),
+            'updates_per_s': round(updates / elapsed, 1),
+            'sends_per_s': round((self.api.sends - sends) / elapsed, 1),
+            'e2e_p50_ms': round(percentile(self.latencies, 50) * 1000, 2),
+            'e2e_p95_ms': round(percentile(self.latencies, 95) * 1000, 2),
+            'e2e_p99_ms': round(percentile(self.latencies, 99) * 1000, 2),
+            'handler_p50_ms': round(percentile(handler, 50) * 1000, 2),
+            'handler_p95_ms': round(percentile(handler, 95) * 1000, 2),
+            'handler_p99_ms': round(percentile(handler, 99) * 1000, 2),
+            # Broadcasts send without receiving updates, so there's nothing to divide by
+            'db_per_update': round((Database.pool_stats()['checkouts'] - checkouts) / updates, 2) if updates else None,
+            'queries_per_update': round((self.queries() - queries) / updates, 2) if updates else None,
+            'api_per_update': round((self.api.calls - calls) / updates, 2) if updates else None,
+            'failed_players': len(failures)
+        }
+
+
+class Player:
+    def __init__(self, harness, user_id, seed):
+        self.harness = harness
+        self.user_id = user_id
+        self.rng = random.Random(seed)
+        self.inbox = harness.api.inbox(user_id)
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': 'Player', 'username': f"player{user_id}"}
+        self.message_ids = itertools.count(1)
+
+    async def command(self, text, chat_id=None):
+        command = text.split()[0]
+        chat_id = chat_id or self.user_id
+        await self.harness.send({'message': {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': self.user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        }})
+
+    async def tap(self, message, data):
+        think = self.harness.args.think
+        if think:
+            await asyncio.sleep(self.rng.uniform(0, think))
+        await self.harness.send({'callback_query': {
+            'id': f"{self.user_id}:{next(self.message_ids)}",
+            'from': self.user,
+            'chat_instance': str(self.user_id),
+            'message': message,
+            'data': data
+        }})
+
+    async def expect(self, match):
+        """The next message from the bot that ``match`` accepts; others are skipped."""
+        deadline = time.monotonic() + self.harness.args.timeout
+        while True:
+            message = await asyncio.wait_for(self.inbox.get(), deadline - time.monotonic())
+            if match(message):
+                return message
+
+    async def play_quiz(self, started=None, measured=None):
+        await self.command('/quiz')
+        menu = await self.expect(lambda m: any(d.startswith('quiz_category_') for d in buttons(m)))
+        await self.tap(menu, self.rng.choice([d for d in buttons(menu) if d.startswith('quiz_category_')]))
+        first = True
+        while True:
+            message = await self.expect(lambda m: (
+                'play again' in m['text'] or 'No questions' in m['text']
+                or any(d.startswith('quiz_answer_') for d in buttons(m))
+            ))
+            answers = [d for d in buttons(message) if d.startswith('quiz_answer_')]
+            if not answers:
+                return
+            if first and started is not None:
+                # Hold here until every session is live, for the memory snapshot
+                first = False
+                started.append(self.user_id)
+                await measured.wait()
+            await self.tap(message, self.rng.choice(answers))
+
+    async def play_battle(self):
+        await self.command('/battle')
+        menu = await self.expect(lambda m: 'battle_random' in buttons(m))
+        await self.tap(menu, 'battle_random')
+        while True:
+            message = await self.expect(lambda m: (
+                'Battle Results' in m['text'] or 'No opponent found' in m['text']
+                or any(d.startswith('battle_answer_') for d in buttons(m))
+            ))
+            answers = [d for d in buttons(message) if d.startswith('battle_answer_')]
+            if not answers:
+                return
+            await self.tap(message, self.rng.choice(answers))
+
+    async def check_leaderboard(self):
+        await self.command('/leaderboard')
+        await self.expect(lambda m: m['text'].startswith('🏆'))
+
+
+def bot_memory():
+    snapshot = tracemalloc.take_snapshot()
+    return snapshot.filter_traces([tracemalloc.Filter(True, os.path.join(BOT_DIR, '*'))])
+
+
+async def quiz_workload(harness, players):
+    args = harness.args
+
+    async def play(player):
+        for round_ in range(args.quizzes):
+            if round_ == 0 and args.memory:
+                await player.play_quiz(started, measured)
+            else:
+                await player.play_quiz()
+
+    started = []
+    measured = asyncio.Event()
+    if not args.memory:
+        return await harness.measure([play(player) for player in players])
+
+    tracemalloc.start()
+    baseline = bot_memory()
+
+    async def snapshot():
+        # Players that never got a question (timeouts) would otherwise hold this up forever
+        deadline = time.monotonic() + args.timeout
+        while len(started) < len(players) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await harness.drain()
+        grown = sum(stat.size_diff for stat in bot_memory().compare_to(baseline, 'filename'))
+        measured.set()
+        return grown
+
+    snapshot_task = asyncio.create_task(snapshot())
+    result = await harness.measure([play(player) for player in players])
+    result['bytes_per_session'] = round(await snapshot_task / max(len(started), 1))
+    tracemalloc.stop()
+    return result
+
+
+async def battle_workload(harness, players):
+    async def play(player):
+        for _ in range(harness.args.battles):
+            await player.play_battle()
+
+    return await harness.measure([play(player) for player in players])
+
+
+async def leaderboard_workload(harness, players):
+    return await harness.measure([
+        player.check_leaderboard() for player in players for _ in range(harness.args.repeat)
+    ])
+
+
+async def broadcast_workload(harness, players):
+    broadcaster = harness.bot.broadcaster
+
+    async def run():
+        await broadcaster.create("📢 Harness broadcast", HARNESS_BASE - 1)
+        while broadcaster.tasks:
+            await asyncio.sleep(0.05)
+
+    return await harness.measure([run()])
+
+
+async def group_workload(harness, players):
+    """Every player in a room taps an answer to every round; reports how many were counted."""
+    rooms = [players[i::harness.args.rooms] for i in range(harness.args.rooms)]
+    counted = []
+
+    async def run_room(number, members):
+        chat_id = -(HARNESS_BASE + number)
+        inbox = harness.api.inbox(chat_id)
+        await members[0].command('/groupquiz', chat_id)
+        answered = set()
+        deadline = time.monotonic() + harness.args.timeout
+        while True:
+            message = await asyncio.wait_for(inbox.get(), deadline - time.monotonic())
+            if message['text'].startswith('🏁'):
+                return
+            if 'got it right' in message['text']:
+                counted.append(int(message['text'].rsplit(' of ', 1)[1].split()[0]))
+            taps = [d for d in buttons(message) if d.startswith('room_answer_')]
+            # Live answer counts re-send the same keyboard; answer each round once
+            if taps and taps[0] not in answered:
+                answered.add(taps[0])
+                await asyncio.gather(*(member.tap(message, member.rng.choice(taps)) for member in members))
+
+    result = await harness.measure([run_room(number, members) for number, members in enumerate(rooms) if members])
+    expected = len(players) * group_quiz.ROOM_QUESTIONS
+    result['answers_counted'] = f"{sum(counted)}/{expected}"
+    return result
+
+
+WORKLOADS = {
+    'quiz': quiz_workload,
+    'battle': battle_workload,
+    'leaderboard': leaderboard_workload,
+    'broadcast': broadcast_workload,
+    'group': group_workload
+}
+
+
+def seed(users, questions):
+    with Database.connection() as conn, conn.cursor() as cur:
+        # Forget earlier runs so every run starts from the same state
+        for table in ('user_stats', 'user_category_stats', 'user_achievements', 'user_skill',
+                      'battle_results', 'answer_events', 'users'):
+            cur.execute(f"DELETE FROM {table} WHERE user_id >= %s", (HARNESS_BASE,))
+        cur.execute("DELETE FROM questions WHERE question_text LIKE 'Harness question %%'")
+        cur.execute("""
+            INSERT INTO users (user_id, username)
+            SELECT %s + i, 'player' || i FROM generate_series(0, %s - 1) AS i
+        """, (HARNESS_BASE, users))
+        cur.execute("""
+            INSERT INTO questions (category, question_text, option1, option2, option3, option4,
+                                   correct_option, text_hash, difficulty)
+            SELECT (%s::text[])[i %% %s + 1], 'Harness question ' || i || '?',
+                   'Option A' || i, 'Option B' || i, 'Option C' || i, 'Option D' || i,
+                   i %% 4, md5('harness' || i), 700 + (i * 37) %% 600
+            FROM generate_series(0, %s - 1) AS i
+        """, (list(CATEGORIES), len(CATEGORIES), questions))
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of more than ``tolerance`` against a baseline run, as messages."""
+    regressions = []
+    for workload, result in results.items():
+        before = baseline.get('results', {}).get(workload)
+        if not before:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f"{workload}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+async def run(args):
+    api = FakeBotAPI(args.api_latency / 1000)
+    bot = QuizBot()
+    processor = TimedUpdateProcessor(args.concurrency, {}, [])
+    application = build_application(bot, '123456:HARNESS', request=api, update_processor=processor)
+    harness = Harness(bot, application, api, processor, args)
+    players = [Player(harness, HARNESS_BASE + i, args.seed + i) for i in range(args.players)]
+
+    results = {}
+    consumer = None
+    if args.webhook:
+        update_queue = create_update_queue(get_redis(), get_sync_redis())
+        harness.webhook = create_app(update_queue, WEBHOOK_SECRET)
+        consumer = UpdateConsumer(update_queue, application)
+        await update_queue.setup()
+
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        if consumer:
+            consumer.start()
+        try:
+            for name in args.workloads:
+                results[name] = await WORKLOADS[name](harness, players)
+                print(f"{name}: " + ", ".join(f"{key} {value}" for key, value in results[name].items()))
+        finally:
+            if consumer:
+                await consumer.stop()
+            await application.stop()
+            await application.post_shutdown(application)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load harness for the quiz bot")
+    parser.add_argument('--workloads', default='quiz,battle,leaderboard,broadcast',
+                        type=lambda value: [name for name in value.split(',') if name])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--users', type=int, default=None, help="seeded users (default: --players)")
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--quizzes', type=int, default=2, help="quizzes per player")
+    parser.add_argument('--battles', type=int, default=1, help="battles per player")
+    parser.add_argument('--repeat', type=int, default=5, help="/leaderboard requests per player")
+    parser.add_argument('--rooms', type=int, default=4, help="group chats for the group workload")
+    parser.add_argument('--rounds', type=int, default=5, help="questions per group quiz")
+    parser.add_argument('--round-seconds', type=float, default=2.0, help="answer window per group question")
+    parser.add_argument('--concurrency', type=int, default=64, help="updates handled at once")
+    parser.add_argument('--think', type=float, default=0.0, help="max seconds a player waits before tapping")
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds between questions")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="ms per Bot API call")
+    parser.add_argument('--timeout', type=float, default=120.0, help="seconds a player waits for the bot")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--webhook', action='store_true', help="deliver updates through the WSGI app and update queue")
+    parser.add_argument('--memory', action='store_true', help="trace bot memory per quiz session")
+    parser.add_argument('--migrate', action='store_true', help="apply migrations first")
+    parser.add_argument('--json', help="write results here")
+    parser.add_argument('--compare', help="fail on regressions against this --json file")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+    if not os.getenv('DATABASE_URL'):
+        parser.error("DATABASE_URL must point at a scratch database")
+
+    if args.migrate:
+        subprocess.run([sys.executable, os.path.join(BOT_DIR, '..', 'migrations', 'migrate.py')], check=True)
+
+    random.seed(args.seed)
+    quiz_engine.NEXT_QUESTION_DELAY = args.pause
+    battle_mode.NEXT_QUESTION_DELAY = args.pause
+    group_quiz.ROOM_QUESTIONS = args.rounds
+    group_quiz.ROUND_SECONDS = args.round_seconds
+    group_quiz.ROUND_PAUSE = args.pause
+    group_quiz.LIVE_UPDATE_INTERVAL = args.round_seconds / 3
+    os.environ.setdefault('BROADCAST_RATE', '100000')
+
+    Database.initialize()
+    seed(args.users or args.players, args.questions)
+    Database.close()
+
+    results = asyncio.run(run(args))
+    Database.close()
+
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump({'args': {key: value for key, value in vars(args).items()
+                                if key not in ('json', 'compare')},
+                       'results': results}, stream, indent=2)
+    if args.compare:
+        with open(args.compare) as stream:
+            regressions = compare(results, json.load(stream), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Update throughput with 1,000 concurrent quizzes: sleeping in the handler vs
+scheduling the next question.
+
+python-telegram-bot handles updates one at a time by default, so this models
+the dispatcher as a single consumer draining an update queue. Each simulated
+player answers a question ``THINK`` seconds after receiving it. The answer
+handler either awaits the inter-question pause itself (the old behaviour)
+or schedules the next question on the event loop's timer and returns,
+which is what JobQueue.run_once does.
+
+All delays are multiplied by ``--scale`` so the blocking run finishes in
+seconds, so compare the two modes with each other rather than reading the
+numbers as wall-clock production figures.
+
+Usage:
+    python benchmarks/load_question_delays.py [--quizzes 1000] [--questions 5] [--scale 0.002]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+PAUSE = 1.5
+THINK = 3.0
+HANDLER_WORK = 0.002
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(mode, quizzes, questions, scale):
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    remaining = {quiz: questions for quiz in range(quizzes)}
+    active = [quizzes]
+    latencies = []
+    done = asyncio.Event()
+    rng = random.Random(7)
+
+    def deliver_question(quiz):
+        # The player taps an answer after thinking about it
+        think = THINK * scale * rng.uniform(0.5, 1.5)
+        loop.call_later(think, lambda: updates.put_nowait((quiz, time.perf_counter())))
+
+    def send_next(quiz):
+        remaining[quiz] -= 1
+        if remaining[quiz] > 0:
+            deliver_question(quiz)
+        else:
+            active[0] -= 1
+            if not active[0]:
+                done.set()
+
+    async def answer_handler(quiz):
+        # Stand-in for edit_message_text, stats and so on; spun rather than
+        # slept because scaled values are far below timer resolution
+        end = time.perf_counter() + HANDLER_WORK * scale
+        while time.perf_counter() < end:
+            pass
+        await asyncio.sleep(0)
+        if mode == 'sleep':
+            await asyncio.sleep(PAUSE * scale)
+            send_next(quiz)
+        else:
+            loop.call_later(PAUSE * scale, send_next, quiz)
+
+    async def dispatcher():
+        while True:
+            quiz, received = await updates.get()
+            latencies.append(time.perf_counter() - received)
+            await answer_handler(quiz)
+
+    for quiz in range(quizzes):
+        deliver_question(quiz)
+
+    start = time.perf_counter()
+    task = asyncio.create_task(dispatcher())
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    return len(latencies), elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quizzes', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=0.002)
+    args = parser.parse_args()
+
+    print(f"{args.quizzes} quizzes x {args.questions} answers, delays scaled by {args.scale}")
+    print(f"{'mode':>10} {'updates':>8} {'wall':>8} {'updates/s':>10} {'p50 wait':>10} {'p99 wait':>10}")
+    for mode in ('sleep', 'scheduled'):
+        count, elapsed, latencies = asyncio.run(run(mode, args.quizzes, args.questions, args.scale))
+        p50 = percentile(latencies, 50)
+        p99 = percentile(latencies, 99)
+        print(f"{mode:>10} {count:>8} {elapsed:>7.2f}s {count / elapsed:>10.0f} "
+              f"{p50 * 1000:>8.1f}ms {p99 * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
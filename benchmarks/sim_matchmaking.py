@@ -0,0 +1,91 @@
+"""
+Load simulator for the random-opponent Matchmaker.
+
+Players arrive as a Poisson process with normally distributed ratings and
+the matcher is ticked on a virtual clock, so a 10 minute simulation runs in
+seconds. Reports time-to-match percentiles, rating gaps and timeouts. The
+in-memory queue is used; RedisMatchQueue runs the same checks in Lua.
+
+Usage:
+    python benchmarks/sim_matchmaking.py [arrivals_per_second] [seconds]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from matchmaking import Matchmaker, MemoryMatchQueue
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def simulate(rate, duration, tick=0.5, seed=1):
+    rng = random.Random(seed)
+    now = [0.0]
+    matcher = Matchmaker(MemoryMatchQueue(), tick=tick, clock=lambda: now[0])
+    ratings = {}
+    waits = []
+    gaps = []
+    timeouts = 0
+    peak_waiting = 0
+    pair_time = 0.0
+    next_user = 0
+    next_arrival = rng.expovariate(rate)
+
+    while now[0] < duration:
+        now[0] += tick
+        while next_arrival <= now[0]:
+            rating = max(400, min(1600, int(rng.gauss(1000, 200))))
+            ratings[next_user] = rating
+            await matcher.enqueue(next_user, rating)
+            next_user += 1
+            next_arrival += rng.expovariate(rate)
+        peak_waiting = max(peak_waiting, await matcher.size())
+
+        start = time.perf_counter()
+        matches, timed_out = await matcher.pair()
+        pair_time += time.perf_counter() - start
+
+        for first, second, first_waited, second_waited in matches:
+            waits.extend((first_waited, second_waited))
+            gaps.append(abs(ratings[first] - ratings[second]))
+        timeouts += len(timed_out)
+
+    ticks = int(duration / tick)
+    return {
+        'players': next_user,
+        'matched': len(waits),
+        'timeouts': timeouts,
+        'peak_waiting': peak_waiting,
+        'median_wait': statistics.median(waits) if waits else float('nan'),
+        'p99_wait': percentile(waits, 99),
+        'median_gap': statistics.median(gaps) if gaps else float('nan'),
+        'p99_gap': percentile(gaps, 99),
+        'pair_ms': pair_time / ticks * 1000
+    }
+
+
+def main():
+    rates = [float(sys.argv[1])] if len(sys.argv) > 1 else [1, 10, 100, 1000]
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 600
+
+    print(f"{'arrivals/s':>10} {'players':>8} {'matched':>8} {'timeouts':>8} {'peak wait':>9} "
+          f"{'p50 ttm':>8} {'p99 ttm':>8} {'p50 gap':>8} {'p99 gap':>8} {'tick cost':>10}")
+    for rate in rates:
+        r = asyncio.run(simulate(rate, duration))
+        print(f"{rate:>10g} {r['players']:>8} {r['matched']:>8} {r['timeouts']:>8} {r['peak_waiting']:>9} "
+              f"{r['median_wait']:>7.1f}s {r['p99_wait']:>7.1f}s {r['median_gap']:>8.0f} {r['p99_gap']:>8.0f} "
+              f"{r['pair_ms']:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules here import each other by bare name (``from database import Database``),
+# as they do when run from this directory, so make that work for ``bot.main`` too
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
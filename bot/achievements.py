@@ -1,62 +1,102 @@
+import json
+import os
+import threading
+from collections import OrderedDict
 from database import Database
 
+DEFAULT_ACHIEVEMENTS_FILE = os.path.join(os.path.dirname(__file__), 'achievements.json')
+
 class AchievementSystem:
-    def __init__(self):
-        self.achievements = {
-            'quiz_starter': {
-                'name': 'Quiz Starter',
-                'description': 'Complete your first quiz',
-                'icon': '🎯'
-            },
-            'streak_3': {
-                'name': 'Hot Streak',
-                'description': 'Get a 3-question streak',
-                'icon': '🔥'
-            },
-            'streak_10': {
-                'name': 'Quiz Master',
-                'description': 'Get a 10-question streak',
-                'icon': '🏆'
-            },
-            'battle_winner': {
-                'name': 'Battle Champion',
-                'description': 'Win your first battle',
-                'icon': '⚔️'
-            }
-        }
-
-    def check_achievements(self, user_id, action, value=None):
-        earned = []
-        
-        if action == 'quiz_complete':
-            if value == 1:  # First quiz
-                earned.append(self.grant_achievement(user_id, 'quiz_starter'))
-                
-        elif action == 'streak':
-            if value >= 3:
-                earned.append(self.grant_achievement(user_id, 'streak_3'))
-            if value >= 10:
-                earned.append(self.grant_achievement(user_id, 'streak_10'))
-                
-        elif action == 'battle_win':
-            earned.append(self.grant_achievement(user_id, 'battle_winner'))
-        
-        return [f"{a['icon']} {a['name']}" for a in earned if a]
-
-    def grant_achievement(self, user_id, achievement_id):
-        # Check if already earned
-        query = """
-            SELECT 1 FROM user_achievements
-            WHERE user_id = %s AND achievement_id = %s
-        """
-        exists = Database.execute_query(query, (user_id, achievement_id), fetch=True)
-        
-        if not exists:
-            # Insert new achievement
-            query = """
-                INSERT INTO user_achievements (user_id, achievement_id)
-                VALUES (%s, %s)
-            """
-            Database.execute_query(query, (user_id, achievement_id))
-            return self.achievements.get(achievement_id)
-        return None
\ No newline at end of file
+    """Rule-driven achievements with a per-user cache of what's already earned.
+
+    Each achievement is a rule ``event value >= threshold`` loaded from JSON
+    and assigned a bit. A user's earned set is cached as an int bitmask in
+    an LRU, so checking an event is a few bit operations and only touches
+    the database the first time a user is seen or when something new is
+    actually granted.
+    """
+
+    def __init__(self, path=None, cache_size=10000):
+        self.cache_size = cache_size
+        self.earned = OrderedDict()
+        self._lock = threading.Lock()
+        self.load_definitions(path or os.getenv('ACHIEVEMENTS_FILE', DEFAULT_ACHIEVEMENTS_FILE))
+
+    def load_definitions(self, path):
+        with open(path, encoding='utf-8') as f:
+            definitions = json.load(f)
+
+        self.achievements = {}
+        self.bits = {}
+        self.rules = {}
+        for bit, definition in enumerate(definitions):
+            achievement_id = definition['id']
+            self.achievements[achievement_id] = definition
+            self.bits[achievement_id] = 1 << bit
+            self.rules.setdefault(definition['event'], []).append(
+                (definition['threshold'], achievement_id)
+            )
+        # Cached masks are only meaningful for the bit layout they were built with
+        with self._lock:
+            self.earned.clear()
+
+    def _cached(self, user_id):
+        with self._lock:
+            mask = self.earned.get(user_id)
+            if mask is not None:
+                self.earned.move_to_end(user_id)
+            return mask
+
+    def _remember(self, user_id, mask):
+        with self._lock:
+            self.earned[user_id] = self.earned.get(user_id, 0) | mask
+            self.earned.move_to_end(user_id)
+            while len(self.earned) > self.cache_size:
+                self.earned.popitem(last=False)
+
+    async def earned_mask(self, user_id):
+        mask = self._cached(user_id)
+        if mask is None:
+            rows = await Database.execute_query_async(
+                "SELECT achievement_id FROM user_achievements WHERE user_id = %s",
+                (user_id,),
+                fetch=True
+            )
+            mask = 0
+            for (achievement_id,) in rows or []:
+                mask |= self.bits.get(achievement_id, 0)
+            self._remember(user_id, mask)
+        return mask
+
+    async def check_achievements(self, user_id, action, value=1):
+        candidates = [
+            achievement_id
+            for threshold, achievement_id in self.rules.get(action, ())
+            if value is not None and value >= threshold
+        ]
+        if not candidates:
+            return []
+
+        earned = await self.earned_mask(user_id)
+        new = [achievement_id for achievement_id in candidates if not earned & self.bits[achievement_id]]
+        if not new:
+            return []
+
+        granted = await self.grant_achievements(user_id, new)
+        return [f"{self.achievements[a]['icon']} {self.achievements[a]['name']}" for a in granted]
+
+    async def grant_achievements(self, user_id, achievement_ids):
+        # ON CONFLICT makes concurrent grants from other workers harmless;
+        # RETURNING tells us which ones this call actually added
+        rows = await Database.execute_values_async("""
+            INSERT INTO user_achievements (user_id, achievement_id)
+            VALUES %s
+            ON CONFLICT (user_id, achievement_id) DO NOTHING
+            RETURNING achievement_id
+        """, [(user_id, achievement_id) for achievement_id in achievement_ids], fetch=True)
+
+        mask = 0
+        for achievement_id in achievement_ids:
+            mask |= self.bits[achievement_id]
+        self._remember(user_id, mask)
+        return [achievement_id for (achievement_id,) in rows or []]
@@ -1,14 +1,34 @@
+import io
+import os
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from database import Database
+import counters
+import metrics
+from models import Question
+from categories import SLUG
+from profiler import SamplingProfiler
+from question_io import import_questions, export_questions, text_hash
+
+# How long one profiling run samples the worker
+PROFILE_SECONDS = 30
 
 class AdminPanel:
-    def __init__(self):
+    def __init__(self, question_bank, catalog, broadcaster, cache):
+        self.question_bank = question_bank
+        self.catalog = catalog
+        self.broadcaster = broadcaster
+        self.cache = cache
+        self.profiler = SamplingProfiler()
         self.admin_commands = {
             'add_question': self.add_question,
             'edit_question': self.edit_question,
             'toggle_question': self.toggle_question,
+            'add_category': self.add_category,
             'view_stats': self.view_stats,
-            'broadcast': self.broadcast
+            'broadcast': self.broadcast,
+            'import_questions': self.import_prompt,
+            'export_questions': self.export,
+            'profile': self.profile
         }
 
     async def admin_menu(self, update, context):
@@ -21,8 +41,12 @@ class AdminPanel:
             [InlineKeyboardButton("➕ Add Question", callback_data="admin_add_question")],
             [InlineKeyboardButton("✏️ Edit Question", callback_data="admin_edit_question")],
             [InlineKeyboardButton("🔧 Toggle Question", callback_data="admin_toggle_question")],
+            [InlineKeyboardButton("🗂 Add Category", callback_data="admin_add_category")],
+            [InlineKeyboardButton("📥 Import Questions", callback_data="admin_import_questions")],
+            [InlineKeyboardButton("📤 Export Questions", callback_data="admin_export_questions")],
             [InlineKeyboardButton("📊 View Stats", callback_data="admin_view_stats")],
-            [InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast")]
+            [InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast")],
+            [InlineKeyboardButton(f"🔬 Profile ({PROFILE_SECONDS}s)", callback_data="admin_profile")]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -39,7 +63,7 @@ class AdminPanel:
             await query.edit_message_text("🚫 You don't have admin privileges.")
             return
         
-        action = query.data.split('_')[1]
+        action = query.data.split('_', 1)[1]
         if action in self.admin_commands:
             await self.admin_commands[action](update, context)
 
@@ -57,28 +81,210 @@ class AdminPanel:
         pass
 
     async def toggle_question(self, update, context):
-        # Implementation for toggling question status
-        pass
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Please send the ID of the question you want to enable or disable:"
+        )
+        context.user_data['awaiting_toggle'] = True
 
-    async def view_stats(self, update, context):
-        query = """
-            SELECT COUNT(*) as total_users,
-                   (SELECT COUNT(*) FROM questions) as total_questions,
-                   (SELECT COUNT(*) FROM questions WHERE is_active = TRUE) as active_questions,
-                   (SELECT SUM(total_score) FROM user_stats) as total_points
-            FROM users
-        """
-        stats = Database.execute_query(query, fetch=True)
-        
-        if stats:
-            stats_msg = (
-                "📊 Bot Statistics:\n\n"
-                f"👥 Total users: {stats[0][0]}\n"
-                f"📝 Total questions: {stats[0][1]}\n"
-                f"✅ Active questions: {stats[0][2]}\n"
-                f"🏆 Total points earned: {stats[0][3]}"
+    async def add_category(self, update, context):
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Please send the category in this format:\n\n"
+                 "slug|Name or slug|Name|parent-slug\n\n"
+                 "Example: physics|Physics|science\n\n"
+                 "Use the slug as the category of its questions. Categories "
+                 "show up in /quiz once they have active questions."
+        )
+        context.user_data['awaiting_category'] = True
+
+    async def handle_admin_message(self, update, context):
+        if not self.is_admin(update.effective_user.id):
+            return
+
+        text = update.message.text
+        if context.user_data.pop('awaiting_question', False):
+            await self.save_question(update, text)
+        elif context.user_data.pop('awaiting_toggle', False):
+            await self.save_toggle(update, text)
+        elif context.user_data.pop('awaiting_category', False):
+            await self.save_category(update, text)
+        elif context.user_data.pop('awaiting_broadcast', False):
+            broadcast_id = await self.broadcaster.create(text, update.effective_chat.id)
+            await update.message.reply_text(f"📢 Broadcast {broadcast_id} started. Progress updates will follow.")
+
+    async def save_question(self, update, text):
+        parts = [part.strip() for part in text.split('|')]
+        if len(parts) != 7 or not parts[6].isdigit() or not 1 <= int(parts[6]) <= 4:
+            await update.message.reply_text("⚠️ Invalid format. Use /admin to try again.")
+            return
+
+        category, question_text, *options, correct = parts
+        params = (category, question_text, *options, int(correct) - 1, text_hash(question_text))
+
+        def insert():
+            with Database.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO questions (category, question_text, option1, option2, option3, option4, correct_option, text_hash)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (text_hash) DO NOTHING
+                    RETURNING question_id
+                """, params)
+                row = cur.fetchone()
+                if row:
+                    counters.increment(cur, questions=1, active_questions=1)
+                return row
+
+        result = await Database.run(insert)
+        if not result:
+            await update.message.reply_text("⚠️ That question is already in the bank.")
+            return
+        question_id = result[0]
+
+        # Keep the in-memory bank in step without a full reload
+        self.question_bank.add(Question(question_id, category, question_text, options, int(correct) - 1))
+        message = f"✅ Question {question_id} added to {category}."
+        if category not in self.catalog.by_slug:
+            message += "\n\n⚠️ That category isn't in the catalog, so /quiz won't offer it. Add it with 🗂 Add Category."
+        await update.message.reply_text(message)
+
+    async def save_category(self, update, text):
+        parts = [part.strip() for part in text.split('|')]
+        if len(parts) not in (2, 3) or not SLUG.match(parts[0]) or not parts[1]:
+            await update.message.reply_text(
+                "⚠️ Invalid format. Slugs are lowercase letters, digits and dashes. Use /admin to try again."
             )
-            await update.callback_query.edit_message_text(stats_msg)
+            return
+        slug, name, *parent = parts
+        parent_slug = parent[0] if parent else None
+        if parent_slug and parent_slug not in self.catalog.by_slug:
+            await update.message.reply_text(f"⚠️ No category with the slug {parent_slug}.")
+            return
+
+        category = await Database.run(self.catalog.add, slug, name, parent_slug)
+        if category is None:
+            await update.message.reply_text(f"⚠️ There's already a category with the slug {slug}.")
+            return
+        where = f" under {self.catalog.by_slug[parent_slug].name}" if parent_slug else ""
+        await update.message.reply_text(f"🗂 Category {name} ({slug}) added{where}.")
+
+    async def save_toggle(self, update, text):
+        if not text.strip().isdigit():
+            await update.message.reply_text("⚠️ Invalid question ID. Use /admin to try again.")
+            return
+
+        def toggle():
+            with Database.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE questions SET is_active = NOT is_active, updated_at = NOW()
+                    WHERE question_id = %s
+                    RETURNING question_id, is_active
+                """, (int(text),))
+                row = cur.fetchone()
+                if row:
+                    counters.increment(cur, active_questions=1 if row[1] else -1)
+                return row
+
+        result = await Database.run(toggle)
+        if not result:
+            await update.message.reply_text("⚠️ Question not found.")
+            return
+
+        question_id, is_active = result
+        self.question_bank.set_active(question_id, is_active)
+        status = "enabled" if is_active else "disabled"
+        await update.message.reply_text(f"🔧 Question {question_id} {status}.")
+
+    async def import_prompt(self, update, context):
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="Send a .csv or .jsonl file with the columns:\n\n"
+                 "category, question_text, option1, option2, option3, option4, correct_option\n\n"
+                 "correct_option is 1-4. Duplicate questions are skipped."
+        )
+
+    async def handle_upload(self, update, context):
+        if not self.is_admin(update.effective_user.id):
+            return
+
+        document = update.message.document
+        fmt = os.path.splitext(document.file_name or '')[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            await update.message.reply_text("⚠️ Please upload a .csv or .jsonl file.")
+            return
+
+        file = await document.get_file()
+        data = await file.download_as_bytearray()
+        stream = io.StringIO(data.decode('utf-8-sig'), newline='')
+
+        def add_to_bank(rows):
+            for row in rows:
+                self.question_bank.add(Question.from_row(row))
+
+        await update.message.reply_text("⏳ Importing questions...")
+        stats = await Database.run(import_questions, stream, fmt, on_inserted=add_to_bank)
+
+        message = (
+            "📥 Import finished:\n\n"
+            f"📄 Rows read: {stats['read']}\n"
+            f"✅ Added: {stats['inserted']}\n"
+            f"♻️ Duplicates: {stats['duplicates']}\n"
+            f"⚠️ Invalid: {stats['invalid']}"
+        )
+        if stats['errors']:
+            message += "\n\n" + "\n".join(stats['errors'])
+        await update.message.reply_text(message)
+
+    async def export(self, update, context):
+        stream = io.StringIO(newline='')
+        count = await Database.run(export_questions, stream, 'csv')
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=stream.getvalue().encode('utf-8'),
+            filename='questions.csv',
+            caption=f"📤 {count} questions"
+        )
+
+    async def view_stats(self, update, context):
+        # Maintained counters: a primary-key read of a handful of rows
+        # instead of COUNT/SUM over the big tables
+        stats = await self.cache.get_or_load(
+            "admin:counters",
+            lambda: Database.run(counters.read),
+            ttl=10
+        )
+        cache_stats = self.cache.stats()
+        stats_msg = (
+            "📊 Bot Statistics:\n\n"
+            f"👥 Total users: {stats['users']}\n"
+            f"📝 Total questions: {stats['questions']}\n"
+            f"✅ Active questions: {stats['active_questions']}\n"
+            f"🏆 Total points earned: {stats['total_points']}\n\n"
+            "⚙️ This worker:\n"
+            f"✍️ Answers in the last minute: {metrics.answers.total()}\n"
+            f"🎮 Active quizzes: {metrics.active_quizzes.count()}\n"
+            f"⚔️ Active battles: {metrics.active_battles.count()}\n"
+            f"👥 Active group rooms: {metrics.active_rooms.count()}\n"
+            f"⏱ p95 handler latency: {metrics.handler_latency.percentile(95) * 1000:.0f} ms\n"
+            f"🗄 Cache hit rate: {cache_stats['hit_rate']:.0%} "
+            f"({cache_stats['size']} entries, {cache_stats['evictions']} evictions)"
+        )
+        await update.callback_query.edit_message_text(stats_msg)
+
+    async def profile(self, update, context):
+        # Samples the event loop of whichever worker handled this tap
+        if not self.profiler.start():
+            await update.callback_query.edit_message_text("🔬 A profile is already running on this worker.")
+            return
+        await update.callback_query.edit_message_text(f"🔬 Profiling this worker for {PROFILE_SECONDS}s...")
+        context.job_queue.run_once(self.profile_done_job, PROFILE_SECONDS, chat_id=update.effective_chat.id)
+
+    async def profile_done_job(self, context):
+        self.profiler.stop()
+        await context.bot.send_message(
+            chat_id=context.job.chat_id,
+            text="🔬 Where this worker spent its time:\n\n" + self.profiler.report()
+        )
 
     async def broadcast(self, update, context):
         await context.bot.send_message(
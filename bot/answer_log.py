@@ -0,0 +1,158 @@
+import asyncio
+import io
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('answered_at', 'user_id', 'question_id', 'selected', 'is_correct', 'response_ms', 'mode')
+# Daily partitions are named answer_events_YYYYMMDD, so names sort by date
+PARTITION_PREFIX = 'answer_events_'
+
+
+def _partition(day):
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def maintain_partitions(retention_days, ahead=3, today=None):
+    """Create the next ``ahead`` days of partitions and drop those past retention.
+
+    Returns the names of the dropped partitions.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    with Database.connection() as conn, conn.cursor() as cur:
+        for offset in range(ahead + 1):
+            day = today + timedelta(days=offset)
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {_partition(day)} PARTITION OF answer_events
+                FOR VALUES FROM ('{day} 00:00+00') TO ('{day + timedelta(days=1)} 00:00+00')
+            """)
+
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'answer_events'::regclass
+        """)
+        # Dropping a whole day is a catalog change, not a DELETE over millions of rows
+        cutoff = _partition(today - timedelta(days=retention_days))
+        expired = sorted(name for (name,) in cur.fetchall() if name < cutoff)
+        for name in expired:
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+    return expired
+
+
+def copy_events(cur, events):
+    # COPY text format: every field is a number, a boolean or a mode name,
+    # so nothing needs escaping
+    buffer = io.StringIO()
+    buffer.writelines(
+        f"{datetime.fromtimestamp(answered_at, timezone.utc).isoformat()}\t{user_id}\t{question_id}\t"
+        f"{selected}\t{'t' if is_correct else 'f'}\t{response_ms}\t{mode}\n"
+        for answered_at, user_id, question_id, selected, is_correct, response_ms, mode in events
+    )
+    buffer.seek(0)
+    cur.copy_expert(f"COPY answer_events ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+
+
+class AnswerLog:
+    """Append-only log of every quiz answer, written in batches with COPY.
+
+    Recording an answer is a list append; a background task streams the
+    batch into the day's ``answer_events`` partition. If the database is
+    unavailable, events are kept for the next flush up to ``max_buffered``,
+    after which the oldest are dropped: the log is for analytics and must
+    never hold up or exhaust the quiz path.
+    """
+
+    def __init__(self, max_pending=1000, flush_interval=5.0, max_buffered=100000, retention_days=180):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.retention_days = retention_days
+        self.pending = []
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def record(self, user_id, question_id, selected, is_correct, response_ms, mode):
+        event = (time.time(), user_id, question_id, selected, is_correct, response_ms, mode)
+        with self._lock:
+            self.pending.append(event)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def restore(self, events):
+        """Put events from a failed flush back in front, dropping the oldest past ``max_buffered``."""
+        with self._lock:
+            self.pending[:0] = events
+            overflow = len(self.pending) - self.max_buffered
+            if overflow > 0:
+                del self.pending[:overflow]
+                self.dropped += overflow
+                logger.warning(f"Answer log buffer full, dropped {overflow} events")
+
+    def flush(self):
+        with self._lock:
+            events, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if not events:
+            return 0
+
+        try:
+            with Database.connection() as conn, conn.cursor() as cur:
+                copy_events(cur, events)
+        except Exception:
+            self.restore(events)
+            raise
+        return len(events)
+
+    async def flush_async(self):
+        async with self._flush_lock:
+            try:
+                return await Database.run(self.flush)
+            except Exception as e:
+                logger.error(f"Answer log flush failed, will retry: {e}")
+                return 0
+
+    async def maintain(self):
+        try:
+            expired = await Database.run(maintain_partitions, self.retention_days)
+        except Exception as e:
+            logger.error(f"Answer log partition maintenance failed: {e}")
+            return
+        if expired:
+            logger.info(f"Dropped expired answer log partitions: {', '.join(expired)}")
+
+    async def maintain_job(self, context):
+        await self.maintain()
+
+    def due(self):
+        return (
+            len(self.pending) >= self.max_pending
+            or (self.pending and time.monotonic() - self.last_flush >= self.flush_interval)
+        )
+
+    async def run(self, tick=1.0):
+        while True:
+            await asyncio.sleep(tick)
+            if self.due():
+                await self.flush_async()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
@@ -1,13 +1,42 @@
 import os
-import random
+import time
 import uuid
-from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from database import Database
+from battle_store import CHALLENGE_TTL, BATTLE_TTL
+from models import Battle
+from matchmaking import Matchmaker, rating_from_stats
+from messaging import send_many
+import metrics
+
+# Pause between feedback and the next battle question
+NEXT_QUESTION_DELAY = 2
+# A question is closed for both players after this many seconds
+QUESTION_TIMEOUT = 30
 
 class BattleMode:
-    def __init__(self):
-        self.active_battles = {}
+    def __init__(self, question_bank, difficulty, battle_store, match_queue, achievements):
+        self.question_bank = question_bank
+        self.difficulty = difficulty
+        self.store = battle_store
+        self.achievements = achievements
+        self.matchmaker = Matchmaker(
+            match_queue,
+            on_match=self.start_random_battle,
+            on_timeout=self.matchmaking_timeout,
+            max_wait=int(os.getenv('MATCHMAKING_TIMEOUT', 60))
+        )
+        self.bot = None
+        self.job_queue = None
+
+    def start(self, application):
+        # Matches are made off the callback path, so keep a bot and job queue for them
+        self.bot = application.bot
+        self.job_queue = application.job_queue
+        self.matchmaker.start()
+
+    async def stop(self):
+        await self.matchmaker.stop()
 
     async def challenge_menu(self, update, context):
         keyboard = [
@@ -22,10 +51,11 @@ class BattleMode:
 
     async def handle_battle_callback(self, update, context):
         query = update.callback_query
-        await query.answer()
-        
         data = query.data.split('_')
         action = data[1]
+        # Accepts and answers reply to the tap themselves, with a toast when rejected
+        if action not in ('accept', 'answer'):
+            await query.answer()
         
         if action == 'random':
             await self.find_random_opponent(update, context)
@@ -35,26 +65,85 @@ class BattleMode:
             await self.accept_battle(update, context)
         elif action == 'decline':
             await self.decline_battle(update, context)
+        elif action == 'cancel':
+            await self.cancel_battle(update, context)
+        elif action == 'leave':
+            await self.leave_matchmaking(update, context)
         elif action == 'answer':
             await self.handle_battle_answer(update, context)
 
     async def find_random_opponent(self, update, context):
-        # Implementation for random matchmaking
-        pass
+        query = update.callback_query
+        user_id = query.from_user.id
+
+        if not await self.matchmaker.enqueue(user_id, await self.get_rating(user_id)):
+            await query.edit_message_text("🔎 You're already looking for an opponent.")
+            return
+
+        await query.edit_message_text(
+            "🔎 Looking for an opponent...",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Stop Searching", callback_data="battle_leave")]
+            ])
+        )
+
+    async def leave_matchmaking(self, update, context):
+        query = update.callback_query
+        if await self.matchmaker.cancel(query.from_user.id):
+            await query.edit_message_text("Stopped looking for an opponent.")
+
+    async def get_rating(self, user_id):
+        # Quiz answers rate players on the same Elo scale as the matchmaking
+        # gaps; accuracy only stands in for players who haven't been rated yet
+        rating = await self.difficulty.skill(user_id, default=None)
+        if rating is not None:
+            return rating
+        query = """
+            SELECT correct_answers, wrong_answers
+            FROM user_stats
+            WHERE user_id = %s
+        """
+        stats = await Database.execute_query_async(query, (user_id,), fetch=True)
+        return rating_from_stats(*stats[0]) if stats else rating_from_stats(0, 0)
+
+    async def start_random_battle(self, creator_id, opponent_id):
+        battle_id = str(uuid.uuid4())
+        await self.store.create(battle_id, Battle(
+            creator_id,
+            opponent_id,
+            status='active',
+            questions=[question.question_id for question in self.get_battle_questions()]
+        ), ttl=BATTLE_TTL)
+
+        for player_id in (creator_id, opponent_id):
+            await self.bot.send_message(chat_id=player_id, text="⚔️ Opponent found! Battle starting...")
+        await self.send_battle_question(self.bot, battle_id)
+
+    async def matchmaking_timeout(self, user_id):
+        await self.bot.send_message(
+            chat_id=user_id,
+            text="😕 No opponent found right now. Try again later or challenge a friend!"
+        )
 
     async def create_friend_challenge(self, update, context):
         battle_id = str(uuid.uuid4())
         creator_id = update.effective_user.id
         
-        self.active_battles[battle_id] = {
-            'creator': creator_id,
-            'opponent': None,
-            'status': 'waiting',
-            'questions': self.get_battle_questions(),
-            'scores': {creator_id: 0},
-            'current_question': 0,
-            'created_at': datetime.now()
-        }
+        # Only question IDs are stored; bodies come from the shared question bank
+        await self.store.create(battle_id, Battle(
+            creator_id,
+            questions=[question.question_id for question in self.get_battle_questions()]
+        ), ttl=CHALLENGE_TTL + 60)
+
+        # The expiry job closes the challenge and tells the creator; the
+        # slightly longer store TTL only catches jobs lost to a restart
+        context.job_queue.run_once(
+            self.challenge_expired_job,
+            CHALLENGE_TTL,
+            data=battle_id,
+            chat_id=update.effective_chat.id,
+            name=f"battle_expire_{battle_id}"
+        )
         
         share_link = f"https://t.me/{context.bot.username}?start=battle_{battle_id}"
         
@@ -63,165 +152,312 @@ class BattleMode:
             text=(
                 "⚔️ Challenge created!\n\n"
                 f"Share this link with your friend:\n{share_link}\n\n"
-                "They have 5 minutes to accept."
+                f"They have {CHALLENGE_TTL // 60} minutes to accept."
             ),
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("Cancel Challenge", callback_data=f"battle_cancel_{battle_id}")]
             ])
         )
 
+    async def challenge_expired_job(self, context):
+        battle_id = context.job.data
+        battle = await self.store.get(battle_id)
+        if battle and battle.status == 'waiting' and await self.store.delete(battle_id):
+            await context.bot.send_message(
+                chat_id=context.job.chat_id,
+                text="⌛ Your challenge expired before anyone accepted it."
+            )
+
+    async def show_challenge(self, update, context, battle_id):
+        battle = await self.store.get(battle_id)
+        if not battle or battle.status != 'waiting':
+            await update.message.reply_text("This battle has expired or been canceled.")
+            return
+
+        await update.message.reply_text(
+            "⚔️ You've been challenged to a quiz battle!",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Accept", callback_data=f"battle_accept_{battle_id}")],
+                [InlineKeyboardButton("Decline", callback_data=f"battle_decline_{battle_id}")]
+            ])
+        )
+
     async def accept_battle(self, update, context):
         query = update.callback_query
         battle_id = query.data.split('_')[2]
-        
-        if battle_id not in self.active_battles:
-            await query.edit_message_text("This battle has expired or been canceled.")
-            return
-        
-        battle = self.active_battles[battle_id]
         opponent_id = query.from_user.id
+
+        def accept(battle):
+            # Only the first eligible player to tap Accept joins
+            if battle.status != 'waiting' or opponent_id == battle.creator:
+                return False
+            if time.time() - battle.created_at > CHALLENGE_TTL:
+                return False
+            battle.opponent = opponent_id
+            battle.status = 'active'
+            battle.scores[opponent_id] = 0
+            return True
+
+        battle, accepted = await self.store.update(battle_id, accept, ttl=BATTLE_TTL)
         
-        if opponent_id == battle['creator']:
+        if battle is not None and opponent_id == battle.creator:
             await query.answer("You can't battle yourself!")
             return
-        
-        battle['opponent'] = opponent_id
-        battle['status'] = 'active'
-        battle['scores'][opponent_id] = 0
+        await query.answer()
+
+        if battle is None:
+            await query.edit_message_text("This battle has expired or been canceled.")
+            return
+
+        if not accepted:
+            await query.edit_message_text("This battle has already started or expired.")
+            return
+
+        for job in context.job_queue.get_jobs_by_name(f"battle_expire_{battle_id}"):
+            job.schedule_removal()
         
         # Notify both players
         await context.bot.send_message(
-            chat_id=battle['creator'],
+            chat_id=battle.creator,
             text=f"@{query.from_user.username} has accepted your challenge! Battle starting..."
         )
         
         await query.edit_message_text("Battle accepted! Starting now...")
         
         # Start battle
-        await self.send_battle_question(update, context, battle_id)
+        await self.send_battle_question(context.bot, battle_id)
 
-    async def send_battle_question(self, update, context, battle_id):
-        battle = self.active_battles[battle_id]
-        question = battle['questions'][battle['current_question']]
-        
-        options = [question[2], question[3], question[4], question[5]]
-        correct_index = question[6]
-        
-        # Shuffle options
-        shuffled = list(zip(options, [0, 1, 2, 3]))
-        random.shuffle(shuffled)
-        shuffled_options, original_indices = zip(*shuffled)
-        new_correct_index = original_indices.index(correct_index)
-        
-        # Store correct answer
-        battle['current_correct'] = new_correct_index
+    async def decline_battle(self, update, context):
+        query = update.callback_query
+        battle_id = query.data.split('_')[2]
+        battle = await self.store.get(battle_id)
+
+        if battle and battle.status == 'waiting' and query.from_user.id != battle.creator:
+            await self.store.delete(battle_id)
+            await context.bot.send_message(
+                chat_id=battle.creator,
+                text=f"@{query.from_user.username} declined your challenge."
+            )
+        await query.edit_message_text("Challenge declined.")
+
+    async def cancel_battle(self, update, context):
+        query = update.callback_query
+        battle_id = query.data.split('_')[2]
+        battle = await self.store.get(battle_id)
+
+        if battle and battle.status == 'waiting' and query.from_user.id == battle.creator:
+            await self.store.delete(battle_id)
+            await query.edit_message_text("Challenge canceled.")
+
+    async def send_battle_question(self, bot, battle_id):
+        # Shuffle, store the correct answer and open the question for both players
+        def open_question(battle):
+            # Questions deleted since the battle was dealt are dropped
+            while battle.current_question < len(battle.questions):
+                question = self.question_bank.get(battle.questions[battle.current_question])
+                if question is not None:
+                    shuffled_options, battle.current_correct = question.shuffle()
+                    battle.answered = []
+                    battle.opened_at = time.time()
+                    battle.delivered = {}
+                    return question, shuffled_options
+                del battle.questions[battle.current_question]
+            return None
+
+        battle, opened = await self.store.update(battle_id, open_question)
+        if battle is None:
+            return
+        if opened is None:
+            await self.end_battle(bot, battle_id)
+            return
+        question, shuffled_options = opened
+        index = battle.current_question
+        metrics.active_battles.touch(battle_id)
         
         keyboard = [
-            [InlineKeyboardButton(option, callback_data=f"battle_answer_{battle_id}_{i}")]
+            [InlineKeyboardButton(option, callback_data=f"battle_answer_{battle_id}_{index}_{i}")]
             for i, option in enumerate(shuffled_options)
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Send question to both players
-        for player_id in [battle['creator'], battle['opponent']]:
-            try:
-                await context.bot.send_message(
-                    chat_id=player_id,
-                    text=f"⚔️ Battle Question {battle['current_question'] + 1}:\n{question[1]}",
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                print(f"Failed to send to {player_id}: {e}")
+        # Send question to both players at the same time
+        text = f"⚔️ Battle Question {battle.current_question + 1}:\n{question.text}"
+        results = await send_many(bot, {
+            player_id: {'text': text, 'reply_markup': reply_markup}
+            for player_id in (battle.creator, battle.opponent)
+        })
+
+        # Each player's response time is measured from their own delivery
+        def set_delivered(battle):
+            if battle.current_question == index:
+                for player_id, result in results.items():
+                    if result['delivered_at'] is not None:
+                        battle.delivered[player_id] = result['delivered_at']
+
+        await self.store.update(battle_id, set_delivered)
+
+        # Close the question if a player never answers
+        self.job_queue.run_once(
+            self.question_timeout_job,
+            QUESTION_TIMEOUT,
+            data=(battle_id, index),
+            name=f"battle_timeout_{battle_id}"
+        )
+
+    async def question_timeout_job(self, context):
+        battle_id, index = context.job.data
+
+        def close_question(battle):
+            if battle.current_question != index:
+                return False
+            # A missed question counts as the full time limit
+            for player_id in (battle.creator, battle.opponent):
+                if player_id not in battle.answered:
+                    battle.response_times[player_id] = battle.response_times.get(player_id, 0.0) + QUESTION_TIMEOUT
+            battle.current_question += 1
+            battle.current_correct = None
+            return True
+
+        battle, advanced = await self.store.update(battle_id, close_question)
+        if advanced:
+            for player_id in (battle.creator, battle.opponent):
+                if player_id not in battle.answered:
+                    await context.bot.send_message(chat_id=player_id, text="⌛ Time's up for that question!")
+            await self.advance(context.bot, battle_id, battle)
+
+    async def advance(self, bot, battle_id, battle):
+        for job in self.job_queue.get_jobs_by_name(f"battle_timeout_{battle_id}"):
+            job.schedule_removal()
+
+        # Move to next question or end battle
+        if battle.current_question < len(battle.questions):
+            self.job_queue.run_once(self.next_question_job, NEXT_QUESTION_DELAY, data=battle_id)
+        else:
+            await self.end_battle(bot, battle_id)
+
+    async def next_question_job(self, context):
+        await self.send_battle_question(context.bot, context.job.data)
 
     async def handle_battle_answer(self, update, context):
+        # Server-side receive time, taken before anything else can delay it
+        answered_at = time.time()
         query = update.callback_query
-        await query.answer()
-        
         data = query.data.split('_')
         battle_id = data[2]
-        selected_index = int(data[3])
+        index = int(data[3])
+        selected_index = int(data[4])
         
-        if battle_id not in self.active_battles:
-            await query.edit_message_text("This battle has ended.")
-            return
-        
-        battle = self.active_battles[battle_id]
         user_id = query.from_user.id
+
+        def answer(battle):
+            # Score each player once per question and advance only when both
+            # have answered; returns None for a rejected answer
+            if user_id not in (battle.creator, battle.opponent) or user_id in battle.answered:
+                return None
+            if index != battle.current_question or battle.current_correct is None:
+                return None
+            question_id = battle.questions[battle.current_question]
+            is_correct = selected_index == battle.current_correct
+            if is_correct:
+                battle.scores[user_id] += 10
+            started = battle.delivered.get(user_id) or battle.opened_at or answered_at
+            response_time = max(0.0, answered_at - started)
+            battle.response_times[user_id] = battle.response_times.get(user_id, 0.0) + response_time
+            battle.answered.append(user_id)
+            advanced = len(battle.answered) == 2
+            if advanced:
+                battle.current_question += 1
+                battle.current_correct = None
+            return is_correct, question_id, advanced, response_time
+
+        battle, result = await self.store.update(battle_id, answer)
         
-        if user_id not in [battle['creator'], battle['opponent']]:
-            await query.answer("You're not in this battle!")
+        if battle is not None and result is None:
+            await query.answer("This question is closed.")
+            return
+        await query.answer()
+
+        if battle is None:
+            await query.edit_message_text("This battle has ended.")
             return
         
-        is_correct = selected_index == battle['current_correct']
-        
+        is_correct, question_id, advanced, response_time = result
+        metrics.answers.add()
         if is_correct:
-            battle['scores'][user_id] += 10
-            feedback = "✅ Correct!"
+            feedback = f"✅ Correct! ({response_time:.1f}s)"
         else:
-            correct_option = battle['questions'][battle['current_question']][2 + battle['current_correct']]
-            feedback = f"❌ Wrong! Correct answer was: {correct_option}"
+            question = self.question_bank.get(question_id)
+            # Scored against the stored answer, so only the reveal needs the question
+            feedback = "❌ Wrong!" + (f" Correct answer was: {question.correct_text}" if question else "")
         
         await query.edit_message_text(feedback)
-        
-        # Move to next question or end battle
-        battle['current_question'] += 1
-        if battle['current_question'] < len(battle['questions']):
-            await asyncio.sleep(2)
-            await self.send_battle_question(update, context, battle_id)
-        else:
-            await self.end_battle(update, context, battle_id)
-
-    async def end_battle(self, update, context, battle_id):
-        battle = self.active_battles[battle_id]
-        creator_score = battle['scores'][battle['creator']]
-        opponent_score = battle['scores'][battle['opponent']]
-        
-        if creator_score > opponent_score:
-            winner_id = battle['creator']
-            result = "You won! 🏆"
-        elif opponent_score > creator_score:
-            winner_id = battle['opponent']
-            result = "You lost! 😢"
+
+        if advanced:
+            await self.advance(context.bot, battle_id, battle)
+
+    async def end_battle(self, bot, battle_id):
+        battle = await self.store.get(battle_id)
+        if battle is None or not await self.store.delete(battle_id):
+            return
+        metrics.active_battles.discard(battle_id)
+        creator_score = battle.scores[battle.creator]
+        opponent_score = battle.scores[battle.opponent]
+        creator_time = battle.response_times.get(battle.creator, 0.0)
+        opponent_time = battle.response_times.get(battle.opponent, 0.0)
+        
+        # Equal scores go to the faster player
+        if (creator_score, -creator_time) > (opponent_score, -opponent_time):
+            winner_id = battle.creator
+        elif (opponent_score, -opponent_time) > (creator_score, -creator_time):
+            winner_id = battle.opponent
         else:
             winner_id = None
-            result = "It's a tie! 🤝"
         
         # Save battle results to database
-        self.save_battle_results(battle, winner_id)
+        await self.save_battle_results(battle_id, battle, winner_id)
+        unlocked = []
+        if winner_id is not None:
+            unlocked = await self.achievements.check_achievements(winner_id, 'battle_win', 1)
         
         # Prepare result messages
-        creator_msg = (
-            f"⚔️ Battle Results:\n\n"
-            f"Your score: {creator_score}\n"
-            f"Opponent score: {opponent_score}\n\n"
-            f"{result if winner_id == battle['creator'] else result.replace('You', 'Opponent')}"
-        )
-        
-        opponent_msg = (
-            f"⚔️ Battle Results:\n\n"
-            f"Your score: {opponent_score}\n"
-            f"Opponent score: {creator_score}\n\n"
-            f"{result if winner_id == battle['opponent'] else result.replace('You', 'Opponent')}"
-        )
-        
-        # Send results to both players
-        await context.bot.send_message(chat_id=battle['creator'], text=creator_msg)
-        await context.bot.send_message(chat_id=battle['opponent'], text=opponent_msg)
-        
-        # Clean up
-        del self.active_battles[battle_id]
+        messages = {}
+        for player_id, score, seconds, other_score, other_seconds in (
+            (battle.creator, creator_score, creator_time, opponent_score, opponent_time),
+            (battle.opponent, opponent_score, opponent_time, creator_score, creator_time)
+        ):
+            if winner_id is None:
+                result = "It's a tie! 🤝"
+            elif winner_id == player_id:
+                result = "You won! 🏆"
+            else:
+                result = "You lost! 😢"
+            text = (
+                f"⚔️ Battle Results:\n\n"
+                f"Your score: {score} ({seconds:.1f}s)\n"
+                f"Opponent score: {other_score} ({other_seconds:.1f}s)\n\n"
+                f"{result}"
+            )
+            if unlocked and winner_id == player_id:
+                text += "\n\n🎉 Achievement unlocked!\n" + "\n".join(unlocked)
+            messages[player_id] = {'text': text}
+        
+        # Send results to both players at the same time
+        await send_many(bot, messages)
 
     def get_battle_questions(self):
-        query = """
-            SELECT question_id, question_text, option1, option2, option3, option4, correct_option
-            FROM questions
-            WHERE is_active = TRUE
-            ORDER BY RANDOM()
-            LIMIT 5
-        """
-        return Database.execute_query(query, fetch=True)
+        return self.question_bank.sample(limit=5)
 
-    def save_battle_results(self, battle, winner_id):
-        # Save battle results to database
-        pass  # Implementation omitted for brevity
\ No newline at end of file
+    async def save_battle_results(self, battle_id, battle, winner_id):
+        creator, opponent = battle.creator, battle.opponent
+        rows = [
+            (battle_id, player_id, other_id, battle.scores[player_id],
+             battle.response_times.get(player_id, 0.0),
+             None if winner_id is None else winner_id == player_id)
+            for player_id, other_id in ((creator, opponent), (opponent, creator))
+        ]
+        await Database.execute_values_async("""
+            INSERT INTO battle_results (battle_id, user_id, opponent_id, score, response_time, won)
+            VALUES %s
+            ON CONFLICT (battle_id, user_id) DO NOTHING
+        """, rows)
\ No newline at end of file
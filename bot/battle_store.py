@@ -0,0 +1,149 @@
+import time
+from redis.exceptions import WatchError
+from models import Battle
+
+# Battles are models.Battle objects holding question ids, never bodies
+
+CHALLENGE_TTL = 5 * 60
+BATTLE_TTL = 30 * 60
+
+
+def encode_battle(battle):
+    """Flatten a battle into short Redis hash fields."""
+    fields = {
+        'c': battle.creator,
+        'o': battle.opponent or '',
+        's': battle.status,
+        'q': ','.join(map(str, battle.questions)),
+        'i': battle.current_question,
+        'k': '' if battle.current_correct is None else battle.current_correct,
+        'a': ','.join(map(str, battle.answered)),
+        't': battle.created_at,
+        'w': battle.opened_at or ''
+    }
+    for user_id, score in battle.scores.items():
+        fields[f"p{user_id}"] = score
+    for user_id, delivered_at in battle.delivered.items():
+        fields[f"d{user_id}"] = delivered_at
+    for user_id, total in battle.response_times.items():
+        fields[f"r{user_id}"] = round(total, 3)
+    return fields
+
+
+def decode_battle(fields):
+    fields = {key.decode(): value.decode() for key, value in fields.items()}
+    return Battle(
+        creator=int(fields['c']),
+        opponent=int(fields['o']) if fields['o'] else None,
+        status=fields['s'],
+        questions=[int(q) for q in fields['q'].split(',') if q],
+        current_question=int(fields['i']),
+        current_correct=int(fields['k']) if fields['k'] else None,
+        answered=[int(a) for a in fields['a'].split(',') if a],
+        created_at=float(fields['t']),
+        opened_at=float(fields['w']) if fields.get('w') else None,
+        scores={int(key[1:]): int(value) for key, value in fields.items() if key.startswith('p')},
+        delivered={int(key[1:]): float(value) for key, value in fields.items() if key.startswith('d')},
+        response_times={int(key[1:]): float(value) for key, value in fields.items() if key.startswith('r')}
+    )
+
+
+class MemoryBattleStore:
+    """Battles held in this process only. Fine for a single worker and for tests."""
+
+    def __init__(self):
+        self.battles = {}
+        self.expires = {}
+
+    def _live(self, battle_id):
+        expires = self.expires.get(battle_id)
+        if expires is not None and expires <= time.time():
+            self.battles.pop(battle_id, None)
+            self.expires.pop(battle_id, None)
+        return self.battles.get(battle_id)
+
+    async def create(self, battle_id, battle, ttl=CHALLENGE_TTL):
+        self.battles[battle_id] = battle
+        self.expires[battle_id] = time.time() + ttl
+
+    async def get(self, battle_id):
+        battle = self._live(battle_id)
+        return None if battle is None else battle.copy()
+
+    async def update(self, battle_id, mutate, ttl=None):
+        """Apply ``mutate(battle)`` atomically; returns ``(battle, result)`` or ``(None, None)``.
+
+        ``ttl`` resets the expiry only when ``mutate`` returns a truthy
+        result, so a rejected change doesn't keep the battle alive.
+        """
+        battle = self._live(battle_id)
+        if battle is None:
+            return None, None
+        result = mutate(battle)
+        if ttl and result:
+            self.expires[battle_id] = time.time() + ttl
+        return battle.copy(), result
+
+    async def delete(self, battle_id):
+        self.expires.pop(battle_id, None)
+        return self.battles.pop(battle_id, None) is not None
+
+
+class RedisBattleStore:
+    """Battles in Redis hashes so any worker can handle a battle's callbacks."""
+
+    def __init__(self, redis, prefix='battle:'):
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, battle_id):
+        return f"{self.prefix}{battle_id}"
+
+    async def create(self, battle_id, battle, ttl=CHALLENGE_TTL):
+        key = self._key(battle_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=encode_battle(battle))
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def get(self, battle_id):
+        fields = await self.redis.hgetall(self._key(battle_id))
+        return decode_battle(fields) if fields else None
+
+    async def update(self, battle_id, mutate, ttl=None):
+        """Optimistic WATCH/MULTI read-modify-write, retried on conflict.
+
+        As in the memory store, ``ttl`` only applies when ``mutate`` returns
+        a truthy result; otherwise the remaining expiry is kept.
+        """
+        key = self._key(battle_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    fields = await pipe.hgetall(key)
+                    if not fields:
+                        await pipe.reset()
+                        return None, None
+                    remaining = await pipe.pttl(key)
+                    battle = decode_battle(fields)
+                    result = mutate(battle)
+                    # Rewrite the whole hash so fields dropped by ``mutate`` go too
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.hset(key, mapping=encode_battle(battle))
+                    if ttl and result:
+                        pipe.expire(key, ttl)
+                    elif remaining > 0:
+                        pipe.pexpire(key, remaining)
+                    await pipe.execute()
+                    return battle, result
+                except WatchError:
+                    continue
+
+    async def delete(self, battle_id):
+        return bool(await self.redis.delete(self._key(battle_id)))
+
+
+def create_battle_store(redis=None):
+    return RedisBattleStore(redis) if redis else MemoryBattleStore()
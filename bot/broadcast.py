@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from database import Database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# A broadcast belongs to the worker holding its lease. The holder renews it
+# every third of this; a worker that dies lets it lapse, and another takes over
+LEASE_SECONDS = 60
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (Telegram flood control)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastEngine:
+    """Sends an admin message to every user, resumably.
+
+    Recipients are read from ``users`` in user_id order one page at a time,
+    so memory stays flat however many users there are. After each page the
+    last user_id and counters are checkpointed in ``broadcasts``.
+    Sends go through a token bucket kept under Telegram's global limit, and
+    a RetryAfter pauses the bucket for every in-flight send.
+
+    Only the worker holding a broadcast's lease sends it. Running broadcasts
+    whose lease has lapsed (their worker died, or released them on shutdown)
+    are claimed by whichever worker's claim job gets there first, and
+    resumed from the checkpoint. At worst the page in flight when the old
+    worker stopped is sent again.
+    """
+
+    def __init__(self, rate=25, concurrency=20, page_size=500, progress_interval=10, lease=LEASE_SECONDS):
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.lease = lease
+        self.owner = metrics.instance_name()
+        self.progress = {}
+        self.tasks = {}
+        self.bot = None
+
+    async def start(self, application):
+        self.bot = application.bot
+        await self.claim()
+
+    async def claim(self):
+        """Take over running broadcasts nobody holds a lease on, and resume them."""
+        rows = await Database.execute_query_async("""
+            UPDATE broadcasts
+            SET owner = %s, lease_until = NOW() + %s * INTERVAL '1 second'
+            WHERE status = 'running' AND (lease_until IS NULL OR lease_until < NOW())
+            RETURNING broadcast_id
+        """, (self.owner, self.lease), fetch=True)
+        for (broadcast_id,) in rows or []:
+            logger.info(f"Resuming broadcast {broadcast_id}")
+            self._spawn(broadcast_id)
+
+    async def claim_job(self, context):
+        try:
+            await self.claim()
+        except Exception as e:
+            logger.error(f"Broadcast claim failed: {e}")
+
+    async def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
+        # Hand unfinished broadcasts straight to the next worker rather than
+        # making it wait out the lease
+        await Database.execute_query_async("""
+            UPDATE broadcasts SET lease_until = NULL
+            WHERE owner = %s AND status = 'running'
+        """, (self.owner,))
+
+    async def create(self, text, admin_chat_id):
+        rows = await Database.execute_query_async("""
+            INSERT INTO broadcasts (message, admin_chat_id, status, total, owner, lease_until)
+            VALUES (%s, %s, 'running', (SELECT COUNT(*) FROM users), %s, NOW() + %s * INTERVAL '1 second')
+            RETURNING broadcast_id
+        """, (text, admin_chat_id, self.owner, self.lease), fetch=True)
+        broadcast_id = rows[0][0]
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    def _spawn(self, broadcast_id):
+        if broadcast_id not in self.tasks:
+            task = asyncio.get_running_loop().create_task(self.run(broadcast_id))
+            self.tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self.tasks.pop(broadcast_id, None))
+
+    async def run(self, broadcast_id):
+        rows = await Database.execute_query_async("""
+            SELECT message, admin_chat_id, COALESCE(last_user_id, 0), sent, failed, total
+            FROM broadcasts WHERE broadcast_id = %s
+        """, (broadcast_id,), fetch=True)
+        if not rows:
+            return
+        text, admin_chat_id, last_user_id, sent, failed, total = rows[0]
+        progress = self.progress[broadcast_id] = {
+            'sent': sent, 'failed': failed, 'total': total, 'status': 'running'
+        }
+        status_message = await self._send_progress(admin_chat_id, broadcast_id)
+        last_report = time.monotonic()
+        slots = asyncio.Semaphore(self.concurrency)
+        lease = asyncio.get_running_loop().create_task(self._hold_lease(broadcast_id, asyncio.current_task()))
+
+        async def deliver(user_id):
+            async with slots:
+                ok = await self.send(user_id, text)
+            progress['sent' if ok else 'failed'] += 1
+
+        try:
+            while True:
+                page = await Database.execute_query_async("""
+                    SELECT user_id FROM users
+                    WHERE user_id > %s
+                    ORDER BY user_id
+                    LIMIT %s
+                """, (last_user_id, self.page_size), fetch=True)
+                if not page:
+                    break
+
+                await asyncio.gather(*(deliver(user_id) for (user_id,) in page))
+                last_user_id = page[-1][0]
+                await self._checkpoint(broadcast_id, last_user_id, progress)
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    status_message = await self._send_progress(admin_chat_id, broadcast_id, status_message)
+                    last_report = time.monotonic()
+
+            progress['status'] = 'done'
+            await self._checkpoint(broadcast_id, last_user_id, progress)
+            await self._send_progress(admin_chat_id, broadcast_id, status_message)
+        except asyncio.CancelledError:
+            # Shutdown or a lost lease: the checkpoint stays 'running' so the
+            # next holder resumes it
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+            progress['status'] = 'failed'
+            await self._checkpoint(broadcast_id, last_user_id, progress)
+        finally:
+            lease.cancel()
+
+    async def _hold_lease(self, broadcast_id, sender):
+        """Renew the lease while ``sender`` runs; cancel it if another worker took over."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                rows = await Database.execute_query_async("""
+                    UPDATE broadcasts SET lease_until = NOW() + %s * INTERVAL '1 second'
+                    WHERE broadcast_id = %s AND owner = %s
+                    RETURNING broadcast_id
+                """, (self.lease, broadcast_id, self.owner), fetch=True)
+            except Exception as e:
+                # Keep sending; the next renewal may get through before the lease runs out
+                logger.warning(f"Couldn't renew the lease on broadcast {broadcast_id}: {e}")
+                continue
+            if not rows:
+                logger.warning(f"Broadcast {broadcast_id} was taken over by another worker")
+                sender.cancel()
+                return
+
+    async def send(self, user_id, text, attempts=5):
+        for _ in range(attempts):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Flood control during broadcast, pausing {e.retry_after}s")
+                metrics.telegram_retries.inc('broadcast')
+                self.bucket.pause(e.retry_after)
+            except Forbidden:
+                # User blocked the bot or deleted their account
+                return False
+            except TelegramError as e:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                return False
+        return False
+
+    async def _checkpoint(self, broadcast_id, last_user_id, progress):
+        await Database.execute_query_async("""
+            UPDATE broadcasts
+            SET last_user_id = %s, sent = %s, failed = %s, status = %s,
+                finished_at = CASE WHEN %s = 'running' THEN NULL ELSE NOW() END
+            WHERE broadcast_id = %s AND owner = %s
+        """, (last_user_id, progress['sent'], progress['failed'], progress['status'],
+              progress['status'], broadcast_id, self.owner))
+
+    def describe(self, broadcast_id):
+        progress = self.progress.get(broadcast_id)
+        if not progress:
+            return f"📢 Broadcast {broadcast_id}: no progress yet"
+        done = progress['sent'] + progress['failed']
+        percent = 100 * done / progress['total'] if progress['total'] else 100
+        return (
+            f"📢 Broadcast {broadcast_id} ({progress['status']}):\n"
+            f"✅ Sent: {progress['sent']}\n"
+            f"❌ Failed: {progress['failed']}\n"
+            f"📈 Progress: {done}/{progress['total']} ({percent:.0f}%)"
+        )
+
+    async def _send_progress(self, chat_id, broadcast_id, message=None):
+        try:
+            if message is None:
+                return await self.bot.send_message(chat_id=chat_id, text=self.describe(broadcast_id))
+            await message.edit_text(self.describe(broadcast_id))
+            return message
+        except TelegramError as e:
+            logger.warning(f"Could not update broadcast progress: {e}")
+            return message
@@ -0,0 +1,114 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """In-process LRU with a per-entry time to live."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            self.expirations += 1
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        return self.entries.pop(key, None) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_MISSING = object()
+
+
+class Cache:
+    """Read-through cache: an in-process tier in front of an optional Redis tier.
+
+    The local tier keeps entries for at most ``local_ttl`` seconds so other
+    workers' invalidations (which only reach Redis) are picked up quickly.
+    Values must be JSON serializable; tuples come back as lists.
+    """
+
+    def __init__(self, redis=None, max_size=10000, local_ttl=5):
+        self.redis = redis
+        self.local = TTLCache(max_size)
+        self.local_ttl = local_ttl
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key, loader, ttl=60):
+        """Return the cached value for ``key``, calling ``await loader()`` on a miss."""
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        if self.redis:
+            try:
+                raw = await self.redis.get(f"cache:{key}")
+            except Exception as e:
+                logger.warning(f"Redis cache read failed for {key}: {e}")
+                raw = None
+            if raw is not None:
+                self.redis_hits += 1
+                value = json.loads(raw)
+                self.local.set(key, value, min(ttl, self.local_ttl))
+                return value
+
+        self.misses += 1
+        value = await loader()
+        await self.set(key, value, ttl)
+        return value
+
+    async def set(self, key, value, ttl=60):
+        self.local.set(key, value, min(ttl, self.local_ttl) if self.redis else ttl)
+        if self.redis:
+            try:
+                await self.redis.set(f"cache:{key}", json.dumps(value, default=str), ex=ttl)
+            except Exception as e:
+                logger.warning(f"Redis cache write failed for {key}: {e}")
+
+    async def invalidate(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        if self.redis and keys:
+            try:
+                await self.redis.delete(*(f"cache:{key}" for key in keys))
+            except Exception as e:
+                logger.warning(f"Redis cache invalidation failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+            'evictions': self.local.evictions,
+            'expirations': self.local.expirations,
+            'size': len(self.local)
+        }
@@ -0,0 +1,141 @@
+import logging
+import re
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database import Database
+from models import Category
+
+logger = logging.getLogger(__name__)
+
+# Categories per keyboard page; more than this is hard to scan on a phone
+PAGE_SIZE = 8
+# Slugs end up in questions.category and /leaderboard arguments
+SLUG = re.compile(r'^[a-z0-9][a-z0-9-]{0,31}$')
+
+
+class CategoryCatalog:
+    """Quiz categories from the ``categories`` table, and their /quiz keyboards.
+
+    Question counts come live from the question bank, and only categories
+    with active questions are offered. Rendered keyboards are kept per
+    page and reused until the catalog or the bank's version changes, so the
+    menu is built once per change rather than once per /quiz.
+    """
+
+    def __init__(self, question_bank):
+        self.question_bank = question_bank
+        self.categories = {}
+        self.by_slug = {}
+        self.children = {None: []}
+        self.version = 0
+        self._keyboards = {}
+        self._rendered = None
+
+    def load(self):
+        rows = Database.execute_query(
+            "SELECT category_id, slug, name, parent_id, position FROM categories ORDER BY position, name",
+            fetch=True
+        ) or []
+        return self.apply(rows)
+
+    def apply(self, rows):
+        """Replace the catalog with ``(category_id, slug, name, parent_id, position)`` rows."""
+        categories = {row[0]: Category.from_row(row) for row in rows}
+        if [c.key() for c in categories.values()] == [c.key() for c in self.categories.values()]:
+            return len(categories)
+
+        children = {None: []}
+        for category in categories.values():
+            children.setdefault(category.parent_id, []).append(category.category_id)
+        self.question_bank.set_parents({
+            category.slug: categories[category.parent_id].slug if category.parent_id in categories else None
+            for category in categories.values()
+        })
+        self.categories = categories
+        self.by_slug = {category.slug: category for category in categories.values()}
+        self.children = children
+        self.version += 1
+        return len(categories)
+
+    async def reload_job(self, context):
+        # Picks up categories added through another worker's admin panel
+        try:
+            await Database.run(self.load)
+        except Exception as e:
+            logger.error(f"Category catalog reload failed: {e}")
+
+    def add(self, slug, name, parent_slug=None):
+        """Insert a category and reload; returns it, or None if the slug is taken."""
+        parent = self.by_slug.get(parent_slug) if parent_slug else None
+        with Database.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO categories (slug, name, parent_id, position)
+                SELECT %s, %s, %s, COALESCE(MAX(position), 0) + 1 FROM categories
+                ON CONFLICT (slug) DO NOTHING
+                RETURNING category_id
+            """, (slug, name, parent.category_id if parent else None))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        self.load()
+        return self.categories.get(row[0])
+
+    def get(self, category_id):
+        return self.categories.get(category_id)
+
+    def count(self, category):
+        """Active questions in the category and its subcategories."""
+        return self.question_bank.count(category.slug)
+
+    def visible_children(self, parent_id=None):
+        return [
+            self.categories[category_id] for category_id in self.children.get(parent_id, ())
+            if self.count(self.categories[category_id])
+        ]
+
+    def keyboard(self, parent_id=None, page=0, footer=()):
+        """The menu page listing ``parent_id``'s subcategories (top level for None).
+
+        ``footer`` rows go at the bottom of every page; pass the same tuple
+        each time, it's part of the cache key.
+        """
+        version = (self.version, self.question_bank.version)
+        if version != self._rendered:
+            self._keyboards.clear()
+            self._rendered = version
+        key = (parent_id, page, footer)
+        markup = self._keyboards.get(key)
+        if markup is None:
+            markup = self._keyboards[key] = self._render(parent_id, page, footer)
+        return markup
+
+    def _render(self, parent_id, page, footer):
+        visible = self.visible_children(parent_id)
+        pages = max(1, -(-len(visible) // PAGE_SIZE))
+        # A stale page number from an old message lands on the last page
+        page = min(max(page, 0), pages - 1)
+
+        keyboard = []
+        parent = self.categories.get(parent_id)
+        if parent:
+            keyboard.append([InlineKeyboardButton(
+                f"🎲 All of {parent.name} ({self.count(parent):,})",
+                callback_data=f"quiz_play_{parent.category_id}"
+            )])
+        for category in visible[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]:
+            more = " ›" if self.visible_children(category.category_id) else ""
+            keyboard.append([InlineKeyboardButton(
+                f"{category.name} ({self.count(category):,}){more}",
+                callback_data=f"quiz_category_{category.category_id}"
+            )])
+
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀️", callback_data=f"quiz_page_{parent_id or 0}_{page - 1}"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton("▶️", callback_data=f"quiz_page_{parent_id or 0}_{page + 1}"))
+        if nav:
+            keyboard.append(nav)
+        if parent:
+            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=f"quiz_page_{parent.parent_id or 0}_0")])
+        keyboard.extend(footer)
+        return InlineKeyboardMarkup(keyboard)
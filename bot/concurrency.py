@@ -0,0 +1,82 @@
+import asyncio
+import time
+from telegram.ext import BaseUpdateProcessor
+import metrics
+
+# Battle callbacks that carry a battle id as their third field
+BATTLE_ACTIONS = ('accept', 'decline', 'cancel', 'answer')
+
+
+def update_key(update):
+    """Ordering key: updates sharing a key are handled one at a time, in arrival order."""
+    query = update.callback_query
+    if query and query.data and query.data.startswith('battle_'):
+        parts = query.data.split('_')
+        if len(parts) > 2 and parts[1] in BATTLE_ACTIONS:
+            return f"battle:{parts[2]}"
+    if update.effective_user:
+        return f"user:{update.effective_user.id}"
+    if update.effective_chat:
+        return f"chat:{update.effective_chat.id}"
+    return None
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Run updates concurrently while serializing those for the same user or battle.
+
+    The per-key lock is taken before a concurrency slot, so a burst of taps
+    from one user queues behind its own lock instead of occupying every slot.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.locks = {}
+        self.depth = {}
+        self.peak_depth = 0
+        self.processed = 0
+
+    async def process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        depth = self.depth[key] = self.depth.get(key, 0) + 1
+        self.peak_depth = max(self.peak_depth, depth)
+
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self.processed += 1
+            self.depth[key] -= 1
+            if not self.depth[key]:
+                del self.depth[key]
+                del self.locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        start = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            metrics.handler_latency.record(time.perf_counter() - start)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Queue depth per key: how many updates are waiting or running for it."""
+        return {
+            'active_keys': len(self.depth),
+            'queued': sum(self.depth.values()),
+            'max_depth': max(self.depth.values(), default=0),
+            'peak_depth': self.peak_depth,
+            'processed': self.processed,
+            'limit': self.max_concurrent_updates
+        }
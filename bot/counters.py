@@ -0,0 +1,66 @@
+import logging
+from psycopg2.extras import execute_values
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Each maintained counter and the full query that recomputes it
+COUNTERS = {
+    'users': "SELECT COUNT(*) FROM users",
+    'questions': "SELECT COUNT(*) FROM questions",
+    'active_questions': "SELECT COUNT(*) FROM questions WHERE is_active",
+    'total_points': "SELECT COALESCE(SUM(total_score), 0) FROM user_stats"
+}
+
+
+def increment(cur, **deltas):
+    """Add ``deltas`` to the counters inside the caller's transaction.
+
+    Call this with the cursor that made the change being counted, so the
+    counter moves if and only if that change commits.
+    """
+    rows = [(name, delta) for name, delta in sorted(deltas.items()) if delta]
+    if rows:
+        execute_values(cur, """
+            INSERT INTO stats_counters (name, value)
+            VALUES %s
+            ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value
+        """, rows)
+
+
+def read():
+    rows = Database.execute_query("SELECT name, value FROM stats_counters", fetch=True)
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update(rows or [])
+    return counters
+
+
+def reconcile():
+    """Recompute every counter from its table and return the drift corrected."""
+    drift = {}
+    with Database.connection() as conn, conn.cursor() as cur:
+        # Writers block on their counter update until this commits, so a
+        # change is either in the recount or applied on top of it, never both
+        cur.execute("LOCK TABLE stats_counters IN EXCLUSIVE MODE")
+        cur.execute("SELECT name, value FROM stats_counters")
+        current = dict(cur.fetchall())
+        for name, query in COUNTERS.items():
+            cur.execute(query)
+            value = cur.fetchone()[0]
+            if current.get(name) != value:
+                drift[name] = value - current.get(name, 0)
+            cur.execute("""
+                INSERT INTO stats_counters (name, value) VALUES (%s, %s)
+                ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value
+            """, (name, value))
+    return drift
+
+
+async def reconcile_job(context):
+    try:
+        drift = await Database.run(reconcile)
+    except Exception as e:
+        logger.error(f"Counter reconcile failed: {e}")
+        return
+    if drift:
+        logger.warning(f"Corrected counter drift: {drift}")
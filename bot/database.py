@@ -1,25 +1,190 @@
 import os
+import re
+import time
+import asyncio
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extensions import cursor
+from psycopg2.extras import execute_values
+import metrics
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\b(?:NULL|true|false)\b|%s|%\(\w+\)s")
+# A run of row tuples, as execute_values inlines them: (?, ?), (?::date, ?)
+_SQL_ROWS = re.compile(r"\((?:[?,\s]|::\w+)+\)(?:\s*,\s*\((?:[?,\s]|::\w+)+\))*")
+_SQL_WHITESPACE = re.compile(r"\s+")
+_normalized = {}
+
+
+def normalize_sql(query):
+    """Statement shape for metrics: literals and placeholders become ``?``, whitespace collapses."""
+    normalized = _normalized.get(query)
+    if normalized is None:
+        if isinstance(query, bytes):
+            # Composed by execute_values with every row inlined; the shape is all in the head
+            text = query[:1000].decode('utf-8', 'replace')
+        else:
+            text = query
+        # Row lists would otherwise make every batch size its own series
+        normalized = _SQL_WHITESPACE.sub(' ', _SQL_ROWS.sub('...', _SQL_LITERALS.sub('?', text))).strip()[:200]
+        if isinstance(query, str) and len(_normalized) < 1000:
+            _normalized[query] = normalized
+    return normalized
+
+
+class TimedCursor(cursor):
+    """Cursor that records every statement's time under its normalized SQL."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.db_query_seconds.observe(time.perf_counter() - start, normalize_sql(query))
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.db_query_seconds.observe(time.perf_counter() - start, normalize_sql(query))
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.db_query_seconds.observe(time.perf_counter() - start, normalize_sql(sql))
+
 
 class Database:
     __connection_pool = None
+    __executor = None
+    __slots = None
+    __stats_lock = threading.Lock()
+    __stats = {
+        'checkouts': 0,
+        'in_use': 0,
+        'max_in_use': 0,
+        'wait_total': 0.0,
+        'wait_max': 0.0
+    }
 
     @classmethod
     def initialize(cls):
         # Get database URL from environment variable
         database_url = os.getenv('DATABASE_URL')
-        
+
         if not database_url:
             raise ValueError("DATABASE_URL environment variable not set")
-        
+
         # Parse the URL (Heroku provides it in postgres:// format, psycopg2 needs postgresql://)
         if database_url.startswith('postgres://'):
             database_url = database_url.replace('postgres://', 'postgresql://', 1)
-        
-        # Initialize connection pool
-        cls.__connection_pool = psycopg2.pool.SimpleConnectionPool(
+
+        maxconn = int(os.getenv('DB_POOL_SIZE', 10))
+
+        # Initialize connection pool (the threaded pool is safe to share between gunicorn threads)
+        cls.__connection_pool = psycopg2.pool.ThreadedConnectionPool(
             minconn=1,
-            maxconn=10,
-            dsn=database_url
+            maxconn=maxconn,
+            dsn=database_url,
+            cursor_factory=TimedCursor
         )
+
+        # The pool raises instead of waiting when it runs dry, so callers queue on
+        # a semaphore sized to the pool. The executor is sized the same way so
+        # async callers never hold more threads than there are connections.
+        cls.__slots = threading.BoundedSemaphore(maxconn)
+        cls.__executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix='db')
+
+    @classmethod
+    def close(cls):
+        if cls.__executor:
+            cls.__executor.shutdown(wait=True)
+            cls.__executor = None
+        if cls.__connection_pool:
+            cls.__connection_pool.closeall()
+            cls.__connection_pool = None
+
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        """Check out a pooled connection, committing on success and rolling back on error."""
+        start = time.perf_counter()
+        cls.__slots.acquire()
+        waited = time.perf_counter() - start
+
+        with cls.__stats_lock:
+            stats = cls.__stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['max_in_use'] = max(stats['max_in_use'], stats['in_use'])
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+        metrics.db_pool_wait_seconds.observe(waited)
+
+        conn = None
+        try:
+            conn = cls.__connection_pool.getconn()
+            yield conn
+            conn.commit()
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                cls.__connection_pool.putconn(conn, close=bool(conn.closed))
+            cls.__slots.release()
+            with cls.__stats_lock:
+                cls.__stats['in_use'] -= 1
+
+    @classmethod
+    def execute_query(cls, query, params=None, fetch=False):
+        with cls.connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            if fetch:
+                return cur.fetchall()
+            return cur.rowcount
+
+    @classmethod
+    def executemany(cls, query, params_seq):
+        with cls.connection() as conn, conn.cursor() as cur:
+            cur.executemany(query, params_seq)
+            return cur.rowcount
+
+    @classmethod
+    def execute_values(cls, query, rows, template=None, page_size=1000, fetch=False):
+        """Run a multi-row ``INSERT ... VALUES %s`` in pages of ``page_size`` rows."""
+        with cls.connection() as conn, conn.cursor() as cur:
+            result = execute_values(cur, query, rows, template=template, page_size=page_size, fetch=fetch)
+            return result if fetch else cur.rowcount
+
+    @classmethod
+    async def run(cls, func, *args, **kwargs):
+        """Run blocking database work on the bounded executor, off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.__executor, functools.partial(func, *args, **kwargs))
+
+    @classmethod
+    async def execute_query_async(cls, query, params=None, fetch=False):
+        return await cls.run(cls.execute_query, query, params, fetch)
+
+    @classmethod
+    async def executemany_async(cls, query, params_seq):
+        return await cls.run(cls.executemany, query, params_seq)
+
+    @classmethod
+    async def execute_values_async(cls, query, rows, template=None, page_size=1000, fetch=False):
+        return await cls.run(cls.execute_values, query, rows, template, page_size, fetch)
+
+    @classmethod
+    def pool_stats(cls):
+        with cls.__stats_lock:
+            stats = dict(cls.__stats)
+        stats['wait_avg'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from psycopg2.extras import execute_values
+from cache import TTLCache
+from database import Database
+from models import DEFAULT_RATING
+
+logger = logging.getLogger(__name__)
+
+# How far one answer moves a rating. Questions see far more answers than
+# any one player, so they move more slowly.
+PLAYER_K = 32
+QUESTION_K = 8
+SKILL_TTL = 60 * 60
+# Cached for players with no user_skill row, so they aren't looked up again
+_UNRATED = object()
+
+
+def expected_score(skill, difficulty):
+    """Chance a player rated ``skill`` answers a question rated ``difficulty`` correctly."""
+    return 1.0 / (1.0 + 10 ** ((difficulty - skill) / 400))
+
+
+class DifficultyEngine:
+    """Elo ratings for players and questions, updated in batches.
+
+    Answer outcomes are queued as they happen. Each flush scores the whole
+    batch against the ratings as they stood at the start of the batch,
+    applies the summed changes in memory (moving questions between the
+    bank's difficulty levels as needed) and writes them with one multi-row
+    statement per table. Changes are stored as deltas, so flushes from
+    different workers add up instead of overwriting each other. Saving
+    moves the questions' ``updated_at``, so every worker's bank refresh
+    picks up the combined difficulty and re-levels its decks.
+    """
+
+    def __init__(self, question_bank, max_pending=1000, flush_interval=10.0, cache_size=100000):
+        self.question_bank = question_bank
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.skills = TTLCache(cache_size)
+        self.pending = []
+        self.unsaved_skills = {}
+        self.unsaved_difficulty = {}
+        self.last_flush = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    async def skill(self, user_id, default=DEFAULT_RATING):
+        """The player's rating, or ``default`` if they have never been rated."""
+        rating = self.skills.get(user_id)
+        if rating is None:
+            rows = await Database.execute_query_async(
+                "SELECT rating FROM user_skill WHERE user_id = %s", (user_id,), fetch=True
+            )
+            rating = rows[0][0] if rows else _UNRATED
+            self.skills.set(user_id, rating, SKILL_TTL)
+        return default if rating is _UNRATED else rating
+
+    def _cached_skill(self, user_id, default=None):
+        rating = self.skills.get(user_id, default)
+        return DEFAULT_RATING if rating is _UNRATED else rating
+
+    def record(self, user_id, question_id, is_correct):
+        self.pending.append((user_id, question_id, is_correct))
+
+    def apply(self, outcomes):
+        """Score a batch of ``(user_id, question_id, is_correct)`` and update ratings in memory."""
+        skill_deltas = {}
+        difficulty_deltas = {}
+        for user_id, question_id, is_correct in outcomes:
+            question = self.question_bank.get(question_id)
+            if question is None:
+                continue
+            surprise = (1.0 if is_correct else 0.0) - expected_score(
+                self._cached_skill(user_id, DEFAULT_RATING), question.difficulty
+            )
+            delta = skill_deltas.setdefault(user_id, [0.0, 0])
+            delta[0] += PLAYER_K * surprise
+            delta[1] += 1
+            delta = difficulty_deltas.setdefault(question_id, [0.0, 0])
+            delta[0] -= QUESTION_K * surprise
+            delta[1] += 1
+
+        for user_id, (delta, answers) in skill_deltas.items():
+            # New rows are saved as DEFAULT_RATING + delta, so an unrated player is rated from here on
+            rating = self._cached_skill(user_id)
+            if rating is not None:
+                self.skills.set(user_id, rating + delta, SKILL_TTL)
+            unsaved = self.unsaved_skills.setdefault(user_id, [0.0, 0])
+            unsaved[0] += delta
+            unsaved[1] += answers
+        for question_id, (delta, answers) in difficulty_deltas.items():
+            self.question_bank.set_difficulty(question_id, self.question_bank.get(question_id).difficulty + delta)
+            unsaved = self.unsaved_difficulty.setdefault(question_id, [0.0, 0])
+            unsaved[0] += delta
+            unsaved[1] += answers
+
+    def save(self, skills, difficulty):
+        # Sorted so concurrent workers lock rows in the same order
+        with Database.connection() as conn, conn.cursor() as cur:
+            if skills:
+                # New rows start at DEFAULT_RATING + delta; existing rows just add the delta
+                execute_values(cur, f"""
+                    INSERT INTO user_skill (user_id, rating, answers)
+                    VALUES %s
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        rating = user_skill.rating + EXCLUDED.rating - {DEFAULT_RATING},
+                        answers = user_skill.answers + EXCLUDED.answers
+                """, sorted(
+                    (user_id, DEFAULT_RATING + delta, answers)
+                    for user_id, (delta, answers) in skills.items()
+                ))
+            if difficulty:
+                execute_values(cur, """
+                    UPDATE questions SET
+                        difficulty = questions.difficulty + data.delta,
+                        difficulty_answers = questions.difficulty_answers + data.answers,
+                        updated_at = NOW()
+                    FROM (VALUES %s) AS data (question_id, delta, answers)
+                    WHERE questions.question_id = data.question_id
+                """, sorted(
+                    (question_id, delta, answers)
+                    for question_id, (delta, answers) in difficulty.items()
+                ))
+
+    async def flush_async(self):
+        async with self._flush_lock:
+            outcomes, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+            self.apply(outcomes)
+            skills, self.unsaved_skills = self.unsaved_skills, {}
+            difficulty, self.unsaved_difficulty = self.unsaved_difficulty, {}
+            if not skills and not difficulty:
+                return 0
+            try:
+                await Database.run(self.save, skills, difficulty)
+            except Exception as e:
+                logger.error(f"Rating flush failed, will retry: {e}")
+                # Already applied in memory; only the write needs retrying
+                for unsaved, batch in ((self.unsaved_skills, skills), (self.unsaved_difficulty, difficulty)):
+                    for key, (delta, answers) in batch.items():
+                        current = unsaved.setdefault(key, [0.0, 0])
+                        current[0] += delta
+                        current[1] += answers
+                return 0
+            return len(outcomes)
+
+    def due(self):
+        return (
+            len(self.pending) >= self.max_pending
+            or (
+                (self.pending or self.unsaved_skills or self.unsaved_difficulty)
+                and time.monotonic() - self.last_flush >= self.flush_interval
+            )
+        )
+
+    async def run(self, tick=1.0):
+        while True:
+            await asyncio.sleep(tick)
+            if self.due():
+                await self.flush_async()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
@@ -0,0 +1,298 @@
+import logging
+import time
+import uuid
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from models import PERMUTATIONS, POSITION, Room
+from question_bank import QuestionBank
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Questions in a group quiz
+ROOM_QUESTIONS = 10
+# Answer window per question, and the pause before the next one
+ROUND_SECONDS = 20
+ROUND_PAUSE = 5
+# Telegram allows about 20 messages a minute in a group, edits included. A
+# round costs the question, at most ROUND_SECONDS / LIVE_UPDATE_INTERVAL
+# answer-count edits, the results edit and one scoreboard edit: six every
+# 25s, under 15 a minute
+LIVE_UPDATE_INTERVAL = 6
+# Points for a correct answer, plus bonuses for the fastest correct ones
+CORRECT_POINTS = 10
+SPEED_BONUS = (5, 3, 1)
+# A room whose round hasn't moved for this long lost its jobs to a restart
+STALE_AFTER = 3 * (ROUND_SECONDS + ROUND_PAUSE)
+LETTERS = 'ABCD'
+
+
+class GroupQuiz:
+    """Quiz rooms in group chats: one question message shared by every player.
+
+    Answers only go to the room store, one O(1) write each, and the toast
+    on the tapping player's screen is the only reply. Everything the group
+    sees is published by the room's jobs on a fixed schedule: a debounced
+    answer count while the round is open, then the results and scoreboard
+    once it closes. So the message rate per chat stays the same whether
+    three people play or three hundred.
+    """
+
+    def __init__(self, question_bank, catalog, room_store, answer_log):
+        self.question_bank = question_bank
+        self.catalog = catalog
+        self.store = room_store
+        self.answer_log = answer_log
+
+    async def start_room(self, update, context):
+        chat = update.effective_chat
+        user_id = update.effective_user.id
+        if chat.type not in ('group', 'supergroup'):
+            await update.message.reply_text(
+                "👥 Group quizzes run in group chats. Add me to a group and send /groupquiz there."
+            )
+            return
+
+        arg = context.args[0].lower() if context.args else ''
+        if arg == 'stop':
+            await self.stop_room(update, context)
+            return
+        if arg and arg not in self.catalog.by_slug:
+            await update.message.reply_text("Usage: /groupquiz [" + "|".join(self.catalog.by_slug) + "|stop]")
+            return
+
+        questions = self.question_bank.sample(arg or QuestionBank.ALL, ROOM_QUESTIONS)
+        if not questions:
+            await update.message.reply_text("😕 No questions available right now. Try another category!")
+            return
+
+        room = Room(arg, [question.question_id for question in questions], user_id, room_id=uuid.uuid4().hex)
+        if not await self.store.create(chat.id, room):
+            existing = await self.store.get(chat.id)
+            if existing and time.time() - existing.asked_at < STALE_AFTER:
+                await update.message.reply_text("👥 A group quiz is already running here.")
+                return
+            # Its jobs died with a worker, so nothing will ever finish it
+            await self.store.delete(chat.id)
+            if not await self.store.create(chat.id, room):
+                await update.message.reply_text("👥 A group quiz is already running here.")
+                return
+
+        metrics.active_rooms.touch(chat.id)
+        topic = f" about {self.catalog.by_slug[arg].name}" if arg else ""
+        await update.message.reply_text(
+            f"👥 Group quiz{topic}: {len(questions)} questions, {ROUND_SECONDS}s each.\n\n"
+            "Everyone can play. Your first tap counts, and the fastest correct answers "
+            f"earn bonus points. First question in {ROUND_PAUSE}s!"
+        )
+        context.job_queue.run_once(
+            self.open_round_job, ROUND_PAUSE, chat_id=chat.id, data=room.room_id, name=f"room_{chat.id}"
+        )
+
+    async def stop_room(self, update, context):
+        chat_id = update.effective_chat.id
+        room = await self.store.get(chat_id)
+        if room is None:
+            await update.message.reply_text("👥 No group quiz is running here.")
+            return
+        if room.started_by != update.effective_user.id:
+            await update.message.reply_text("👥 Only the player who started the quiz can stop it.")
+            return
+        # Only this worker's jobs can be removed. Any elsewhere see the room
+        # gone, or a new room with another room_id, and do nothing
+        for name in (f"room_{chat_id}", f"room_live_{chat_id}"):
+            for job in context.job_queue.get_jobs_by_name(name):
+                job.schedule_removal()
+        await self.store.delete(chat_id)
+        metrics.active_rooms.discard(chat_id)
+        await update.message.reply_text("👥 Group quiz stopped.")
+
+    def question_text(self, room, question):
+        return f"👥 Question {room.index + 1}/{len(room.question_ids)}\n\n{question.text}"
+
+    async def open_round_job(self, context):
+        chat_id = context.job.chat_id
+        room = await self.store.get(chat_id)
+        if room is None or room.room_id != context.job.data:
+            return
+        # Questions deleted since the room was dealt are skipped
+        while not room.finished and self.question_bank.get(room.question_id) is None:
+            logger.warning(f"Question {room.question_id} is gone; skipping it in room {chat_id}")
+            del room.question_ids[room.index]
+        if room.finished:
+            await self.finish(context.bot, chat_id)
+            return
+        question = self.question_bank.get(room.question_id)
+        options, room.order = question.deal()
+
+        # Open the round before the question is out, so no tap is early
+        room.is_open = True
+        room.asked_at = time.time()
+        await self.store.save(chat_id, room)
+
+        text = self.question_text(room, question)
+        markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{LETTERS[i]}. {option}", callback_data=f"room_answer_{room.index}_{i}")]
+            for i, option in enumerate(options)
+        ])
+        message = await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"{text}\n\n⏱ {ROUND_SECONDS}s to answer",
+            reply_markup=markup
+        )
+
+        # What the round's jobs need, kept on this worker, which runs them all
+        live = {'room_id': room.room_id, 'index': room.index, 'text': text, 'markup': markup, 'message_id': message.message_id, 'shown': 0}
+        context.job_queue.run_repeating(
+            self.live_count_job,
+            LIVE_UPDATE_INTERVAL,
+            first=LIVE_UPDATE_INTERVAL,
+            chat_id=chat_id,
+            data=live,
+            name=f"room_live_{chat_id}"
+        )
+        context.job_queue.run_once(self.close_round_job, ROUND_SECONDS, chat_id=chat_id, data=live, name=f"room_{chat_id}")
+
+    async def live_count_job(self, context):
+        live = context.job.data
+        count = await self.store.answered(context.job.chat_id, live['index'])
+        if count == live['shown']:
+            return
+        live['shown'] = count
+        try:
+            await context.bot.edit_message_text(
+                chat_id=context.job.chat_id,
+                message_id=live['message_id'],
+                text=f"{live['text']}\n\n🙋 {count} answered",
+                reply_markup=live['markup']
+            )
+        except Exception as e:
+            # Only a progress hint; the results edit still comes
+            logger.warning(f"Live answer count edit failed in {context.job.chat_id}: {e}")
+
+    async def handle_room_callback(self, update, context):
+        # Server-side receive time, taken before anything else can delay it
+        answered_ms = int(time.time() * 1000)
+        query = update.callback_query
+        data = query.data.split('_')
+        if data[1] != 'answer':
+            await query.answer()
+            return
+
+        user = query.from_user
+        chat_id = query.message.chat.id
+        result = await self.store.answer(
+            chat_id, int(data[2]), user.id, f"@{user.username}" if user.username else user.first_name,
+            int(data[3]), answered_ms
+        )
+        if result is None:
+            await query.answer("⌛ That question is closed.")
+        elif result:
+            metrics.active_rooms.touch(chat_id)
+            await query.answer("✅ Answer locked in!")
+        else:
+            await query.answer("You've already answered this one.")
+
+    async def close_round_job(self, context):
+        chat_id = context.job.chat_id
+        live = context.job.data
+        for job in context.job_queue.get_jobs_by_name(f"room_live_{chat_id}"):
+            job.schedule_removal()
+        room = await self.store.get(chat_id)
+        if room is None or room.room_id != live['room_id'] or room.index != live['index']:
+            return
+
+        answers = await self.store.close_round(chat_id, room.index)
+        question = self.question_bank.get(room.question_id)
+        if question is None:
+            # Deleted while the round was open, so there's nothing to mark it against
+            await context.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=live['message_id'],
+                text=f"{live['text']}\n\n🗑 This question was withdrawn and doesn't count."
+            )
+            await self.next_round(context, chat_id, room, scored=False)
+            return
+        correct = POSITION[room.order][question.correct]
+        asked_ms = int(room.asked_at * 1000)
+        counts = [0, 0, 0, 0]
+        right = []
+        for user_id, (selected, answered_ms, name) in answers.items():
+            counts[selected] += 1
+            response_ms = max(0, answered_ms - asked_ms)
+            if selected == correct:
+                right.append((response_ms, user_id, name))
+            self.answer_log.record(
+                user_id, question.question_id, PERMUTATIONS[room.order][selected],
+                selected == correct, response_ms, 'group'
+            )
+        metrics.answers.add(len(answers))
+
+        right.sort()
+        points = {
+            user_id: CORRECT_POINTS + (SPEED_BONUS[rank] if rank < len(SPEED_BONUS) else 0)
+            for rank, (_, user_id, _) in enumerate(right)
+        }
+        await self.store.add_scores(chat_id, points, {user_id: name for _, user_id, name in right})
+
+        await context.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=live['message_id'],
+            text=self.results_text(live['text'], room, question, counts, right, len(answers))
+        )
+
+        await self.next_round(context, chat_id, room, scored=bool(points))
+
+    async def next_round(self, context, chat_id, room, scored):
+        room.index += 1
+        if scored or room.finished:
+            await self.publish_scoreboard(context.bot, chat_id, room)
+        if room.finished:
+            await self.finish(context.bot, chat_id)
+            return
+        await self.store.save(chat_id, room)
+        context.job_queue.run_once(
+            self.open_round_job, ROUND_PAUSE, chat_id=chat_id, data=room.room_id, name=f"room_{chat_id}"
+        )
+
+    def results_text(self, text, room, question, counts, right, total):
+        options = [question.options[i] for i in PERMUTATIONS[room.order]]
+        lines = [text, ""]
+        for i, option in enumerate(options):
+            mark = "✅" if i == POSITION[room.order][question.correct] else "▫️"
+            lines.append(f"{mark} {LETTERS[i]}. {option}: {counts[i]}")
+        lines.append("")
+        lines.append(f"🎯 {len(right)} of {total} got it right")
+        if right:
+            fastest = ", ".join(f"{name} ({response_ms / 1000:.1f}s)" for response_ms, _, name in right[:len(SPEED_BONUS)])
+            lines.append(f"⚡ Fastest: {fastest}")
+        return "\n".join(lines)
+
+    async def publish_scoreboard(self, bot, chat_id, room):
+        """One scoreboard message per room, edited at most once per round."""
+        top = await self.store.top(chat_id, 10)
+        lines = [f"🏆 Scoreboard after {room.index}/{len(room.question_ids)}:", ""]
+        lines += [f"{rank}. {name}: {score} pts" for rank, (_, name, score) in enumerate(top, 1)]
+        if not top:
+            lines.append("Nobody has scored yet.")
+        text = "\n".join(lines)
+
+        if room.scoreboard_id is None:
+            message = await bot.send_message(chat_id=chat_id, text=text)
+            room.scoreboard_id = message.message_id
+            return
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=room.scoreboard_id, text=text)
+        except Exception as e:
+            logger.warning(f"Scoreboard edit failed in {chat_id}: {e}")
+
+    async def finish(self, bot, chat_id):
+        top = await self.store.top(chat_id, 3)
+        await self.store.delete(chat_id)
+        metrics.active_rooms.discard(chat_id)
+        if top:
+            medals = ("🥇", "🥈", "🥉")
+            podium = "\n".join(f"{medal} {name}: {score} pts" for medal, (_, name, score) in zip(medals, top))
+            text = f"🏁 Group quiz over!\n\n{podium}\n\nSend /groupquiz for another round."
+        else:
+            text = "🏁 Group quiz over! Nobody scored this time. Send /groupquiz to try again."
+        await bot.send_message(chat_id=chat_id, text=text)
@@ -0,0 +1,329 @@
+import random
+from datetime import datetime
+from database import Database
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class SkipList:
+    """Indexed skip list (the structure behind Redis sorted sets).
+
+    Each forward link stores how many nodes it skips, which gives O(log n)
+    insert, delete, rank-of-key and key-at-rank.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while x.forward[i] is not None and x.forward[i].key < key:
+                rank[i] += x.span[i]
+                x = x.forward[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+
+        node = _Node(key, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+
+        self.length += 1
+
+    def delete(self, key):
+        update = [None] * self.MAX_LEVEL
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and x.forward[i].key < key:
+                x = x.forward[i]
+            update[i] = x
+
+        x = x.forward[0]
+        if x is None or x.key != key:
+            return False
+
+        for i in range(self.level):
+            if update[i].forward[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].forward[i] = x.forward[i]
+            else:
+                update[i].span[i] -= 1
+
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def rank(self, key):
+        """0-based position of ``key``, or None if it isn't present."""
+        traversed = 0
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and x.forward[i].key <= key:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if x is not self.head and x.key == key:
+                return traversed - 1
+        return None
+
+    def slice(self, start, count):
+        """Up to ``count`` keys starting at 0-based position ``start``."""
+        if start < 0 or start >= self.length or count <= 0:
+            return []
+
+        target = start + 1
+        traversed = 0
+        x = self.head
+        for i in reversed(range(self.level)):
+            while x.forward[i] is not None and traversed + x.span[i] <= target:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == target:
+                break
+
+        keys = []
+        while x is not None and len(keys) < count:
+            keys.append(x.key)
+            x = x.forward[0]
+        return keys
+
+
+class MemoryBoard:
+    """One in-process board. Keys are ``(-score, member)`` so the best score sorts first."""
+
+    def __init__(self):
+        self.scores = {}
+        self.order = SkipList()
+
+    async def incr(self, member, delta):
+        old = self.scores.get(member)
+        if old is not None:
+            self.order.delete((-old, member))
+        score = (old or 0) + delta
+        self.scores[member] = score
+        self.order.insert((-score, member))
+        return score
+
+    async def load(self, entries):
+        for member, score in entries:
+            old = self.scores.get(member)
+            if old is not None:
+                self.order.delete((-old, member))
+            self.scores[member] = score
+            self.order.insert((-score, member))
+
+    async def size(self):
+        return len(self.scores)
+
+    async def range(self, start, count):
+        return [(member, -neg_score) for neg_score, member in self.order.slice(start, count)]
+
+    async def rank(self, member):
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        return self.order.rank((-score, member))
+
+
+class RedisBoard:
+    """One board stored as a Redis sorted set, shared by every worker."""
+
+    def __init__(self, redis, key, ttl=None):
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+
+    async def incr(self, member, delta):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zincrby(self.key, delta, member)
+            if self.ttl:
+                pipe.expire(self.key, self.ttl)
+            score, *_ = await pipe.execute()
+        return int(score)
+
+    async def load(self, entries):
+        entries = list(entries)
+        for i in range(0, len(entries), 1000):
+            await self.redis.zadd(self.key, {member: score for member, score in entries[i:i + 1000]})
+
+    async def size(self):
+        return await self.redis.zcard(self.key)
+
+    async def range(self, start, count):
+        if count <= 0:
+            return []
+        rows = await self.redis.zrevrange(self.key, start, start + count - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    async def rank(self, member):
+        return await self.redis.zrevrank(self.key, member)
+
+
+class Leaderboard:
+    """All-time, weekly and per-category boards, updated as points are scored.
+
+    A category's board also counts the points scored in its subcategories,
+    so a parent ranks players over everything under it. Uses Redis sorted
+    sets when a client is given, otherwise per-process skip lists rebuilt
+    from user_stats at startup.
+    """
+
+    WEEK_TTL = 14 * 24 * 3600
+
+    def __init__(self, redis=None, question_bank=None):
+        self.redis = redis
+        # For the category tree: points go to the category and its ancestors
+        self.question_bank = question_bank
+        self.boards = {}
+        self.names = {}
+
+    @staticmethod
+    def current_week():
+        return datetime.utcnow().strftime('%G-W%V')
+
+    def board_key(self, scope='all'):
+        if scope == 'all':
+            return 'all'
+        if scope == 'week':
+            return f"week:{self.current_week()}"
+        # Named for the subtree it covers; category boards from before
+        # subcategories counted are left behind and the new ones seeded
+        return f"tree:{scope}"
+
+    def category_scopes(self, category):
+        """The category and every category above it."""
+        ancestors = self.question_bank.ancestors.get(category, ()) if self.question_bank else ()
+        return (category, *ancestors)
+
+    def board(self, scope='all'):
+        key = self.board_key(scope)
+        if key not in self.boards:
+            if scope == 'week' and not self.redis:
+                # Only the current week is kept in process
+                for stale in [k for k in self.boards if k.startswith('week:')]:
+                    del self.boards[stale]
+            if self.redis:
+                ttl = self.WEEK_TTL if scope == 'week' else None
+                self.boards[key] = RedisBoard(self.redis, f"leaderboard:{key}", ttl)
+            else:
+                self.boards[key] = MemoryBoard()
+        return self.boards[key]
+
+    async def load(self):
+        """Seed the all-time and category boards from the database where they are empty."""
+        board = self.board('all')
+        if await board.size() == 0:
+            rows = await Database.execute_query_async(
+                "SELECT user_id, total_score FROM user_stats WHERE total_score > 0",
+                fetch=True
+            )
+            await board.load(rows or [])
+
+        rows = await Database.execute_query_async(
+            "SELECT user_id, category, correct_answers * 10 FROM user_category_stats WHERE correct_answers > 0",
+            fetch=True
+        )
+        # category -> user_id -> points in it and everything under it
+        by_category = {}
+        for user_id, category, score in rows or []:
+            for scope in self.category_scopes(category):
+                totals = by_category.setdefault(scope, {})
+                totals[user_id] = totals.get(user_id, 0) + score
+        for category, totals in by_category.items():
+            board = self.board(category)
+            if await board.size() == 0:
+                await board.load(totals.items())
+
+    async def record(self, user_id, points, category):
+        if not points:
+            return
+        await self.board('all').incr(user_id, points)
+        await self.board('week').incr(user_id, points)
+        for scope in self.category_scopes(category):
+            await self.board(scope).incr(user_id, points)
+
+    async def set_name(self, user_id, name):
+        if not name:
+            return
+        if self.redis:
+            await self.redis.hset('leaderboard:names', user_id, name)
+        else:
+            self.names[user_id] = name
+
+    async def get_names(self, user_ids):
+        if not user_ids:
+            return {}
+        if self.redis:
+            values = await self.redis.hmget('leaderboard:names', user_ids)
+            names = {user_id: value.decode() for user_id, value in zip(user_ids, values) if value}
+        else:
+            names = {user_id: self.names[user_id] for user_id in user_ids if user_id in self.names}
+
+        # Primary-key lookup for the handful of names we haven't seen yet
+        missing = [user_id for user_id in user_ids if user_id not in names]
+        if missing:
+            rows = await Database.execute_query_async(
+                "SELECT user_id, username FROM users WHERE user_id = ANY(%s)",
+                (missing,),
+                fetch=True
+            )
+            for user_id, username in rows or []:
+                if username:
+                    names[user_id] = username
+                    await self.set_name(user_id, username)
+        return names
+
+    async def top(self, scope='all', limit=10):
+        return await self.board(scope).range(0, limit)
+
+    async def rank(self, user_id, scope='all'):
+        """1-based rank of ``user_id``, or None if they haven't scored."""
+        rank = await self.board(scope).rank(user_id)
+        return None if rank is None else rank + 1
+
+    async def around(self, user_id, scope='all', radius=2):
+        """Entries within ``radius`` places of ``user_id`` as ``(rank, user_id, score)``."""
+        board = self.board(scope)
+        rank = await board.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - radius)
+        entries = await board.range(start, rank - start + radius + 1)
+        return [(start + i + 1, member, score) for i, (member, score) in enumerate(entries)]
@@ -1,11 +1,35 @@
+import asyncio
 import os
 import logging
+import signal
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from telegram.request import HTTPXRequest
 from database import Database
 from quiz_engine import QuizEngine
 from battle_mode import BattleMode
 from admin import AdminPanel
 from achievements import AchievementSystem
+from question_bank import QuestionBank
+from categories import CategoryCatalog
+from difficulty import DifficultyEngine
+from stats_buffer import StatsBuffer
+from answer_log import AnswerLog
+from leaderboard import Leaderboard
+from battle_store import create_battle_store
+from matchmaking import create_match_queue
+from group_quiz import GroupQuiz
+from room_store import create_room_store
+from session_store import create_session_store
+from seen import create_seen_store
+from concurrency import KeyedUpdateProcessor
+from broadcast import BroadcastEngine
+from cache import Cache
+from messaging import InstrumentedRequest
+from update_queue import UpdateConsumer, create_update_queue
+from web import WEBHOOK_PATH, create_app
+import counters
+import metrics
+from utils import get_redis, get_sync_redis
 
 # Initialize logging
 logging.basicConfig(
@@ -17,13 +41,65 @@ logger = logging.getLogger(__name__)
 class QuizBot:
     def __init__(self):
         Database.initialize()
-        self.quiz_engine = QuizEngine()
-        self.battle_mode = BattleMode()
-        self.admin_panel = AdminPanel()
+        self.question_bank = QuestionBank()
+        count = self.question_bank.load()
+        logger.info(f"Loaded {count} questions into the question bank")
+        self.catalog = CategoryCatalog(self.question_bank)
+        self.catalog.load()
+        self.difficulty = DifficultyEngine(self.question_bank)
+        self.cache = Cache(get_redis())
+        self.stats_buffer = StatsBuffer(
+            max_pending=int(os.getenv('STATS_FLUSH_SIZE', 500)),
+            flush_interval=float(os.getenv('STATS_FLUSH_INTERVAL', 5)),
+            cache=self.cache
+        )
+        self.answer_log = AnswerLog(retention_days=int(os.getenv('ANSWER_LOG_RETENTION_DAYS', 180)))
+        self.leaderboard = Leaderboard(get_redis(), self.question_bank)
         self.achievements = AchievementSystem()
+        self.quiz_engine = QuizEngine(
+            self.question_bank,
+            self.catalog,
+            self.difficulty,
+            create_seen_store(get_redis()),
+            create_session_store(get_redis()),
+            self.stats_buffer,
+            self.answer_log,
+            self.leaderboard,
+            self.achievements,
+            self.cache
+        )
+        self.battle_mode = BattleMode(
+            self.question_bank,
+            self.difficulty,
+            create_battle_store(get_redis()),
+            create_match_queue(get_redis()),
+            self.achievements
+        )
+        self.group_quiz = GroupQuiz(self.question_bank, self.catalog, create_room_store(get_redis()), self.answer_log)
+        self.broadcaster = BroadcastEngine(rate=float(os.getenv('BROADCAST_RATE', 25)))
+        self.admin_panel = AdminPanel(self.question_bank, self.catalog, self.broadcaster, self.cache)
+        self.metrics_publisher = metrics.Publisher(get_redis()) if get_redis() else None
+
+    def register_user(self, user_id, username):
+        with Database.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (user_id, username) VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+                RETURNING (xmax = 0)
+            """, (user_id, username))
+            # xmax is 0 only for a freshly inserted row
+            if cur.fetchone()[0]:
+                counters.increment(cur, users=1)
 
     async def start(self, update, context):
         user = update.effective_user
+        await Database.run(self.register_user, user.id, user.username)
+
+        # Deep link from a shared challenge: t.me/<bot>?start=battle_<id>
+        if context.args and context.args[0].startswith('battle_'):
+            await self.battle_mode.show_challenge(update, context, context.args[0][len('battle_'):])
+            return
+
         welcome_msg = (
             f"👋 Welcome {user.first_name} to QuizMaster Pro!\n\n"
             "🎮 Available Commands:\n"
@@ -34,48 +110,166 @@ class QuizBot:
         )
         await update.message.reply_text(welcome_msg)
 
+    async def post_init(self, application):
+        await self.leaderboard.load()
+        self.stats_buffer.start()
+        self.difficulty.start()
+        # Today's partition has to exist before the first flush
+        await self.answer_log.maintain()
+        self.answer_log.start()
+        self.battle_mode.start(application)
+        await self.broadcaster.start(application)
+        if self.metrics_publisher:
+            self.metrics_publisher.start()
+        application.job_queue.run_repeating(
+            counters.reconcile_job,
+            interval=int(os.getenv('COUNTERS_RECONCILE_INTERVAL', 3600)),
+            first=60,
+            name='reconcile_counters'
+        )
+        application.job_queue.run_repeating(
+            self.question_bank.refresh_job,
+            interval=int(os.getenv('QUESTION_REFRESH_INTERVAL', 30)),
+            first=30,
+            name='refresh_questions'
+        )
+        application.job_queue.run_repeating(
+            self.catalog.reload_job,
+            interval=int(os.getenv('CATALOG_REFRESH_INTERVAL', 300)),
+            first=60,
+            name='reload_categories'
+        )
+        application.job_queue.run_repeating(
+            self.answer_log.maintain_job,
+            interval=6 * 60 * 60,
+            first=6 * 60 * 60,
+            name='answer_log_partitions'
+        )
+        # Picks up broadcasts left behind by a worker that died mid-send
+        application.job_queue.run_repeating(
+            self.broadcaster.claim_job,
+            interval=self.broadcaster.lease,
+            first=self.broadcaster.lease,
+            name='claim_broadcasts'
+        )
+
+    async def post_shutdown(self, application):
+        if self.metrics_publisher:
+            await self.metrics_publisher.stop()
+        await self.broadcaster.stop()
+        await self.battle_mode.stop()
+        # Write out anything still buffered before the process exits
+        await self.stats_buffer.stop()
+        await self.difficulty.stop()
+        await self.answer_log.stop()
+
     async def error_handler(self, update, context):
+        metrics.errors.inc(type(context.error).__name__)
         logger.error(f"Update {update} caused error: {context.error}")
 
     def setup_handlers(self, application):
+        timed = metrics.instrument
+
         # Command handlers
-        application.add_handler(CommandHandler("start", self.start))
-        application.add_handler(CommandHandler("quiz", self.quiz_engine.start_quiz_menu))
-        application.add_handler(CommandHandler("battle", self.battle_mode.challenge_menu))
-        application.add_handler(CommandHandler("leaderboard", self.quiz_engine.show_leaderboard))
-        application.add_handler(CommandHandler("stats", self.quiz_engine.show_stats))
-        application.add_handler(CommandHandler("admin", self.admin_panel.admin_menu))
-
-        # Callback handlers
-        application.add_handler(CallbackQueryHandler(self.quiz_engine.handle_quiz_callback, pattern="^quiz_"))
-        application.add_handler(CallbackQueryHandler(self.battle_mode.handle_battle_callback, pattern="^battle_"))
-        application.add_handler(CallbackQueryHandler(self.admin_panel.handle_admin_callback, pattern="^admin_"))
+        application.add_handler(CommandHandler("start", timed(self.start, "start")))
+        application.add_handler(CommandHandler("quiz", timed(self.quiz_engine.start_quiz_menu, "quiz")))
+        application.add_handler(CommandHandler("battle", timed(self.battle_mode.challenge_menu, "battle")))
+        application.add_handler(CommandHandler("groupquiz", timed(self.group_quiz.start_room, "groupquiz")))
+        application.add_handler(CommandHandler("leaderboard", timed(self.quiz_engine.show_leaderboard, "leaderboard")))
+        application.add_handler(CommandHandler("stats", timed(self.quiz_engine.show_stats, "stats")))
+        application.add_handler(CommandHandler("admin", timed(self.admin_panel.admin_menu, "admin")))
+
+        # Callback handlers, timed per action (quiz_answer, battle_accept, ...)
+        application.add_handler(CallbackQueryHandler(timed(self.quiz_engine.handle_quiz_callback), pattern="^quiz_"))
+        application.add_handler(CallbackQueryHandler(timed(self.battle_mode.handle_battle_callback), pattern="^battle_"))
+        application.add_handler(CallbackQueryHandler(timed(self.group_quiz.handle_room_callback), pattern="^room_"))
+        application.add_handler(CallbackQueryHandler(timed(self.admin_panel.handle_admin_callback), pattern="^admin_"))
+
+        # Admin replies (new questions, toggles) and bulk question uploads
+        application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND, timed(self.admin_panel.handle_admin_message, "admin_message")
+        ))
+        application.add_handler(MessageHandler(filters.Document.ALL, timed(self.admin_panel.handle_upload, "admin_upload")))
 
         # Error handler
         application.add_error_handler(self.error_handler)
 
-def main():
-    bot = QuizBot()
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    application = Application.builder().token(token).build()
-    
+def build_application(bot, token, request=None, update_processor=None):
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(update_processor or KeyedUpdateProcessor(int(os.getenv('CONCURRENT_UPDATES', 64))))
+        .post_init(bot.post_init)
+        .post_shutdown(bot.post_shutdown)
+        # 256 connections is what the builder would give the default request
+        .request(InstrumentedRequest(request or HTTPXRequest(connection_pool_size=256)))
+    )
+    if request is not None:
+        # Offline runs (benchmarks/harness.py) answer Bot API calls in-process
+        builder = builder.get_updates_request(request)
+    application = builder.build()
+    # APScheduler silently drops a job that starts more than a second late, which
+    # on a busy loop would leave a quiz waiting forever for its next question
+    application.job_queue.scheduler.configure(
+        job_defaults={'misfire_grace_time': None},
+        **application.job_queue.scheduler_configuration
+    )
     bot.setup_handlers(application)
+    return application
+
+def create_web_app():
+    """WSGI app for the web process, built by gunicorn (see Procfile).
+
+    The web process only hands updates to the workers through Redis, so
+    without it there's nowhere for them to go: refuse to start rather than
+    answer Telegram and drop every update.
+    """
+    sync_redis = get_sync_redis()
+    if not sync_redis:
+        raise RuntimeError("REDIS_URL is required for the web process: it queues updates on a Redis stream")
+    return create_app(
+        create_update_queue(sync_redis=sync_redis),
+        os.getenv('WEBHOOK_SECRET'),
+        sync_redis,
+        metrics_token=os.getenv('METRICS_TOKEN')
+    )
 
-    if 'DYNO' in os.environ:  # Running on Heroku
-        webhook_url = os.getenv('WEBHOOK_URL') + '/telegram'
-        port = int(os.environ.get('PORT', 5000))
-        
-        async def post_init(app):
-            await app.bot.set_webhook(webhook_url)
-        
-        application.post_init = post_init
-        application.run_webhook(
-            listen="0.0.0.0",
-            port=port,
-            webhook_url=webhook_url
+async def run_worker(bot, application, update_queue):
+    """Handle updates the web process queued until SIGTERM, then drain and exit."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await update_queue.setup()
+    consumer = UpdateConsumer(update_queue, application)
+    async with application:
+        await bot.post_init(application)
+        # Every worker sets the same webhook, so whichever starts last is harmless
+        await application.bot.set_webhook(
+            os.getenv('WEBHOOK_URL') + WEBHOOK_PATH,
+            secret_token=os.getenv('WEBHOOK_SECRET')
         )
+        await application.start()
+        consumer.start()
+        await stopping.wait()
+        # Updates not read yet stay in the stream for the next worker
+        await consumer.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+
+def main():
+    bot = QuizBot()
+    application = build_application(bot, os.getenv('TELEGRAM_BOT_TOKEN'))
+
+    if 'DYNO' in os.environ:  # Running on Heroku: the web dyno queues updates for us
+        if not get_redis():
+            raise RuntimeError("REDIS_URL is required on Heroku: workers read updates from a Redis stream")
+        asyncio.run(run_worker(bot, application, create_update_queue(get_redis())))
     else:  # Running locally
         application.run_polling()
 
+    Database.close()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
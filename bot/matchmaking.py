@@ -0,0 +1,346 @@
+import asyncio
+import heapq
+import logging
+import time
+from bisect import bisect_left, insort
+
+logger = logging.getLogger(__name__)
+
+# Width of a rating bucket; the allowed gap reaches one more bucket every
+# BUCKET_SIZE / gap_growth seconds
+BUCKET_SIZE = 50
+
+
+def rating_from_stats(correct_answers, wrong_answers):
+    """Rough 400-1600 skill rating from answer accuracy, smoothed for new players."""
+    accuracy = (correct_answers + 1) / (correct_answers + wrong_answers + 2)
+    return int(400 + 1200 * accuracy)
+
+
+class MemoryMatchQueue:
+    """Waiters held in this process only. Fine for a single worker, tests and the simulator.
+
+    Each rating bucket is a list sorted by rating, so the nearest waiter
+    either side of a rating is a bisect away. Waiters are checked when
+    they're due, from a heap, rather than on every pass.
+    """
+
+    def __init__(self, bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        # user_id -> (rating, enqueued_at)
+        self.waiting = {}
+        # bucket -> sorted [(rating, user_id)]
+        self.buckets = {}
+        # (check_at, user_id); entries whose time no longer matches next_check are stale
+        self.due = []
+        self.next_check = {}
+
+    async def size(self):
+        return len(self.waiting)
+
+    def _schedule(self, user_id, at):
+        self.next_check[user_id] = at
+        heapq.heappush(self.due, (at, user_id))
+
+    async def add(self, user_id, rating, now):
+        """Returns False if the player is already waiting."""
+        if user_id in self.waiting:
+            return False
+        self.waiting[user_id] = (rating, now)
+        insort(self.buckets.setdefault(rating // self.bucket_size, []), (rating, user_id))
+        self._schedule(user_id, now)
+        return True
+
+    def _remove(self, user_id):
+        entry = self.waiting.pop(user_id, None)
+        if entry is None:
+            return False
+        bucket = entry[0] // self.bucket_size
+        members = self.buckets[bucket]
+        members.pop(bisect_left(members, (entry[0], user_id)))
+        if not members:
+            del self.buckets[bucket]
+        del self.next_check[user_id]
+        return True
+
+    async def remove(self, user_id):
+        return self._remove(user_id)
+
+    def _nearest(self, user_id, rating, gap):
+        home = rating // self.bucket_size
+        best = None
+        best_diff = None
+        for distance in range(int(gap // self.bucket_size) + 2):
+            for bucket in {home - distance, home + distance}:
+                members = self.buckets.get(bucket)
+                if not members:
+                    continue
+                # The nearest rating at or above, skipping the player, and the nearest below
+                i = bisect_left(members, (rating, user_id))
+                above = i + 1 if i < len(members) and members[i][1] == user_id else i
+                for j in (above, i - 1):
+                    if 0 <= j < len(members):
+                        diff = abs(members[j][0] - rating)
+                        if diff <= gap and (best is None or diff < best_diff):
+                            best, best_diff = members[j][1], diff
+            # Anything in a farther bucket is at least this far away
+            if best is not None and best_diff <= distance * self.bucket_size:
+                break
+        return best
+
+    async def pair(self, now, base_gap, gap_growth, max_wait, recheck, limit):
+        """Check up to ``limit`` due waiters. Returns ``(matches, timed_out)``."""
+        matches = []
+        timed_out = []
+        while self.due and self.due[0][0] <= now and limit > 0:
+            at, user_id = heapq.heappop(self.due)
+            if self.next_check.get(user_id) != at:
+                continue
+            limit -= 1
+            rating, enqueued_at = self.waiting[user_id]
+            waited = now - enqueued_at
+            if waited >= max_wait:
+                self._remove(user_id)
+                timed_out.append(user_id)
+                continue
+
+            partner = self._nearest(user_id, rating, base_gap + gap_growth * waited)
+            if partner is None:
+                self._schedule(user_id, min(now + recheck, enqueued_at + max_wait))
+                continue
+            partner_waited = now - self.waiting[partner][1]
+            self._remove(user_id)
+            self._remove(partner)
+            matches.append((user_id, partner, waited, partner_waited))
+        return matches, timed_out
+
+
+# Shared by the scripts: a waiter is "rating:enqueued_at" in the waiting hash
+_LUA_HELPERS = """
+local waiting, due, prefix, size = KEYS[1], KEYS[2], ARGV[1], tonumber(ARGV[2])
+
+local function entry(user)
+    local value = redis.call('HGET', waiting, user)
+    if not value then
+        return nil
+    end
+    local sep = string.find(value, ':', 1, true)
+    return tonumber(string.sub(value, 1, sep - 1)), tonumber(string.sub(value, sep + 1))
+end
+
+local function remove(user, rating)
+    redis.call('HDEL', waiting, user)
+    redis.call('ZREM', due, user)
+    redis.call('ZREM', prefix .. math.floor(rating / size), user)
+end
+"""
+
+_ADD = """
+if redis.call('HSETNX', waiting, ARGV[3], ARGV[4] .. ':' .. ARGV[5]) == 0 then
+    return 0
+end
+redis.call('ZADD', prefix .. math.floor(tonumber(ARGV[4]) / size), ARGV[4], ARGV[3])
+redis.call('ZADD', due, ARGV[5], ARGV[3])
+return 1
+"""
+
+_REMOVE = """
+local rating = entry(ARGV[3])
+if not rating then
+    return 0
+end
+remove(ARGV[3], rating)
+return 1
+"""
+
+_PAIR = """
+local now, limit = tonumber(ARGV[3]), tonumber(ARGV[4])
+local base_gap, gap_growth = tonumber(ARGV[5]), tonumber(ARGV[6])
+local max_wait, recheck = tonumber(ARGV[7]), tonumber(ARGV[8])
+
+-- ZRANGEBYSCORE ... WITHSCORES replies: the first member that isn't the player
+local function closer(best, best_diff, user, rating, reply)
+    for i = 1, #reply, 2 do
+        if reply[i] ~= user then
+            local diff = math.abs(tonumber(reply[i + 1]) - rating)
+            if not best or diff < best_diff then
+                return reply[i], diff
+            end
+            break
+        end
+    end
+    return best, best_diff
+end
+
+local function nearest(user, rating, gap)
+    local home = math.floor(rating / size)
+    local best, best_diff
+    for distance = 0, math.floor(gap / size) + 1 do
+        local buckets = {home - distance}
+        if distance > 0 then
+            buckets[2] = home + distance
+        end
+        for _, bucket in ipairs(buckets) do
+            local key = prefix .. bucket
+            -- Two each way, in case one of them is the player
+            best, best_diff = closer(best, best_diff, user, rating,
+                redis.call('ZRANGEBYSCORE', key, rating, rating + gap, 'WITHSCORES', 'LIMIT', 0, 2))
+            best, best_diff = closer(best, best_diff, user, rating,
+                redis.call('ZREVRANGEBYSCORE', key, rating, rating - gap, 'WITHSCORES', 'LIMIT', 0, 2))
+        end
+        if best and best_diff <= distance * size then
+            break
+        end
+    end
+    return best
+end
+
+local result = {}
+for _, user in ipairs(redis.call('ZRANGEBYSCORE', due, '-inf', now, 'LIMIT', 0, limit)) do
+    local rating, enqueued_at = entry(user)
+    if not rating then
+        redis.call('ZREM', due, user)
+    elseif now - enqueued_at >= max_wait then
+        remove(user, rating)
+        table.insert(result, {user, '', tostring(now - enqueued_at), ''})
+    else
+        local partner = nearest(user, rating, base_gap + gap_growth * (now - enqueued_at))
+        if partner then
+            local partner_rating, partner_enqueued_at = entry(partner)
+            remove(user, rating)
+            remove(partner, partner_rating)
+            table.insert(result, {user, partner, tostring(now - enqueued_at), tostring(now - partner_enqueued_at)})
+        else
+            redis.call('ZADD', due, math.min(now + recheck, enqueued_at + max_wait), user)
+        end
+    end
+end
+return result
+"""
+
+
+class RedisMatchQueue:
+    """Waiters in Redis, so players on different workers meet and a cancel works anywhere.
+
+    A hash holds each waiter's rating and enqueue time, a sorted set per
+    rating bucket is scored by rating, and a ``due`` sorted set says when
+    each waiter is next checked. Adding, removing and pairing are each one
+    Lua script, so a player is never handed to two workers' matches. The
+    bucket keys are built inside the scripts, which needs a single Redis
+    rather than a cluster.
+    """
+
+    def __init__(self, redis, bucket_size=BUCKET_SIZE, prefix='match:'):
+        self.redis = redis
+        self.bucket_size = bucket_size
+        self.prefix = prefix
+        self.keys = [f"{prefix}waiting", f"{prefix}due"]
+        self._add = redis.register_script(_LUA_HELPERS + _ADD)
+        self._remove = redis.register_script(_LUA_HELPERS + _REMOVE)
+        self._pair = redis.register_script(_LUA_HELPERS + _PAIR)
+
+    def _args(self, *args):
+        return [f"{self.prefix}b:", self.bucket_size, *args]
+
+    async def size(self):
+        return await self.redis.hlen(self.keys[0])
+
+    async def add(self, user_id, rating, now):
+        return bool(await self._add(keys=self.keys, args=self._args(user_id, rating, now)))
+
+    async def remove(self, user_id):
+        return bool(await self._remove(keys=self.keys, args=self._args(user_id)))
+
+    async def pair(self, now, base_gap, gap_growth, max_wait, recheck, limit):
+        reply = await self._pair(
+            keys=self.keys,
+            args=self._args(now, limit, base_gap, gap_growth, max_wait, recheck)
+        )
+        matches = []
+        timed_out = []
+        for user_id, partner, waited, partner_waited in reply:
+            if partner:
+                matches.append((int(user_id), int(partner), float(waited), float(partner_waited)))
+            else:
+                timed_out.append(int(user_id))
+        return matches, timed_out
+
+
+def create_match_queue(redis=None):
+    return RedisMatchQueue(redis) if redis else MemoryMatchQueue()
+
+
+class Matchmaker:
+    """Pairs players waiting for a random opponent.
+
+    Enqueue and cancel only touch the queue, O(log n). A background task
+    checks waiters as they fall due: a new waiter straight away, then again
+    every ``recheck`` seconds as its allowed gap widens, so a pass only
+    looks at the players due rather than the whole queue. Each check pairs
+    the waiter with the nearest rated player inside its gap. Players still
+    unmatched after ``max_wait`` seconds are dropped.
+    """
+
+    def __init__(self, queue, on_match=None, on_timeout=None, base_gap=100, gap_growth=25,
+                 max_wait=60, recheck=2.0, tick=0.5, batch=1000, clock=time.time):
+        self.queue = queue
+        self.on_match = on_match
+        self.on_timeout = on_timeout
+        self.base_gap = base_gap
+        self.gap_growth = gap_growth
+        self.max_wait = max_wait
+        self.recheck = recheck
+        self.tick = tick
+        self.batch = batch
+        # Wall time: with Redis, enqueue times are compared across workers
+        self.clock = clock
+        self._task = None
+
+    async def enqueue(self, user_id, rating):
+        """Returns False if the player is already waiting."""
+        return await self.queue.add(user_id, rating, self.clock())
+
+    async def cancel(self, user_id):
+        return await self.queue.remove(user_id)
+
+    async def size(self):
+        return await self.queue.size()
+
+    async def pair(self, now=None):
+        """One matching pass. Returns ``(matches, timed_out)``."""
+        now = self.clock() if now is None else now
+        return await self.queue.pair(now, self.base_gap, self.gap_growth, self.max_wait, self.recheck, self.batch)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                matches, timed_out = await self.pair()
+            except Exception as e:
+                logger.error(f"Matchmaking pass failed: {e}")
+                continue
+            for first, second, *_ in matches:
+                if self.on_match:
+                    asyncio.create_task(self._dispatch(self.on_match, first, second))
+            for user_id in timed_out:
+                if self.on_timeout:
+                    asyncio.create_task(self._dispatch(self.on_timeout, user_id))
+
+    @staticmethod
+    async def _dispatch(callback, *args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            logger.error(f"Matchmaking callback failed for {args}: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
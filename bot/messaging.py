@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telegram.request import BaseRequest
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Latest per-recipient send latencies in seconds, for monitoring
+recent_latencies = deque(maxlen=1000)
+
+
+async def _send_one(bot, chat_id, kwargs):
+    start = time.perf_counter()
+    try:
+        message = await bot.send_message(chat_id=chat_id, **kwargs)
+        error = None
+    except Exception as e:
+        message = None
+        error = e
+        logger.warning(f"Failed to send to {chat_id}: {e}")
+    latency = time.perf_counter() - start
+    recent_latencies.append(latency)
+    return chat_id, {
+        'message': message,
+        'error': error,
+        'latency': latency,
+        'delivered_at': time.time() if error is None else None
+    }
+
+
+async def send_many(bot, messages):
+    """Send ``{chat_id: send_message kwargs}`` to every recipient at once.
+
+    A failure for one recipient doesn't affect the others. Returns
+    ``{chat_id: {'message', 'error', 'latency', 'delivered_at'}}``.
+    """
+    results = await asyncio.gather(*(
+        _send_one(bot, chat_id, kwargs) for chat_id, kwargs in messages.items()
+    ))
+    return dict(results)
+
+
+class InstrumentedRequest(BaseRequest):
+    """Wraps the Bot API request layer to count and time every call by method and status."""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        endpoint = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            status, payload = await self.request.do_request(url, method, request_data, **timeouts)
+            return status, payload
+        finally:
+            metrics.telegram_request_seconds.observe(time.perf_counter() - start, endpoint)
+            metrics.telegram_requests.inc(endpoint, str(status))
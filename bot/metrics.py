@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class RateCounter:
+    """Events over a sliding window, kept as one bucket per second."""
+
+    def __init__(self, window=60):
+        self.window = window
+        self.buckets = deque()
+
+    def _trim(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+
+    def add(self, count=1):
+        now = int(time.monotonic())
+        if self.buckets and self.buckets[-1][0] == now:
+            self.buckets[-1][1] += count
+        else:
+            self.buckets.append([now, count])
+        self._trim(now)
+
+    def total(self):
+        self._trim(int(time.monotonic()))
+        return sum(count for _, count in self.buckets)
+
+
+class ActivityTracker:
+    """Things (quizzes, battles) seen within the last ``window`` seconds.
+
+    Entries are kept in last-seen order, so expiring old ones only ever
+    looks at the front.
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.last_seen = OrderedDict()
+
+    def touch(self, key):
+        self.last_seen[key] = time.monotonic()
+        self.last_seen.move_to_end(key)
+
+    def discard(self, key):
+        self.last_seen.pop(key, None)
+
+    def count(self):
+        cutoff = time.monotonic() - self.window
+        while self.last_seen:
+            key, seen = next(iter(self.last_seen.items()))
+            if seen > cutoff:
+                break
+            del self.last_seen[key]
+        return len(self.last_seen)
+
+
+class LatencyTracker:
+    """The most recent ``size`` durations, for percentiles."""
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+# Process-wide operational metrics for the admin panel
+answers = RateCounter(60)
+active_quizzes = ActivityTracker(300)
+active_battles = ActivityTracker(300)
+active_rooms = ActivityTracker(300)
+handler_latency = LatencyTracker(1000)
+
+
+# Prometheus-style metrics, rendered for the web process's /metrics page.
+# Everything below is cheap enough to leave on: an observation is a bisect
+# and two increments under an uncontended lock.
+
+# Latency buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Label sets past this many per metric are folded into one "other" series
+MAX_SERIES = 500
+
+REGISTRY = []
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            if values not in self.series and len(self.series) >= MAX_SERIES:
+                values = ('other',) * len(self.labels)
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return 'counter', [[list(values), value] for values, value in self.series.items()]
+
+
+class Histogram:
+    """Per label set: a count per bucket (the last one is +Inf) and the sum."""
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, seconds, *values):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self.series.get(values)
+            if series is None:
+                if len(self.series) >= MAX_SERIES:
+                    values = ('other',) * len(self.labels)
+                series = self.series.setdefault(values, [0] * (len(self.buckets) + 1) + [0.0])
+            series[index] += 1
+            series[-1] += seconds
+
+    def time(self, *values):
+        return _Timer(self, values)
+
+    def collect(self):
+        with self._lock:
+            return 'histogram', [[list(values), list(series)] for values, series in self.series.items()]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'values', 'start')
+
+    def __init__(self, histogram, values):
+        self.histogram = histogram
+        self.values = values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.values)
+
+
+class Gauge:
+    """A value read when metrics are collected, from ``read()``."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.labels = ()
+        self.read = read
+        REGISTRY.append(self)
+
+    def collect(self):
+        return 'gauge', [[[], self.read()]]
+
+
+def snapshot():
+    """Every registered metric as JSON-friendly data, for rendering here or in another process."""
+    families = []
+    for metric in REGISTRY:
+        kind, samples = metric.collect()
+        families.append({
+            'name': metric.name, 'help': metric.help, 'type': kind, 'labels': list(metric.labels),
+            'buckets': list(getattr(metric, 'buckets', ())), 'samples': samples
+        })
+    return families
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(snapshots):
+    """Prometheus text format for ``[(instance, snapshot()), ...]``, one family at a time."""
+    families = {}
+    for instance, snapshot_ in snapshots:
+        for family in snapshot_:
+            families.setdefault(family['name'], (family, []))[1].append((instance, family))
+
+    lines = []
+    for name, (first, instances) in families.items():
+        lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['type']}")
+        for instance, family in instances:
+            names = family['labels'] + ['instance']
+            for values, data in family['samples']:
+                values = values + [instance]
+                if family['type'] != 'histogram':
+                    lines.append(f"{name}{_labels(names, values)} {data}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(family['buckets'] + ['+Inf'], data[:-1]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_labels(names, values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, values)} {data[-1]}")
+                lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+# Redis sorted set of publishing processes, scored by when they last published
+INSTANCES_KEY = 'metrics:instances'
+
+
+def instance_name():
+    return f"{os.getenv('DYNO') or socket.gethostname()}:{os.getpid()}"
+
+
+class Publisher:
+    """Pushes this process's snapshot to Redis every ``interval`` seconds.
+
+    Handlers run in the worker processes, but /metrics is served by the web
+    process, which reads back every recently published snapshot.
+    """
+
+    def __init__(self, redis, interval=15):
+        self.redis = redis
+        self.interval = interval
+        self.instance = instance_name()
+        self._task = None
+
+    async def publish(self):
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(f"metrics:{self.instance}", json.dumps(snapshot()), ex=self.interval * 4)
+            pipe.zadd(INSTANCES_KEY, {self.instance: now})
+            pipe.zremrangebyscore(INSTANCES_KEY, 0, now - self.interval * 4)
+            await pipe.execute()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.warning(f"Metrics publish failed: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def published(redis, max_age=60):
+    """``[(instance, snapshot)]`` for every process that published recently, read with a blocking client."""
+    instances = [instance.decode() for instance in redis.zrangebyscore(INSTANCES_KEY, time.time() - max_age, '+inf')]
+    if not instances:
+        return []
+    data = redis.mget([f"metrics:{instance}" for instance in instances])
+    return [(instance, json.loads(item)) for instance, item in zip(instances, data) if item]
+
+
+def instrument(callback, name=None):
+    """Wrap a handler callback to time it; callback handlers are labelled by their action."""
+    async def timed(update, context):
+        label = name
+        if label is None:
+            data = update.callback_query.data if update.callback_query else ''
+            label = '_'.join(data.split('_', 2)[:2])
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(label)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, label)
+    return timed
+
+
+handler_seconds = Histogram('quizbot_handler_seconds', "Time spent in each update handler", ('handler',))
+handler_errors = Counter('quizbot_handler_errors_total', "Handler calls that raised", ('handler',))
+errors = Counter('quizbot_errors_total', "Errors reported to the error handler, by type", ('type',))
+db_query_seconds = Histogram('quizbot_db_query_seconds', "Database statement time, by normalized SQL", ('query',))
+db_pool_wait_seconds = Histogram('quizbot_db_pool_wait_seconds', "Time waiting for a pooled connection")
+telegram_request_seconds = Histogram('quizbot_telegram_request_seconds', "Bot API call time", ('method',))
+telegram_requests = Counter('quizbot_telegram_requests_total', "Bot API calls, by HTTP status", ('method', 'status'))
+telegram_retries = Counter('quizbot_telegram_retries_total', "Bot API calls retried after flood control", ('source',))
+webhook_requests = Counter('quizbot_webhook_requests_total', "Webhook deliveries from Telegram, by response status", ('status',))
+Gauge('quizbot_active_quizzes', "Quizzes with activity in the last 5 minutes", lambda: active_quizzes.count())
+Gauge('quizbot_active_battles', "Battles with activity in the last 5 minutes", lambda: active_battles.count())
+Gauge('quizbot_active_rooms', "Group quiz rooms with activity in the last 5 minutes", lambda: active_rooms.count())
+Gauge('quizbot_answers_per_minute', "Answers in the last minute", lambda: answers.total())
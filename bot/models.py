@@ -0,0 +1,176 @@
+import random
+import time
+from array import array
+from itertools import permutations
+
+# Every ordering of four options; a shuffle is just an index into this table
+PERMUTATIONS = tuple(permutations(range(4)))
+# POSITION[p][i] is where original option i is shown under permutation p
+POSITION = tuple(tuple(perm.index(i) for i in range(4)) for perm in PERMUTATIONS)
+
+# Elo-scale rating every player and question starts from
+DEFAULT_RATING = 1000.0
+
+# Quiz modes, in their encoded order
+MODES = ('classic', 'timed', 'survival')
+
+
+class Question:
+    __slots__ = ('question_id', 'category', 'text', 'options', 'correct', 'difficulty')
+
+    def __init__(self, question_id, category, text, options, correct, difficulty=DEFAULT_RATING):
+        self.question_id = question_id
+        self.category = category
+        self.text = text
+        self.options = tuple(options)
+        self.correct = correct
+        self.difficulty = difficulty
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from ``(question_id, category, question_text, option1..option4, correct_option, ...)``."""
+        question_id, category, text, o1, o2, o3, o4, correct = row[:8]
+        return cls(question_id, category, text, (o1, o2, o3, o4), correct)
+
+    @property
+    def correct_text(self):
+        return self.options[self.correct]
+
+    def shuffle(self):
+        """Options in a random display order, and where the correct one landed."""
+        options, p = self.deal()
+        return options, POSITION[p][self.correct]
+
+    def deal(self):
+        """Options in a random display order, and the index into PERMUTATIONS that produced it."""
+        p = random.randrange(len(PERMUTATIONS))
+        order = PERMUTATIONS[p]
+        options = self.options
+        return (options[order[0]], options[order[1]], options[order[2]], options[order[3]]), p
+
+
+class Category:
+    __slots__ = ('category_id', 'slug', 'name', 'parent_id', 'position')
+
+    def __init__(self, category_id, slug, name, parent_id=None, position=0):
+        self.category_id = category_id
+        self.slug = slug
+        self.name = name
+        self.parent_id = parent_id
+        self.position = position
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from ``(category_id, slug, name, parent_id, position)``."""
+        return cls(*row[:5])
+
+    def key(self):
+        return (self.category_id, self.slug, self.name, self.parent_id, self.position)
+
+
+class QuizSession:
+    """One player's quiz: question ids and progress, never question bodies.
+
+    Classic quizzes fix their questions up front; timed and survival quizzes
+    append one question at a time. ``category`` is empty for all categories.
+    ``current_order`` is the PERMUTATIONS index the current question's
+    options were shown in, or None when no answer is expected.
+    """
+
+    __slots__ = ('category', 'mode', 'question_ids', 'index', 'score', 'streak',
+                 'highest_streak', 'current_order', 'started_at', 'asked_at')
+
+    def __init__(self, category, question_ids, mode='classic', index=0, score=0, streak=0,
+                 highest_streak=0, current_order=None, started_at=None, asked_at=None):
+        self.category = category
+        self.mode = mode
+        self.question_ids = array('I', question_ids)
+        self.index = index
+        self.score = score
+        self.streak = streak
+        self.highest_streak = highest_streak
+        self.current_order = current_order
+        self.started_at = int(time.time()) if started_at is None else started_at
+        self.asked_at = self.started_at if asked_at is None else asked_at
+
+    @property
+    def question_id(self):
+        return self.question_ids[self.index]
+
+    @property
+    def finished(self):
+        return self.index >= len(self.question_ids)
+
+
+class Battle:
+    __slots__ = ('creator', 'opponent', 'status', 'questions', 'scores',
+                 'current_question', 'current_correct', 'answered', 'created_at',
+                 'opened_at', 'delivered', 'response_times')
+
+    def __init__(self, creator, opponent=None, status='waiting', questions=(), scores=None,
+                 current_question=0, current_correct=None, answered=None, created_at=None,
+                 opened_at=None, delivered=None, response_times=None):
+        self.creator = creator
+        self.opponent = opponent
+        self.status = status
+        self.questions = list(questions)
+        self.scores = {creator: 0} if scores is None else scores
+        if opponent is not None:
+            self.scores.setdefault(opponent, 0)
+        self.current_question = current_question
+        self.current_correct = current_correct
+        self.answered = [] if answered is None else answered
+        self.created_at = time.time() if created_at is None else created_at
+        self.opened_at = opened_at
+        self.delivered = {} if delivered is None else delivered
+        self.response_times = {} if response_times is None else response_times
+
+    @property
+    def players(self):
+        return self.creator, self.opponent
+
+    def copy(self):
+        return Battle(
+            self.creator, self.opponent, self.status, self.questions, dict(self.scores),
+            self.current_question, self.current_correct, list(self.answered), self.created_at,
+            self.opened_at, dict(self.delivered), dict(self.response_times)
+        )
+
+
+class Room:
+    """A group-chat quiz: one shared question message per round.
+
+    Answers and scores aren't held here; the room store aggregates them
+    so any number of players can answer without touching the room itself.
+    ``room_id`` tells this room apart from an earlier one in the same chat,
+    whose jobs may still be scheduled on some worker.
+    """
+
+    __slots__ = ('category', 'question_ids', 'index', 'is_open', 'order', 'asked_at',
+                 'scoreboard_id', 'started_by', 'room_id')
+
+    def __init__(self, category, question_ids, started_by, index=0, is_open=False, order=0,
+                 asked_at=None, scoreboard_id=None, room_id=None):
+        self.category = category
+        self.question_ids = list(question_ids)
+        self.started_by = started_by
+        self.index = index
+        self.is_open = is_open
+        self.order = order
+        self.asked_at = time.time() if asked_at is None else asked_at
+        self.scoreboard_id = scoreboard_id
+        self.room_id = room_id
+
+    @property
+    def question_id(self):
+        return self.question_ids[self.index]
+
+    @property
+    def finished(self):
+        return self.index >= len(self.question_ids)
+
+    def copy(self):
+        return Room(
+            self.category, self.question_ids, self.started_by, self.index, self.is_open,
+            self.order, self.asked_at, self.scoreboard_id, self.room_id
+        )
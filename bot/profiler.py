@@ -0,0 +1,101 @@
+import asyncio.base_events
+import asyncio.events
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Only frames from the bot's own modules are counted. The rest of the stack
+# is the event loop, python-telegram-bot and the drivers, which would
+# otherwise fill the report without saying which handler was busy
+_BOT_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_SELF = os.path.abspath(__file__)
+# A stack is only read down to the event loop's dispatch of the current
+# callback. Below that are run_forever and the entry point (main.py:main,
+# <module>), which are on the stack for every sample, busy or idle
+_LOOP_FILES = (asyncio.events.__file__, asyncio.base_events.__file__)
+
+
+class SamplingProfiler:
+    """Statistical profiler for the event loop thread, off unless started.
+
+    A background thread looks at the loop thread's current stack every
+    ``interval`` seconds and counts the bot's functions in the callback
+    the loop is running. Unlike cProfile it works across awaits and costs
+    nothing on the handlers themselves, so it can be switched on in
+    production for a short window. A sample is busy only when bot code is
+    the innermost frame; the loop idling in select, or a library call,
+    counts towards the total but not as busy.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.busy = 0
+        self.own = Counter()
+        self.total = Counter()
+        self.started_at = None
+        self._thread = None
+        self._target = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, thread_id=None):
+        if self._running:
+            return False
+        self.samples = 0
+        self.busy = 0
+        self.own.clear()
+        self.total.clear()
+        self._target = thread_id or threading.get_ident()
+        self._running = True
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self):
+        while self._running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            leaf = True
+            while frame is not None and frame.f_code.co_filename not in _LOOP_FILES:
+                code = frame.f_code
+                if code.co_filename.startswith(_BOT_DIR) and code.co_filename != _SELF:
+                    name = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                    if leaf:
+                        self.own[name] += 1
+                        self.busy += 1
+                    # Recursion would otherwise count one function several times per sample
+                    if name not in seen:
+                        seen.add(name)
+                        self.total[name] += 1
+                leaf = False
+                frame = frame.f_back
+
+    def report(self, limit=15):
+        """Busiest functions: share of samples on the stack, and at the top of it."""
+        if not self.samples:
+            return "No samples collected."
+        lines = [
+            f"{self.samples} samples over {time.monotonic() - self.started_at:.0f}s, "
+            f"bot code running in {self.busy / self.samples:.0%}",
+            "total  self  function"
+        ]
+        for name, count in self.total.most_common(limit):
+            lines.append(f"{count / self.samples:5.0%} {self.own[name] / self.samples:5.0%}  {name}")
+        return "\n".join(lines)
@@ -0,0 +1,333 @@
+import logging
+import random
+import threading
+from database import Database
+from models import Question
+
+logger = logging.getLogger(__name__)
+
+
+class ShuffleDeck:
+    """Question ids dealt from an incrementally shuffled deck.
+
+    ``items[:cursor]`` have been dealt this round and ``items[cursor:]`` are
+    still waiting. Each deal swaps a random waiting card to the cursor, so the
+    deck is reshuffled one card at a time and never needs a full sort.
+    """
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.positions = {item: i for i, item in enumerate(self.items)}
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def add(self, item):
+        if item in self.positions:
+            return
+        self.positions[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        index = self.positions.pop(item, None)
+        if index is None:
+            return
+
+        # Keep the dealt/waiting split intact by first moving the hole to the
+        # end of the dealt region
+        if index < self.cursor:
+            self.cursor -= 1
+            if index != self.cursor:
+                self._place(self.items[self.cursor], index)
+            index = self.cursor
+
+        last = self.items.pop()
+        if index < len(self.items):
+            self._place(last, index)
+
+    def deal(self, count):
+        count = min(count, len(self.items))
+        hand = []
+        seen = set()
+        while len(hand) < count:
+            if self.cursor >= len(self.items):
+                self.cursor = 0
+            j = random.randrange(self.cursor, len(self.items))
+            item = self.items[j]
+            self._place(self.items[self.cursor], j)
+            self._place(item, self.cursor)
+            self.cursor += 1
+            if item not in seen:
+                seen.add(item)
+                hand.append(item)
+        return hand
+
+    def _place(self, item, index):
+        self.items[index] = item
+        self.positions[item] = index
+
+
+# Width of a difficulty level on the Elo scale, and how many levels either
+# side of the target a pick may widen to before giving up on difficulty
+LEVEL_WIDTH = 100
+MAX_LEVEL_DISTANCE = 10
+# Cards dealt per wanted question from one level before moving on
+DEAL_BUDGET = 8
+# A refresh rereads rows changed this long before the last change it saw.
+# updated_at is taken when a transaction starts, so a slow import can
+# commit rows stamped earlier than ones another worker already read.
+REFRESH_OVERLAP = 60
+
+_COLUMNS = """
+    question_id, category, question_text, option1, option2,
+    option3, option4, correct_option, is_active, difficulty, updated_at
+"""
+
+
+def level(rating):
+    return int(rating // LEVEL_WIDTH)
+
+
+class QuestionBank:
+    """Process-local copy of the questions table, indexed by category.
+
+    Questions are held as slotted ``Question`` objects keyed by id, so
+    sessions and battles only ever need to store ids. Only active questions
+    are placed in the decks. Besides one deck per category there is one per
+    (category, difficulty level), so picking a question near a rating deals
+    from at most a handful of decks whatever the bank's size. A question is
+    also dealt from the decks of its category's parents, so picking a parent
+    category draws from all of its subcategories.
+
+    ``version`` changes whenever the active questions or their categories
+    do, so anything derived from the counts knows when to recompute.
+
+    Every worker has its own copy, and an admin change only reaches the
+    bank of the worker that made it. ``refresh`` brings the rest up to date
+    from the rows whose ``updated_at`` moved, and ``get`` looks up an id it
+    has never seen in the database.
+    """
+
+    ALL = None
+
+    def __init__(self):
+        self.questions = {}
+        self.active = set()
+        self.decks = {self.ALL: ShuffleDeck()}
+        self.levels = {}
+        # Category -> its parent, grandparent, ...
+        self.ancestors = {}
+        self.version = 0
+        # The newest updated_at read so far
+        self.changed_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = Database.execute_query(f"SELECT {_COLUMNS} FROM questions", fetch=True) or []
+
+        questions = {}
+        active = set()
+        decks = {self.ALL: ShuffleDeck()}
+        levels = {}
+        for row in rows:
+            question = Question.from_row(row)
+            question.difficulty = row[9]
+            questions[question.question_id] = question
+            if row[8]:
+                active.add(question.question_id)
+                self._index(question, decks, levels)
+
+        with self._lock:
+            self.questions = questions
+            self.active = active
+            self.decks = decks
+            self.levels = levels
+            self.changed_at = max((row[10] for row in rows), default=self.changed_at)
+            self.version += 1
+        return len(questions)
+
+    def refresh(self):
+        """Apply questions added or changed since the last load or refresh; returns how many."""
+        if self.changed_at is None:
+            return self.load()
+        rows = Database.execute_query(f"""
+            SELECT {_COLUMNS} FROM questions
+            WHERE updated_at > %s - %s * INTERVAL '1 second'
+        """, (self.changed_at, REFRESH_OVERLAP), fetch=True) or []
+        with self._lock:
+            for row in rows:
+                self._apply(row)
+            self.changed_at = max((row[10] for row in rows), default=self.changed_at)
+        return len(rows)
+
+    async def refresh_job(self, context):
+        # Picks up questions added, toggled or imported through another worker
+        try:
+            await Database.run(self.refresh)
+        except Exception as e:
+            logger.error(f"Question bank refresh failed: {e}")
+
+    def _apply(self, row):
+        """Put one ``questions`` row in the bank, replacing what it held for that id."""
+        question = Question.from_row(row)
+        question.difficulty = row[9]
+        question_id = question.question_id
+        old = self.questions.get(question_id)
+        was_active = question_id in self.active
+        self.questions[question_id] = question
+        if (
+            old is not None and was_active == row[8] and old.category == question.category
+            and level(old.difficulty) == level(question.difficulty)
+        ):
+            # Still in the same decks, so their shuffle positions stay
+            return
+        if was_active:
+            self._unindex(old, self.decks, self.levels)
+            self.active.discard(question_id)
+        if row[8]:
+            self.active.add(question_id)
+            self._index(question, self.decks, self.levels)
+        if was_active != row[8] or (row[8] and old.category != question.category):
+            self.version += 1
+
+    def set_parents(self, parents):
+        """Nest categories: ``parents`` maps a category to its parent category."""
+        ancestors = {}
+        for category in parents:
+            chain = []
+            parent = parents.get(category)
+            # The length bound stops a cycle from looping forever
+            while parent is not None and len(chain) < len(parents):
+                chain.append(parent)
+                parent = parents.get(parent)
+            if chain:
+                ancestors[category] = tuple(chain)
+
+        with self._lock:
+            if ancestors == self.ancestors:
+                return
+            self.ancestors = ancestors
+            decks = {self.ALL: ShuffleDeck()}
+            levels = {}
+            for question_id in self.active:
+                self._index(self.questions[question_id], decks, levels)
+            self.decks = decks
+            self.levels = levels
+            self.version += 1
+
+    def _categories(self, question):
+        return (question.category, *self.ancestors.get(question.category, ()), self.ALL)
+
+    def _index(self, question, decks, levels):
+        question_level = level(question.difficulty)
+        for category in self._categories(question):
+            decks.setdefault(category, ShuffleDeck()).add(question.question_id)
+            levels.setdefault((category, question_level), ShuffleDeck()).add(question.question_id)
+
+    def _unindex(self, question, decks, levels):
+        question_level = level(question.difficulty)
+        for category in self._categories(question):
+            if category in decks:
+                decks[category].remove(question.question_id)
+            if (category, question_level) in levels:
+                levels[(category, question_level)].remove(question.question_id)
+
+    def add(self, question, is_active=True):
+        with self._lock:
+            self.questions[question.question_id] = question
+        self.set_active(question.question_id, is_active)
+
+    def set_active(self, question_id, is_active):
+        with self._lock:
+            question = self.questions.get(question_id)
+            if question is None:
+                return False
+
+            if is_active:
+                self.active.add(question_id)
+                self._index(question, self.decks, self.levels)
+            else:
+                self.active.discard(question_id)
+                self._unindex(question, self.decks, self.levels)
+            self.version += 1
+            return True
+
+    def set_difficulty(self, question_id, difficulty):
+        """Update a question's rating, moving it to another level's deck if needed."""
+        with self._lock:
+            question = self.questions.get(question_id)
+            if question is None:
+                return
+            if question_id in self.active and level(difficulty) != level(question.difficulty):
+                self._unindex(question, self.decks, self.levels)
+                question.difficulty = difficulty
+                self._index(question, self.decks, self.levels)
+            else:
+                question.difficulty = difficulty
+
+    def get(self, question_id):
+        question = self.questions.get(question_id)
+        if question is None:
+            # Added on another worker since the last refresh. Rare enough to
+            # look up inline, and a primary-key read is quick
+            rows = Database.execute_query(
+                f"SELECT {_COLUMNS} FROM questions WHERE question_id = %s", (question_id,), fetch=True
+            )
+            if rows:
+                with self._lock:
+                    self._apply(rows[0])
+                question = self.questions.get(question_id)
+        return question
+
+    def count(self, category=ALL):
+        deck = self.decks.get(category)
+        return len(deck) if deck else 0
+
+    def sample(self, category=ALL, limit=10):
+        """Return up to ``limit`` distinct random active questions."""
+        with self._lock:
+            deck = self.decks.get(category)
+            if not deck:
+                return []
+            return [self.questions[question_id] for question_id in deck.deal(limit)]
+
+    def sample_near(self, rating, category=ALL, limit=10, exclude=()):
+        """Up to ``limit`` distinct active questions rated as close to ``rating`` as possible.
+
+        Levels are tried outwards from the target (same, one harder, one
+        easier, ...), falling back to a uniform draw if the nearby levels
+        run dry. Ids in ``exclude`` are never returned.
+        """
+        target = level(rating)
+        hand = []
+        chosen = set()
+        with self._lock:
+            for distance in range(MAX_LEVEL_DISTANCE + 1):
+                for question_level in ((target,) if distance == 0 else (target + distance, target - distance)):
+                    deck = self.levels.get((category, question_level))
+                    if not deck:
+                        continue
+                    # Keep dealing past excluded cards, but never more than
+                    # a bounded number, so a mostly-seen level can't stall a pick
+                    budget = min(len(deck), limit * DEAL_BUDGET)
+                    while len(hand) < limit and budget > 0:
+                        dealt = deck.deal(min(limit - len(hand), budget))
+                        budget -= len(dealt)
+                        for question_id in dealt:
+                            if question_id not in chosen and question_id not in exclude:
+                                chosen.add(question_id)
+                                hand.append(self.questions[question_id])
+                    if len(hand) >= limit:
+                        return hand
+
+            deck = self.decks.get(category)
+            if deck:
+                for question_id in deck.deal(min(len(deck), limit + len(exclude))):
+                    if len(hand) < limit and question_id not in chosen and question_id not in exclude:
+                        chosen.add(question_id)
+                        hand.append(self.questions[question_id])
+        return hand
@@ -0,0 +1,171 @@
+import csv
+import hashlib
+import io
+import json
+import re
+from database import Database
+import counters
+
+# File columns, in order. correct_option is 1-based in files, like the
+# admin chat format, and 0-based in the database.
+FIELDS = ('category', 'question_text', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+COLUMNS = ('category', 'question_text', 'option1', 'option2', 'option3', 'option4', 'correct_option', 'text_hash')
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def text_hash(question_text):
+    """Hash of the question text with case, punctuation and spacing normalized away."""
+    normalized = _WHITESPACE.sub(' ', _PUNCTUATION.sub('', question_text.lower())).strip()
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` from a text stream in ``csv`` or ``jsonl`` format.
+
+    A line that can't be parsed comes through as a ValueError in place of
+    the row, so one bad line doesn't end the import.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # The reader hasn't counted the line it failed on
+                yield reader.line_num + 1, ValueError(f"unreadable CSV: {e}")
+                continue
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"invalid JSON: {e}")
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def validate(row):
+    """Return a database-ready tuple for ``row`` or raise ValueError."""
+    if isinstance(row, ValueError):
+        raise row
+    try:
+        # A short CSV row fills the missing columns with None
+        values = [row[field] for field in FIELDS]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"missing field {e}")
+    for field, value in zip(FIELDS, values):
+        if value is None:
+            raise ValueError(f"missing field '{field}'")
+    values = [str(value).strip() for value in values]
+    if not all(values):
+        raise ValueError("empty field")
+    if not values[6].isdigit() or not 1 <= int(values[6]) <= 4:
+        raise ValueError("correct_option must be 1-4")
+    category, question_text, *options, correct = values
+    if len(set(options)) != 4:
+        raise ValueError("options must be distinct")
+    return (category.lower(), question_text, *options, int(correct) - 1, text_hash(question_text))
+
+
+def _copy_batch(cur, batch):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY import_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.execute(f"""
+        INSERT INTO questions ({', '.join(COLUMNS)})
+        SELECT {', '.join(COLUMNS)} FROM import_staging
+        ON CONFLICT (text_hash) DO NOTHING
+        RETURNING question_id, category, question_text, option1, option2, option3, option4, correct_option
+    """)
+    return cur.fetchall()
+
+
+def import_questions(stream, fmt, batch_size=10000, on_inserted=None):
+    """Stream, validate, de-duplicate and COPY questions into the database.
+
+    Duplicates are caught twice: within the file by text hash, and against
+    the existing bank by the unique ``text_hash`` index. ``on_inserted`` is
+    called with each batch of inserted rows. Returns counters.
+    """
+    stats = {'read': 0, 'invalid': 0, 'duplicates': 0, 'inserted': 0, 'errors': []}
+    seen = set()
+    batch = []
+
+    with Database.connection() as conn, conn.cursor() as cur:
+        # Pooled connections outlive this call, so start from a clean table
+        cur.execute("DROP TABLE IF EXISTS import_staging")
+        # Only the imported columns, with no defaults, so staging a row
+        # doesn't use up a question_id
+        cur.execute(f"""
+            CREATE TEMP TABLE import_staging ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(COLUMNS)} FROM questions WITH NO DATA
+        """)
+
+        def flush():
+            # Each batch commits on its own so a bad row late in a big file
+            # doesn't roll back everything before it
+            inserted = _copy_batch(cur, batch)
+            counters.increment(cur, questions=len(inserted), active_questions=len(inserted))
+            conn.commit()
+            stats['inserted'] += len(inserted)
+            stats['duplicates'] += len(batch) - len(inserted)
+            batch.clear()
+            if on_inserted and inserted:
+                on_inserted(inserted)
+
+        for line_number, row in read_rows(stream, fmt):
+            stats['read'] += 1
+            try:
+                values = validate(row)
+            except ValueError as e:
+                stats['invalid'] += 1
+                if len(stats['errors']) < 10:
+                    stats['errors'].append(f"line {line_number}: {e}")
+                continue
+
+            if values[-1] in seen:
+                stats['duplicates'] += 1
+                continue
+            seen.add(values[-1])
+            batch.append(values)
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+        cur.execute("DROP TABLE import_staging")
+
+    return stats
+
+
+def export_questions(stream, fmt):
+    """Write every question to ``stream`` in the import format, via a server-side cursor."""
+    count = 0
+    with Database.connection() as conn, conn.cursor(name='export_questions') as cur:
+        cur.itersize = 5000
+        cur.execute(f"""
+            SELECT {', '.join(FIELDS)}
+            FROM questions
+            ORDER BY question_id
+        """)
+
+        writer = None
+        if fmt == 'csv':
+            writer = csv.writer(stream)
+            writer.writerow(FIELDS)
+        for row in cur:
+            row = (*row[:6], row[6] + 1)
+            if writer:
+                writer.writerow(row)
+            else:
+                stream.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n')
+            count += 1
+    return count
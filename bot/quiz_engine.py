@@ -1,166 +1,320 @@
 import os
-import random
-from datetime import datetime
+import time
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from database import Database
+import metrics
+from models import MODES, PERMUTATIONS, QuizSession
+from question_bank import QuestionBank
+
+# Pause between feedback and the next question
+NEXT_QUESTION_DELAY = 1.5
+# Questions in a classic quiz
+QUIZ_LENGTH = 10
+# Length of a timed quiz in seconds
+TIMED_DURATION = 60
+# Survival aims this many rating points higher for every answer in the streak
+SURVIVAL_STEP = 25
+# Under the top-level categories in /quiz; one shared tuple, so it's part of
+# the catalog's cached keyboard
+MODE_ROWS = (
+    (InlineKeyboardButton(f"⏱ Timed ({TIMED_DURATION}s)", callback_data="quiz_mode_timed"),),
+    (InlineKeyboardButton("💀 Survival", callback_data="quiz_mode_survival"),)
+)
+MENU_TEXT = "📚 Choose a quiz category or a challenge mode:"
 
 class QuizEngine:
-    def __init__(self):
-        self.categories = self.load_categories()
-
-    def load_categories(self):
-        return {
-            'general': 'General Knowledge',
-            'science': 'Science',
-            'history': 'History',
-            'movies': 'Movies',
-            'music': 'Music'
-        }
+    def __init__(self, question_bank, catalog, difficulty, seen, sessions, stats_buffer, answer_log, leaderboard, achievements, cache):
+        self.question_bank = question_bank
+        self.catalog = catalog
+        self.difficulty = difficulty
+        self.seen = seen
+        self.sessions = sessions
+        self.cache = cache
+        self.stats_buffer = stats_buffer
+        self.answer_log = answer_log
+        self.leaderboard = leaderboard
+        self.achievements = achievements
 
     async def start_quiz_menu(self, update, context):
-        keyboard = [
-            [InlineKeyboardButton(category, callback_data=f"quiz_category_{cat_id}")]
-            for cat_id, category in self.categories.items()
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            "📚 Choose a quiz category:",
-            reply_markup=reply_markup
-        )
+        await update.message.reply_text(MENU_TEXT, reply_markup=self.catalog.keyboard(footer=MODE_ROWS))
+
+    def find_category(self, value):
+        # Menus sent before the catalog existed carry slugs instead of ids
+        if value.isdigit():
+            return self.catalog.get(int(value))
+        return self.catalog.by_slug.get(value)
+
+    async def show_menu_page(self, query, parent_id, page):
+        parent = self.catalog.get(parent_id)
+        if parent is None:
+            await query.edit_message_text(MENU_TEXT, reply_markup=self.catalog.keyboard(None, page, MODE_ROWS))
+        else:
+            await query.edit_message_text(
+                f"📚 {parent.name}: choose a topic",
+                reply_markup=self.catalog.keyboard(parent_id, page)
+            )
 
     async def handle_quiz_callback(self, update, context):
         query = update.callback_query
-        await query.answer()
-        
         data = query.data.split('_')
         action = data[1]
+        # Answers reply to the tap themselves, with a toast when it's rejected
+        if action != 'answer':
+            await query.answer()
         
-        if action == 'category':
-            await self.start_quiz(update, context, data[2])
+        if action in ('category', 'play'):
+            category = self.find_category(data[2])
+            if category is None:
+                await query.edit_message_text("😕 That category is no longer available. Type /quiz to pick another.")
+            elif action == 'category' and self.catalog.visible_children(category.category_id):
+                await self.show_menu_page(query, category.category_id, 0)
+            else:
+                await self.start_quiz(update, context, category.slug)
+        elif action == 'page':
+            await self.show_menu_page(query, int(data[2]), int(data[3]))
+        elif action == 'mode' and data[2] in MODES:
+            # Challenge modes draw from every category
+            await self.start_quiz(update, context, '', data[2])
         elif action == 'answer':
             await self.check_answer(update, context)
         elif action == 'next':
-            await self.send_question(update, context)
+            await self.send_question(context, update.effective_chat.id, query.from_user.id)
 
-    async def start_quiz(self, update, context, category):
+    async def start_quiz(self, update, context, category, mode='classic'):
         query = update.callback_query
         user_id = query.from_user.id
+        await self.leaderboard.set_name(user_id, query.from_user.username)
+
+        # Classic quizzes are picked up front; the other modes pick as they go
+        skill = await self.difficulty.skill(user_id)
+        questions = await self.get_questions(user_id, category, QUIZ_LENGTH if mode == 'classic' else 1, skill)
+        if not questions:
+            await query.edit_message_text("😕 No questions available right now. Try another category!")
+            return
         
-        # Initialize quiz session
-        context.user_data['quiz'] = {
-            'category': category,
-            'score': 0,
-            'streak': 0,
-            'question_index': 0,
-            'start_time': datetime.now(),
-            'questions': self.get_questions(category, 10)
-        }
-        
-        await self.send_question(update, context)
-
-    def get_questions(self, category, limit):
-        query = """
-            SELECT question_id, question_text, option1, option2, option3, option4, correct_option
-            FROM questions
-            WHERE category = %s AND is_active = TRUE
-            ORDER BY RANDOM()
-            LIMIT %s
+        # Initialize quiz session: just ids and counters, bodies stay in the bank
+        metrics.active_quizzes.touch(user_id)
+        session = QuizSession(category, [q.question_id for q in questions], mode)
+        if mode == 'timed':
+            context.job_queue.run_once(
+                self.time_up_job,
+                TIMED_DURATION,
+                data=session.started_at,
+                chat_id=update.effective_chat.id,
+                user_id=user_id,
+                name=f"quiz_time_up_{user_id}"
+            )
+        await self.send_question(context, update.effective_chat.id, user_id, session)
+
+    async def get_questions(self, user_id, category, limit, skill, current=()):
+        """Questions rated near ``skill`` that the player hasn't seen in this category.
+
+        Once the category is used up (or the seen-set is full) it starts
+        over, still skipping the ``current`` quiz's questions.
         """
-        return Database.execute_query(query, (category, limit), fetch=True)
+        pool = category or QuestionBank.ALL
+        seen = await self.seen.get(user_id, category)
+        questions = []
+        if not seen.full and len(seen) < self.question_bank.count(pool):
+            questions = self.question_bank.sample_near(skill, pool, limit, seen)
+        if len(questions) < limit:
+            seen.reset()
+            exclude = set(current) | {question.question_id for question in questions}
+            questions += self.question_bank.sample_near(skill, pool, limit - len(questions), exclude)
+        for question in questions:
+            seen.add(question.question_id)
+        await self.seen.save(user_id, category, seen)
+        return questions
 
-    async def send_question(self, update, context):
-        quiz = context.user_data['quiz']
-        question_data = quiz['questions'][quiz['question_index']]
-        
-        options = [
-            question_data[2],  # option1
-            question_data[3],  # option2
-            question_data[4],  # option3
-            question_data[5]   # option4
-        ]
-        
-        # Shuffle options but remember correct index
-        correct_index = question_data[6]
-        shuffled = list(zip(options, [0, 1, 2, 3]))
-        random.shuffle(shuffled)
-        shuffled_options, original_indices = zip(*shuffled)
-        new_correct_index = original_indices.index(correct_index)
-        
-        # Store correct index in user data
-        context.user_data['quiz']['current_correct'] = new_correct_index
+    async def next_adaptive_question(self, user_id, quiz):
+        """Append the next timed/survival question; returns False when the bank runs dry."""
+        target = await self.difficulty.skill(user_id)
+        if quiz.mode == 'survival':
+            target += SURVIVAL_STEP * quiz.streak
+        questions = await self.get_questions(user_id, quiz.category, 1, target, current=quiz.question_ids)
+        if not questions:
+            return False
+        question_id = questions[0].question_id
+        quiz.question_ids.append(question_id)
+        # A session ended in the meantime stays ended
+        stored, _ = await self.sessions.update(user_id, lambda stored: stored.question_ids.append(question_id))
+        return stored is not None
+
+    def open_question(self, quiz):
+        """Shuffle the current question's options, remembering the order they're shown in.
+
+        Questions deleted since they were picked are dropped from the quiz;
+        returns None if that leaves nothing to ask.
+        """
+        while not quiz.finished:
+            question = self.question_bank.get(quiz.question_id)
+            if question is not None:
+                shuffled_options, quiz.current_order = question.deal()
+                quiz.asked_at = time.time()
+                return shuffled_options
+            del quiz.question_ids[quiz.index]
+        return None
+
+    async def send_question(self, context, chat_id, user_id, session=None):
+        if session:
+            quiz = session
+            shuffled_options = self.open_question(quiz)
+            await self.sessions.save(user_id, quiz)
+        else:
+            quiz, shuffled_options = await self.sessions.update(user_id, self.open_question)
+            if quiz is None:
+                return
+        if shuffled_options is None:
+            await self.end_quiz(context, chat_id, user_id, quiz)
+            return
+        question = self.question_bank.get(quiz.question_id)
         
         keyboard = [
-            [InlineKeyboardButton(option, callback_data=f"quiz_answer_{i}")]
+            [InlineKeyboardButton(option, callback_data=f"quiz_answer_{quiz.index}_{i}")]
             for i, option in enumerate(shuffled_options)
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"❓ Question {quiz['question_index'] + 1}:\n{question_data[1]}",
+            chat_id=chat_id,
+            text=f"❓ Question {quiz.index + 1}:\n{question.text}",
             reply_markup=reply_markup
         )
 
     async def check_answer(self, update, context):
         query = update.callback_query
+        user_id = query.from_user.id
+        data = query.data.split('_')
+
+        def score(quiz):
+            # Buttons carry their question's index, so a tap on an older question's
+            # keyboard, or a second tap while the next question is pending, is rejected
+            if quiz.current_order is None or len(data) < 4 or int(data[2]) != quiz.index:
+                return None
+            # The button position maps back to the option as stored
+            selected = PERMUTATIONS[quiz.current_order][int(data[3])]
+            question = self.question_bank.get(quiz.question_id)
+            if question is None:
+                # Deleted since it was asked: close it without scoring
+                quiz.current_order = None
+                quiz.index += 1
+                return None, selected, False
+            is_correct = selected == question.correct
+            if is_correct:
+                quiz.score += 10
+                quiz.streak += 1
+                quiz.highest_streak = max(quiz.highest_streak, quiz.streak)
+            else:
+                quiz.streak = 0
+            quiz.current_order = None
+            quiz.index += 1
+            return question, selected, is_correct
+
+        # Closing the question and scoring it is one atomic update, so of two
+        # taps handled at once only one gets past this
+        quiz, answer = await self.sessions.update(user_id, score)
+        if not answer:
+            await query.answer("⌛ That question is closed.")
+            return
         await query.answer()
+
+        question, selected, is_correct = answer
+        response_ms = int((time.time() - quiz.asked_at) * 1000)
+        metrics.answers.add()
+        metrics.active_quizzes.touch(user_id)
         
-        quiz = context.user_data['quiz']
-        selected_index = int(query.data.split('_')[2])
-        is_correct = selected_index == quiz['current_correct']
-        
-        if is_correct:
-            quiz['score'] += 10
-            quiz['streak'] += 1
+        withdrawn = question is None
+        if withdrawn:
+            feedback = "🗑 This question was withdrawn and doesn't count."
+        elif is_correct:
             feedback = "✅ Correct!"
+            unlocked = await self.achievements.check_achievements(user_id, 'streak', quiz.streak)
+            if unlocked:
+                feedback += "\n\n🎉 Achievement unlocked!\n" + "\n".join(unlocked)
         else:
-            quiz['streak'] = 0
-            correct_option = quiz['questions'][quiz['question_index']][2 + quiz['current_correct']]
-            feedback = f"❌ Wrong! Correct answer was: {correct_option}"
-        
+            feedback = f"❌ Wrong! Correct answer was: {question.correct_text}"
+
+        # Survival ends on the first miss, timed when the clock runs out
+        if quiz.mode == 'survival':
+            finished = (not is_correct and not withdrawn) or not await self.next_adaptive_question(user_id, quiz)
+        elif quiz.mode == 'timed':
+            finished = (
+                time.time() - quiz.started_at >= TIMED_DURATION
+                or not await self.next_adaptive_question(user_id, quiz)
+            )
+        else:
+            finished = quiz.finished
+
         # Update message with feedback
         await query.edit_message_text(feedback)
         
-        # Update database stats
-        self.update_stats(
-            query.from_user.id,
-            is_correct,
-            quiz['streak'],
-            quiz['category']
-        )
+        # Update database stats and ratings
+        if not withdrawn:
+            await self.update_stats(
+                user_id,
+                is_correct,
+                quiz.streak,
+                question.category
+            )
+            self.difficulty.record(user_id, question.question_id, is_correct)
+            self.answer_log.record(user_id, question.question_id, selected, is_correct, response_ms, quiz.mode)
         
         # Move to next question or end quiz
-        quiz['question_index'] += 1
-        if quiz['question_index'] < len(quiz['questions']):
-            await asyncio.sleep(1.5)
-            await self.send_question(update, context)
+        if not finished:
+            # Scheduled rather than slept so this handler returns straight away
+            context.job_queue.run_once(
+                self.next_question_job,
+                NEXT_QUESTION_DELAY,
+                chat_id=update.effective_chat.id,
+                user_id=user_id,
+                name=f"quiz_next_{user_id}"
+            )
         else:
-            await self.end_quiz(update, context)
+            await self.end_quiz(context, update.effective_chat.id, user_id, quiz)
 
-    def update_stats(self, user_id, is_correct, streak, category):
-        # Update user stats in database
-        pass  # Implementation omitted for brevity
+    async def next_question_job(self, context):
+        await self.send_question(context, context.job.chat_id, context.job.user_id)
 
-    async def end_quiz(self, update, context):
-        quiz = context.user_data['quiz']
-        user_id = update.effective_user.id
+    async def time_up_job(self, context):
+        quiz = await self.sessions.get(context.job.user_id)
+        # Only end the timed quiz this job was scheduled for
+        if quiz and quiz.mode == 'timed' and quiz.started_at == context.job.data:
+            await self.end_quiz(context, context.job.chat_id, context.job.user_id, quiz)
+
+    async def update_stats(self, user_id, is_correct, streak, category):
+        # Buffered; written to user_stats in bulk by StatsBuffer
+        points = 10 if is_correct else 0
+        self.stats_buffer.record_answer(user_id, is_correct, streak, category, points)
+        await self.leaderboard.record(user_id, points, category)
+
+    def save_quiz_results(self, user_id, quiz):
+        self.stats_buffer.record_quiz(user_id)
+
+    async def end_quiz(self, context, chat_id, user_id, quiz):
+        # Clear quiz data first so a late tap or timer can't end it twice
+        if not await self.sessions.delete(user_id):
+            return
+        metrics.active_quizzes.discard(user_id)
+        for job in context.job_queue.get_jobs_by_name(f"quiz_time_up_{user_id}"):
+            job.schedule_removal()
         
         # Calculate time taken
-        time_taken = (datetime.now() - quiz['start_time']).seconds
+        time_taken = int(time.time()) - quiz.started_at
         
         # Save quiz results
         self.save_quiz_results(user_id, quiz)
         
         # Check achievements
-        new_achievements = self.check_achievements(user_id)
+        new_achievements = await self.achievements.check_achievements(user_id, 'quiz_complete', 1)
         
         # Prepare result message
+        title = {'timed': "⏱ Time's up!", 'survival': "💀 Survival over!"}.get(quiz.mode, "🏁 Quiz Complete!")
         message = (
-            f"🏁 Quiz Complete!\n\n"
-            f"📊 Your score: {quiz['score']} points\n"
+            f"{title}\n\n"
+            f"📊 Your score: {quiz.score} points\n"
             f"⏱ Time taken: {time_taken} seconds\n"
-            f"🔥 Highest streak: {max(quiz.get('highest_streak', 0), quiz['streak'])}\n\n"
+            f"🔥 Highest streak: {quiz.highest_streak}\n\n"
         )
         
         if new_achievements:
@@ -169,46 +323,75 @@ class QuizEngine:
         message += "Type /quiz to play again!"
         
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
+            chat_id=chat_id,
             text=message
         )
-        
-        # Clear quiz data
-        del context.user_data['quiz']
 
     async def show_leaderboard(self, update, context):
-        query = """
-            SELECT u.user_id, u.username, us.total_score
-            FROM user_stats us
-            JOIN users u ON us.user_id = u.user_id
-            ORDER BY us.total_score DESC
-            LIMIT 10
-        """
-        top_players = Database.execute_query(query, fetch=True)
-        
-        leaderboard = "🏆 Top Players:\n\n"
-        for i, (user_id, username, score) in enumerate(top_players, 1):
-            leaderboard += f"{i}. @{username if username else user_id}: {score} pts\n"
+        user_id = update.effective_user.id
+        scope = context.args[0].lower() if context.args else 'all'
+        if scope not in ('all', 'week') and scope not in self.catalog.by_slug:
+            await update.message.reply_text(
+                "Usage: /leaderboard [week|" + "|".join(self.catalog.by_slug) + "]"
+            )
+            return
+
+        # The top 10 is the same for everyone, so share it for a few seconds
+        top_players = await self.cache.get_or_load(
+            f"leaderboard:{self.leaderboard.board_key(scope)}",
+            lambda: self.leaderboard.top(scope, 10),
+            ttl=5
+        )
+        around_me = await self.leaderboard.around(user_id, scope, radius=2)
+        names = await self.leaderboard.get_names(
+            [member for member, _ in top_players] + [member for _, member, _ in around_me]
+        )
+
+        titles = {'all': "Top Players", 'week': "Top Players This Week"}
+        title = titles[scope] if scope in titles else f"Top Players: {self.catalog.by_slug[scope].name}"
+        leaderboard = f"🏆 {title}:\n\n"
+        for i, (member, score) in enumerate(top_players, 1):
+            leaderboard += f"{i}. @{names.get(member, member)}: {score} pts\n"
+
+        # Show the player's own neighbourhood when they aren't already in the top 10
+        neighbours = [entry for entry in around_me if entry[0] > len(top_players)]
+        if neighbours:
+            leaderboard += "\n...\n"
+            for rank, member, score in neighbours:
+                marker = "👉 " if member == user_id else ""
+                leaderboard += f"{marker}{rank}. @{names.get(member, member)}: {score} pts\n"
+        elif not around_me:
+            leaderboard += "\nPlay a /quiz to get ranked!"
         
         await update.message.reply_text(leaderboard)
 
     async def show_stats(self, update, context):
         user_id = update.effective_user.id
-        query = """
-            SELECT total_quizzes, correct_answers, wrong_answers, 
-                   highest_streak, total_score
-            FROM user_stats
-            WHERE user_id = %s
-        """
-        stats = Database.execute_query(query, (user_id,), fetch=True)
-        
-        if stats:
+
+        async def load():
+            query = """
+                SELECT total_quizzes, correct_answers, wrong_answers, 
+                       highest_streak, total_score
+                FROM user_stats
+                WHERE user_id = %s
+            """
+            rows = await Database.execute_query_async(query, (user_id,), fetch=True)
+            return list(rows[0]) if rows else None
+
+        stats = await self.cache.get_or_load(f"stats:{user_id}", load, ttl=300)
+
+        # Fold in answers still waiting in the write-behind buffer
+        correct, wrong, streak, score, quizzes = self.stats_buffer.pending_for(user_id)
+        if stats or quizzes or correct or wrong:
+            stats = stats or [0, 0, 0, 0, 0]
+            stats = [stats[0] + quizzes, stats[1] + correct, stats[2] + wrong,
+                     max(stats[3], streak), stats[4] + score]
             stats_msg = (
                 f"📊 Your Stats:\n\n"
-                f"📝 Quizzes taken: {stats[0][0]}\n"
-                f"✅ Correct answers: {stats[0][1]}\n"
-                f"❌ Wrong answers: {stats[0][2]}\n"
-                f"🔥 Highest streak: {stats[0][3]}\n"
-                f"🏆 Total score: {stats[0][4]}"
+                f"📝 Quizzes taken: {stats[0]}\n"
+                f"✅ Correct answers: {stats[1]}\n"
+                f"❌ Wrong answers: {stats[2]}\n"
+                f"🔥 Highest streak: {stats[3]}\n"
+                f"🏆 Total score: {stats[4]}"
             )
-            await update.message.reply_text(stats_msg)
\ No newline at end of file
+            await update.message.reply_text(stats_msg)
@@ -0,0 +1,216 @@
+from models import Room
+
+# Rooms nobody has played in for this long are dropped
+ROOM_TTL = 30 * 60
+
+
+def encode_room(room):
+    return {
+        'n': room.room_id or '',
+        'c': room.category,
+        'q': ','.join(map(str, room.question_ids)),
+        'u': room.started_by,
+        'i': room.index,
+        # The open round's index, or -1 between rounds; answers check it
+        'r': room.index if room.is_open else -1,
+        'o': room.order,
+        't': room.asked_at,
+        'b': room.scoreboard_id or ''
+    }
+
+
+def decode_room(fields):
+    fields = {key.decode(): value.decode() for key, value in fields.items()}
+    return Room(
+        category=fields['c'],
+        question_ids=[int(q) for q in fields['q'].split(',') if q],
+        started_by=int(fields['u']),
+        index=int(fields['i']),
+        is_open=int(fields['r']) >= 0,
+        order=int(fields['o']),
+        asked_at=float(fields['t']),
+        scoreboard_id=int(fields['b']) if fields['b'] else None,
+        room_id=fields.get('n') or None
+    )
+
+
+class MemoryRoomStore:
+    """Rooms held in this process only. Fine for a single worker and for tests."""
+
+    def __init__(self):
+        self.rooms = {}
+        self.answers = {}
+        self.scores = {}
+        self.names = {}
+
+    async def create(self, chat_id, room):
+        """Returns False if the chat already has a room."""
+        if chat_id in self.rooms:
+            return False
+        self.rooms[chat_id] = room
+        self.scores[chat_id] = {}
+        self.names[chat_id] = {}
+        return True
+
+    async def get(self, chat_id):
+        room = self.rooms.get(chat_id)
+        return None if room is None else room.copy()
+
+    async def save(self, chat_id, room):
+        if chat_id in self.rooms:
+            self.rooms[chat_id] = room.copy()
+
+    async def answer(self, chat_id, index, user_id, name, selected, answered_ms):
+        """Record a player's first answer to round ``index``, received at ``answered_ms``.
+
+        Returns True if it counts, False if they already answered, and None
+        if the round isn't open.
+        """
+        room = self.rooms.get(chat_id)
+        if room is None or not room.is_open or room.index != index:
+            return None
+        answers = self.answers.setdefault((chat_id, index), {})
+        if user_id in answers:
+            return False
+        answers[user_id] = (selected, answered_ms, name)
+        return True
+
+    async def answered(self, chat_id, index):
+        return len(self.answers.get((chat_id, index), ()))
+
+    async def close_round(self, chat_id, index):
+        """Close round ``index``; returns ``{user_id: (selected, answered_ms, name)}``."""
+        room = self.rooms.get(chat_id)
+        if room is not None and room.index == index:
+            room.is_open = False
+        return self.answers.pop((chat_id, index), {})
+
+    async def add_scores(self, chat_id, points, names):
+        scores = self.scores.setdefault(chat_id, {})
+        for user_id, amount in points.items():
+            scores[user_id] = scores.get(user_id, 0) + amount
+        self.names.setdefault(chat_id, {}).update(names)
+
+    async def top(self, chat_id, limit=10):
+        """``[(user_id, name, score)]``, best first."""
+        scores = self.scores.get(chat_id, {})
+        names = self.names.get(chat_id, {})
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return [(user_id, names.get(user_id, str(user_id)), score) for user_id, score in ranked]
+
+    async def delete(self, chat_id):
+        self.scores.pop(chat_id, None)
+        self.names.pop(chat_id, None)
+        for key in [key for key in self.answers if key[0] == chat_id]:
+            del self.answers[key]
+        return self.rooms.pop(chat_id, None) is not None
+
+
+class RedisRoomStore:
+    """Rooms in Redis so every worker can take answers for any room.
+
+    Each answer is one MULTI round trip: read the open round, HSETNX the
+    player's answer into that round's hash. Closing a round reads and
+    deletes the hash in one MULTI as well, so an answer is either counted
+    in the round or reported as late, never lost in between.
+    """
+
+    def __init__(self, redis, prefix='room:'):
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, chat_id, suffix=''):
+        return f"{self.prefix}{chat_id}{suffix}"
+
+    async def create(self, chat_id, room):
+        key = self._key(chat_id)
+        # The started_by field doubles as the lock against two rooms at once
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, 'u', room.started_by)
+            pipe.expire(key, ROOM_TTL)
+            created, _ = await pipe.execute()
+        if not created:
+            return False
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=encode_room(room))
+            pipe.delete(self._key(chat_id, ':s'), self._key(chat_id, ':n'))
+            await pipe.execute()
+        return True
+
+    async def get(self, chat_id):
+        fields = await self.redis.hgetall(self._key(chat_id))
+        # A room being created has only its lock field so far
+        return decode_room(fields) if b'q' in fields else None
+
+    async def save(self, chat_id, room):
+        key = self._key(chat_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=encode_room(room))
+            pipe.expire(key, ROOM_TTL)
+            pipe.expire(self._key(chat_id, ':s'), ROOM_TTL)
+            pipe.expire(self._key(chat_id, ':n'), ROOM_TTL)
+            await pipe.execute()
+
+    async def answer(self, chat_id, index, user_id, name, selected, answered_ms):
+        answers = self._key(chat_id, f":a:{index}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hget(self._key(chat_id), 'r')
+            pipe.hsetnx(answers, user_id, f"{selected}:{answered_ms}:{name}")
+            # A late answer recreates a closed round's hash; let it expire
+            pipe.expire(answers, ROOM_TTL)
+            open_round, added, _ = await pipe.execute()
+        if open_round is None or int(open_round) != index:
+            return None
+        return bool(added)
+
+    async def answered(self, chat_id, index):
+        return await self.redis.hlen(self._key(chat_id, f":a:{index}"))
+
+    async def close_round(self, chat_id, index):
+        answers = self._key(chat_id, f":a:{index}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(answers)
+            pipe.delete(answers)
+            pipe.hset(self._key(chat_id), 'r', -1)
+            pipe.expire(self._key(chat_id), ROOM_TTL)
+            fields, *_ = await pipe.execute()
+        result = {}
+        for user_id, value in fields.items():
+            # Names may contain colons, so only split off the two numbers
+            selected, answered_ms, name = value.split(b':', 2)
+            result[int(user_id)] = (int(selected), int(answered_ms), name.decode())
+        return result
+
+    async def add_scores(self, chat_id, points, names):
+        if not points:
+            return
+        scores = self._key(chat_id, ':s')
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, amount in points.items():
+                pipe.zincrby(scores, amount, user_id)
+            if names:
+                pipe.hset(self._key(chat_id, ':n'), mapping=names)
+            pipe.expire(scores, ROOM_TTL)
+            pipe.expire(self._key(chat_id, ':n'), ROOM_TTL)
+            await pipe.execute()
+
+    async def top(self, chat_id, limit=10):
+        entries = await self.redis.zrevrange(self._key(chat_id, ':s'), 0, limit - 1, withscores=True)
+        if not entries:
+            return []
+        names = await self.redis.hmget(self._key(chat_id, ':n'), [member for member, _ in entries])
+        return [
+            (int(member), name.decode() if name else member.decode(), int(score))
+            for (member, score), name in zip(entries, names)
+        ]
+
+    async def delete(self, chat_id):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(chat_id))
+            pipe.delete(self._key(chat_id, ':s'), self._key(chat_id, ':n'))
+            deleted, _ = await pipe.execute()
+        return bool(deleted)
+
+
+def create_room_store(redis=None):
+    return RedisRoomStore(redis) if redis else MemoryRoomStore()
@@ -0,0 +1,92 @@
+from cache import TTLCache
+
+# Sized for the last CAPACITY questions a player saw in one category at about
+# a 1% false positive rate: 2464 bits and 7 probes. A false positive only
+# means an unseen question is skipped once.
+CAPACITY = 256
+BITS = 2464
+PROBES = 7
+SEEN_TTL = 90 * 24 * 60 * 60
+
+
+def _probes(question_id):
+    # Double hashing: k positions from two cheap multiplicative hashes
+    h1 = (question_id * 2654435761) & 0xFFFFFFFF
+    h2 = (((question_id ^ 0x5BD1E995) * 0x85EBCA6B) & 0xFFFFFFFF) | 1
+    return [(h1 + i * h2) % BITS for i in range(PROBES)]
+
+
+class SeenFilter:
+    """Bloom filter over the question ids one player has seen in one category."""
+
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, bits=None, count=0):
+        self.bits = bytearray(BITS // 8) if bits is None else bytearray(bits)
+        self.count = count
+
+    def __contains__(self, question_id):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in _probes(question_id))
+
+    def add(self, question_id):
+        bits = self.bits
+        for p in _probes(question_id):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count >= CAPACITY
+
+    def reset(self):
+        self.bits = bytearray(BITS // 8)
+        self.count = 0
+
+    def to_bytes(self):
+        return self.count.to_bytes(2, 'little') + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[2:], int.from_bytes(data[:2], 'little'))
+
+
+class MemorySeenStore:
+    """Seen filters for this process only, in a bounded LRU."""
+
+    def __init__(self, max_filters=200000, ttl=SEEN_TTL):
+        self.filters = TTLCache(max_filters)
+        self.ttl = ttl
+
+    async def get(self, user_id, category):
+        seen = self.filters.get((user_id, category))
+        return SeenFilter() if seen is None else seen
+
+    async def save(self, user_id, category, seen):
+        self.filters.set((user_id, category), seen, self.ttl)
+
+
+class RedisSeenStore:
+    """Seen filters as ~310 byte Redis strings, shared by all workers."""
+
+    def __init__(self, redis, prefix='seen:', ttl=SEEN_TTL):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, user_id, category):
+        return f"{self.prefix}{user_id}:{category}"
+
+    async def get(self, user_id, category):
+        data = await self.redis.get(self._key(user_id, category))
+        return SeenFilter() if data is None else SeenFilter.from_bytes(data)
+
+    async def save(self, user_id, category, seen):
+        await self.redis.set(self._key(user_id, category), seen.to_bytes(), ex=self.ttl)
+
+
+def create_seen_store(redis=None):
+    return RedisSeenStore(redis) if redis else MemorySeenStore()
@@ -0,0 +1,120 @@
+import struct
+from redis.exceptions import WatchError
+from cache import TTLCache
+from models import MODES, QuizSession
+
+# Sessions are QuizSession objects; question bodies are not stored and
+# handlers look them up in the shared QuestionBank by id.
+
+SESSION_TTL = 30 * 60
+
+# started_at, score, index, streak, highest_streak, question count, current_order, mode,
+# milliseconds from started_at to when the current question was asked
+_HEADER = struct.Struct('<IHHHHHbBI')
+
+
+def encode_session(session):
+    """Pack a session into a few dozen bytes: header, question ids, category."""
+    ids = session.question_ids
+    order = session.current_order
+    return b''.join((
+        _HEADER.pack(
+            session.started_at, session.score, session.index,
+            session.streak, session.highest_streak,
+            len(ids), -1 if order is None else order, MODES.index(session.mode),
+            max(0, int((session.asked_at - session.started_at) * 1000))
+        ),
+        struct.pack(f'<{len(ids)}I', *ids),
+        session.category.encode()
+    ))
+
+
+def decode_session(data):
+    started_at, score, index, streak, highest_streak, count, order, mode, asked = _HEADER.unpack_from(data)
+    offset = _HEADER.size
+    return QuizSession(
+        data[offset + 4 * count:].decode(),
+        struct.unpack_from(f'<{count}I', data, offset),
+        MODES[mode], index, score, streak, highest_streak,
+        None if order < 0 else order,
+        started_at, started_at + asked / 1000
+    )
+
+
+class MemorySessionStore:
+    """Encoded sessions in a bounded LRU; idle ones expire after ``ttl``."""
+
+    def __init__(self, max_sessions=100000, ttl=SESSION_TTL):
+        self.sessions = TTLCache(max_sessions)
+        self.ttl = ttl
+
+    async def get(self, user_id):
+        data = self.sessions.get(user_id)
+        return decode_session(data) if data is not None else None
+
+    async def save(self, user_id, session):
+        self.sessions.set(user_id, encode_session(session), self.ttl)
+
+    async def update(self, user_id, mutate):
+        """Apply ``mutate(session)`` atomically; returns ``(session, result)`` or ``(None, None)``."""
+        session = await self.get(user_id)
+        if session is None:
+            return None, None
+        result = mutate(session)
+        await self.save(user_id, session)
+        return session, result
+
+    async def delete(self, user_id):
+        return self.sessions.delete(user_id)
+
+
+class RedisSessionStore:
+    """Encoded sessions as Redis strings, so they survive restarts and deploys."""
+
+    # The prefix names the encoding, so sessions written in an older layout are ignored
+    def __init__(self, redis, prefix='quiz3:', ttl=SESSION_TTL):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f"{self.prefix}{user_id}"
+
+    async def get(self, user_id):
+        data = await self.redis.get(self._key(user_id))
+        return decode_session(data) if data is not None else None
+
+    async def save(self, user_id, session):
+        # Every save pushes the expiry back, so only idle sessions lapse
+        await self.redis.set(self._key(user_id), encode_session(session), ex=self.ttl)
+
+    async def update(self, user_id, mutate):
+        """Optimistic WATCH/MULTI read-modify-write, retried on conflict.
+
+        Taps from one player can land on different workers at once; this is
+        what stops both of them scoring the same question.
+        """
+        key = self._key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = await pipe.get(key)
+                    if data is None:
+                        await pipe.reset()
+                        return None, None
+                    session = decode_session(data)
+                    result = mutate(session)
+                    pipe.multi()
+                    pipe.set(key, encode_session(session), ex=self.ttl)
+                    await pipe.execute()
+                    return session, result
+                except WatchError:
+                    continue
+
+    async def delete(self, user_id):
+        return bool(await self.redis.delete(self._key(user_id)))
+
+
+def create_session_store(redis=None):
+    return RedisSessionStore(redis) if redis else MemorySessionStore()
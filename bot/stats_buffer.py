@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+from psycopg2.extras import execute_values
+from database import Database
+import counters
+
+logger = logging.getLogger(__name__)
+
+# Field order for the per-user delta lists
+CORRECT, WRONG, STREAK, SCORE, QUIZZES = range(5)
+
+
+class StatsBuffer:
+    """Write-behind buffer for user_stats.
+
+    Answers are folded into per-user deltas in memory and written as one
+    multi-row upsert per flush. The upsert adds deltas to the stored totals
+    (and takes GREATEST for streaks), so flushes from different workers
+    commute and never overwrite each other.
+    """
+
+    def __init__(self, max_pending=500, flush_interval=5.0, cache=None):
+        self.max_pending = max_pending
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.category_pending = {}
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def record_answer(self, user_id, is_correct, streak, category, points):
+        with self._lock:
+            delta = self.pending.setdefault(user_id, [0, 0, 0, 0, 0])
+            delta[CORRECT if is_correct else WRONG] += 1
+            delta[STREAK] = max(delta[STREAK], streak)
+            delta[SCORE] += points
+
+            category_delta = self.category_pending.setdefault((user_id, category), [0, 0])
+            category_delta[0 if is_correct else 1] += 1
+
+    def record_quiz(self, user_id):
+        with self._lock:
+            self.pending.setdefault(user_id, [0, 0, 0, 0, 0])[QUIZZES] += 1
+
+    def __len__(self):
+        return len(self.pending)
+
+    def pending_for(self, user_id):
+        """Unflushed ``[correct, wrong, streak, score, quizzes]`` for one user."""
+        with self._lock:
+            return list(self.pending.get(user_id, [0, 0, 0, 0, 0]))
+
+    def drain(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            category_pending, self.category_pending = self.category_pending, {}
+        return pending, category_pending
+
+    def restore(self, pending, category_pending):
+        """Merge deltas from a failed flush back in so nothing is lost."""
+        with self._lock:
+            for user_id, delta in pending.items():
+                current = self.pending.setdefault(user_id, [0, 0, 0, 0, 0])
+                for field in (CORRECT, WRONG, SCORE, QUIZZES):
+                    current[field] += delta[field]
+                current[STREAK] = max(current[STREAK], delta[STREAK])
+            for key, delta in category_pending.items():
+                current = self.category_pending.setdefault(key, [0, 0])
+                current[0] += delta[0]
+                current[1] += delta[1]
+
+    def flush(self):
+        pending, category_pending = self.drain()
+        self.last_flush = time.monotonic()
+        if not pending:
+            return []
+
+        # Sorted rows take row locks in the same order in every worker, which
+        # keeps concurrent upserts from deadlocking
+        rows = sorted((user_id, *delta) for user_id, delta in pending.items())
+        category_rows = sorted((user_id, category, *delta) for (user_id, category), delta in category_pending.items())
+
+        try:
+            with Database.connection() as conn, conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO user_stats (user_id, correct_answers, wrong_answers,
+                                            highest_streak, total_score, total_quizzes)
+                    VALUES %s
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        correct_answers = user_stats.correct_answers + EXCLUDED.correct_answers,
+                        wrong_answers = user_stats.wrong_answers + EXCLUDED.wrong_answers,
+                        highest_streak = GREATEST(user_stats.highest_streak, EXCLUDED.highest_streak),
+                        total_score = user_stats.total_score + EXCLUDED.total_score,
+                        total_quizzes = user_stats.total_quizzes + EXCLUDED.total_quizzes
+                """, rows, page_size=1000)
+
+                if category_rows:
+                    execute_values(cur, """
+                        INSERT INTO user_category_stats (user_id, category, correct_answers, wrong_answers)
+                        VALUES %s
+                        ON CONFLICT (user_id, category) DO UPDATE SET
+                            correct_answers = user_category_stats.correct_answers + EXCLUDED.correct_answers,
+                            wrong_answers = user_category_stats.wrong_answers + EXCLUDED.wrong_answers
+                    """, category_rows, page_size=1000)
+
+                counters.increment(cur, total_points=sum(delta[SCORE] for delta in pending.values()))
+        except Exception:
+            self.restore(pending, category_pending)
+            raise
+
+        return list(pending)
+
+    async def flush_async(self):
+        # One flush at a time per process; a second caller just waits its turn
+        async with self._flush_lock:
+            try:
+                user_ids = await Database.run(self.flush)
+            except Exception as e:
+                logger.error(f"Stats flush failed, will retry: {e}")
+                return 0
+
+        # Cached /stats replies for these users are now out of date
+        if self.cache and user_ids:
+            await self.cache.invalidate(*(f"stats:{user_id}" for user_id in user_ids))
+        return len(user_ids)
+
+    def due(self):
+        return (
+            len(self.pending) >= self.max_pending
+            or (self.pending and time.monotonic() - self.last_flush >= self.flush_interval)
+        )
+
+    async def run(self, tick=1.0):
+        while True:
+            await asyncio.sleep(tick)
+            if self.due():
+                await self.flush_async()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
@@ -0,0 +1,211 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from redis.exceptions import ResponseError
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+STREAM = 'updates'
+GROUP = 'workers'
+# XADD trims approximately, which is O(1); a million updates is hours of
+# backlog at peak, far longer than any deploy leaves the workers down
+MAX_LENGTH = 1_000_000
+# An update delivered to a worker but not acked within this long is taken
+# over by another worker: its consumer died or was scaled away
+CLAIM_IDLE_MS = 60_000
+
+
+class MemoryUpdateQueue:
+    """In-process stand-in for RedisUpdateQueue, for tests and local runs.
+
+    As in a consumer group, a read entry stays pending until it's acked.
+    """
+
+    def __init__(self):
+        self.entries = deque()
+        self.pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def push(self, data):
+        with self._lock:
+            entry_id = str(next(self._ids))
+            self.entries.append((entry_id, data))
+        return entry_id
+
+    async def setup(self):
+        pass
+
+    async def read(self, count, block=1.0):
+        deadline = time.monotonic() + block
+        while True:
+            with self._lock:
+                batch = [self.entries.popleft() for _ in range(min(count, len(self.entries)))]
+                self.pending.update(batch)
+            if batch or time.monotonic() >= deadline:
+                return batch
+            await asyncio.sleep(0.01)
+
+    async def claim(self, count):
+        # One process, so there's no other consumer to take over from
+        return []
+
+    async def ack(self, entry_ids):
+        with self._lock:
+            for entry_id in entry_ids:
+                self.pending.pop(entry_id, None)
+
+
+class RedisUpdateQueue:
+    """Raw updates in a Redis stream, shared by workers through a consumer group.
+
+    The web process pushes with a blocking client; workers read, claim and
+    ack with an asyncio one. Delivery is at least once: an update whose
+    worker dies before acking is handled again by another.
+    """
+
+    def __init__(self, redis=None, sync_redis=None, consumer=None, stream=STREAM, group=GROUP):
+        self.redis = redis
+        self.sync_redis = sync_redis
+        # Stable across restarts on Heroku (worker.1), so a restarted worker
+        # picks up its own unacked entries first
+        self.consumer = consumer or os.getenv('DYNO') or socket.gethostname()
+        self.stream = stream
+        self.group = group
+        # Where re-reading our own pending entries has got to, None once done
+        self._backlog = '0'
+
+    def push(self, data):
+        return self.sync_redis.xadd(self.stream, {'u': data}, maxlen=MAX_LENGTH, approximate=True)
+
+    async def setup(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _entries(self, entries):
+        # Entries trimmed away while pending come back without fields, and
+        # would otherwise stay pending for good
+        trimmed = [entry_id for entry_id, fields in entries if entry_id and not fields]
+        if trimmed:
+            await self.ack(trimmed)
+        return [(entry_id.decode(), fields[b'u']) for entry_id, fields in entries if fields]
+
+    async def read(self, count, block=1.0):
+        while self._backlog:
+            # Our own entries delivered before a restart and never acked
+            response = await self.redis.xreadgroup(
+                self.group, self.consumer, {self.stream: self._backlog}, count=count
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                self._backlog = None
+                break
+            self._backlog = entries[-1][0]
+            entries = await self._entries(entries)
+            if entries:
+                return entries
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: '>'}, count=count, block=int(block * 1000)
+        )
+        return await self._entries(response[0][1]) if response else []
+
+    async def claim(self, count):
+        _, entries, *_ = await self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, CLAIM_IDLE_MS, start_id='0-0', count=count
+        )
+        return await self._entries(entries)
+
+    async def ack(self, entry_ids):
+        await self.redis.xack(self.stream, self.group, *entry_ids)
+
+
+def create_update_queue(redis=None, sync_redis=None):
+    if redis is not None or sync_redis is not None:
+        return RedisUpdateQueue(redis, sync_redis)
+    return MemoryUpdateQueue()
+
+
+class UpdateConsumer:
+    """Feeds queued updates to the application, acking each once it's handled.
+
+    Updates go through the application's update processor, so per-user
+    ordering and the concurrency limit apply as they do with polling.
+    Reads are sized to the free slots: what this worker can't start yet
+    stays in the stream for the others.
+    """
+
+    def __init__(self, queue, application, max_in_flight=None, claim_interval=30.0):
+        self.queue = queue
+        self.application = application
+        self.max_in_flight = max_in_flight or 2 * application.update_processor.max_concurrent_updates
+        self.claim_interval = claim_interval
+        self.handled = 0
+        self.in_flight = set()
+        self.acks = []
+        self._task = None
+
+    async def handle(self, entry_id, data):
+        try:
+            update = Update.de_json(json.loads(data), self.application.bot)
+            await self.application.update_processor.process_update(update, self.application.process_update(update))
+        except Exception as e:
+            # Handler errors already went to the error handler; this is a
+            # malformed entry, and retrying it would fail the same way
+            logger.error(f"Dropping queued update {entry_id}: {e}")
+        self.handled += 1
+        self.acks.append(entry_id)
+
+    async def flush_acks(self):
+        if self.acks:
+            acks, self.acks = self.acks, []
+            await self.queue.ack(acks)
+
+    async def run(self):
+        last_claim = time.monotonic()
+        while True:
+            try:
+                await self.flush_acks()
+                free = self.max_in_flight - len(self.in_flight)
+                if free <= 0:
+                    await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                entries = []
+                if time.monotonic() - last_claim >= self.claim_interval:
+                    last_claim = time.monotonic()
+                    entries = await self.queue.claim(free)
+                if len(entries) < free:
+                    entries += await self.queue.read(free - len(entries))
+            except Exception as e:
+                logger.error(f"Update queue read failed, retrying: {e}")
+                await asyncio.sleep(1)
+                continue
+            for entry_id, data in entries:
+                task = asyncio.create_task(self.handle(entry_id, data))
+                self.in_flight.add(task)
+                task.add_done_callback(self.in_flight.discard)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Stop reading, finish what's in flight and ack it; the rest stays queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.in_flight:
+            await asyncio.wait(self.in_flight)
+        await self.flush_acks()
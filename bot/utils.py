@@ -0,0 +1,28 @@
+import os
+import redis.asyncio as redis
+from redis import Redis
+
+_redis_client = None
+_sync_redis_client = None
+
+
+def get_redis():
+    """Shared asyncio Redis client for REDIS_URL, or None when Redis isn't configured."""
+    global _redis_client
+    url = os.getenv('REDIS_URL')
+    if not url:
+        return None
+    if _redis_client is None:
+        _redis_client = redis.from_url(url)
+    return _redis_client
+
+
+def get_sync_redis():
+    """Blocking Redis client for REDIS_URL, for code outside the event loop such as the web process."""
+    global _sync_redis_client
+    url = os.getenv('REDIS_URL')
+    if not url:
+        return None
+    if _sync_redis_client is None:
+        _sync_redis_client = Redis.from_url(url)
+    return _sync_redis_client
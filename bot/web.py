@@ -0,0 +1,94 @@
+import hmac
+import json
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/telegram'
+# Telegram sends the setWebhook secret_token back in this header
+SECRET_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+# An update is a few KB at most; anything this big isn't from Telegram
+MAX_BODY = 1 << 20
+
+
+def _respond(start_response, status, body=b'', content_type='text/plain'):
+    start_response(status, [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def receive_update(environ, update_queue, secret):
+    """Queue one webhook delivery; returns the response status."""
+    if environ.get('REQUEST_METHOD') != 'POST':
+        return '405 Method Not Allowed'
+    # Without a configured secret there's no telling Telegram from anyone else
+    token = environ.get(SECRET_HEADER, '')
+    if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+        return '403 Forbidden'
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return '400 Bad Request'
+    if length > MAX_BODY:
+        return '413 Payload Too Large'
+
+    body = environ['wsgi.input'].read(length)
+    try:
+        update = json.loads(body)
+    except ValueError:
+        return '400 Bad Request'
+    if not isinstance(update, dict) or not isinstance(update.get('update_id'), int):
+        return '400 Bad Request'
+
+    # The raw body is queued as is; workers parse it into an Update
+    try:
+        update_queue.push(body)
+    except Exception as e:
+        # Telegram redelivers on any error status, so nothing is lost
+        logger.error(f"Couldn't queue update {update['update_id']}: {e}")
+        return '503 Service Unavailable'
+    return '200 OK'
+
+
+def authorize_metrics(environ, token):
+    """Check a scrape's bearer token; returns an error status, or None if it may read /metrics."""
+    # Metrics name every handler and statement, so they're never served without a token
+    if not token:
+        return '403 Forbidden'
+    header = environ.get('HTTP_AUTHORIZATION', '')
+    if not header.startswith('Bearer ') or not hmac.compare_digest(header[len('Bearer '):].encode(), token.encode()):
+        return '401 Unauthorized'
+    return None
+
+
+def render_metrics(redis=None):
+    # This process's own metrics, plus whatever the workers published to Redis
+    snapshots = [(metrics.instance_name(), metrics.snapshot())]
+    if redis:
+        snapshots += metrics.published(redis)
+    return metrics.render(snapshots).encode()
+
+
+def create_app(update_queue, secret, redis=None, metrics_token=None):
+    """WSGI app for the web process: Telegram webhook in, /metrics out.
+
+    The web process only queues updates. Workers handle them, so a slow
+    handler or a worker restart never delays the response to Telegram.
+    /metrics answers only scrapes carrying ``metrics_token`` as a bearer
+    token, and is refused outright when no token is configured.
+    """
+
+    def app(environ, start_response):
+        path = environ.get('PATH_INFO')
+        if path == WEBHOOK_PATH:
+            status = receive_update(environ, update_queue, secret)
+            metrics.webhook_requests.inc(status[:3])
+            return _respond(start_response, status)
+        if path == '/metrics':
+            status = authorize_metrics(environ, metrics_token)
+            if status:
+                return _respond(start_response, status)
+            return _respond(start_response, '200 OK', render_metrics(redis), 'text/plain; version=0.0.4; charset=utf-8')
+        return _respond(start_response, '404 Not Found', b'Not found')
+
+    return app
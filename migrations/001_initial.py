@@ -1,71 +1,42 @@
-from __future__ import annotations
-import logging
-from typing import Optional
-from bot.database import Database
+"""Core tables. IF NOT EXISTS lets this adopt databases created before migrations were versioned."""
 
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('migrations.log')
-    ]
-)
-logger = logging.getLogger(__name__)
 
-class MigrationError(Exception):
-    """Custom exception for migration failures."""
-    pass
-
-def run_migrations() -> bool:
-    """
-    Run initial database migrations.
-    
-    Returns:
-        bool: True if migrations succeeded, False otherwise
-    """
-    try:
-        logger.info("Starting database migrations")
-        
-        # Initialize database connection with context manager if available
-        if hasattr(Database, '__enter__'):
-            with Database() as db:
-                logger.info("Database connection established")
-                _perform_migrations(db)
-        else:
-            logger.info("Database connection established")
-            Database.initialize()
-            _perform_migrations(Database)
-        
-        logger.info("Migrations completed successfully")
-        return True
-        
-    except MigrationError as e:
-        logger.error(f"Migration failed: {e}")
-        return False
-    except Exception as e:
-        logger.critical(f"Unexpected error during migration: {e}", exc_info=True)
-        return False
-    finally:
-        # Cleanup resources
-        if hasattr(Database, 'close'):
-            Database.close()
-            logger.info("Database connection closed")
-
-def _perform_migrations(db: Database) -> None:
-    """Perform the actual migration steps."""
-    try:
-        db.create_tables()
-        logger.info("Tables created successfully")
-        
-        # Add additional migration steps here if needed
-        # Example: db.add_indexes(), db.populate_initial_data(), etc.
-        
-    except Exception as e:
-        logger.error(f"Migration step failed: {e}")
-        raise MigrationError("Failed to execute migration steps") from e
-
-if __name__ == '__main__':
-    if not run_migrations():
-        exit(1)
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            joined_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            question_id SERIAL PRIMARY KEY,
+            category TEXT NOT NULL,
+            question_text TEXT NOT NULL,
+            option1 TEXT NOT NULL,
+            option2 TEXT NOT NULL,
+            option3 TEXT NOT NULL,
+            option4 TEXT NOT NULL,
+            correct_option SMALLINT NOT NULL CHECK (correct_option BETWEEN 0 AND 3),
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY,
+            total_quizzes INTEGER NOT NULL DEFAULT 0,
+            correct_answers INTEGER NOT NULL DEFAULT 0,
+            wrong_answers INTEGER NOT NULL DEFAULT 0,
+            highest_streak INTEGER NOT NULL DEFAULT 0,
+            total_score BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id BIGINT NOT NULL,
+            achievement_id TEXT NOT NULL,
+            unlocked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
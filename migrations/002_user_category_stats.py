@@ -0,0 +1,13 @@
+"""Per-category answer counts, written in bulk by the stats buffer."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_category_stats (
+            user_id BIGINT NOT NULL,
+            category TEXT NOT NULL,
+            correct_answers INTEGER NOT NULL DEFAULT 0,
+            wrong_answers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        )
+    """)
@@ -0,0 +1,23 @@
+"""Admin broadcasts and their send checkpoints."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id SERIAL PRIMARY KEY,
+            message TEXT NOT NULL,
+            admin_chat_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            last_user_id BIGINT,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        )
+    """)
+    # Broadcasts to resume on startup; almost every row is finished
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS broadcasts_running_idx
+        ON broadcasts (broadcast_id) WHERE status = 'running'
+    """)
@@ -0,0 +1,34 @@
+"""Question de-duplication key for imports and admin adds."""
+import logging
+from psycopg2.extras import execute_values
+from question_io import text_hash
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(cur) -> None:
+    # Backfilled with the same normalization imports use. Only the oldest
+    # copy of a duplicated question gets the hash; later copies stay NULL,
+    # which the unique index allows.
+    cur.execute("ALTER TABLE questions ADD COLUMN IF NOT EXISTS text_hash TEXT")
+    cur.execute("SELECT text_hash FROM questions WHERE text_hash IS NOT NULL")
+    seen = {digest for (digest,) in cur.fetchall()}
+    cur.execute("SELECT question_id, question_text FROM questions WHERE text_hash IS NULL ORDER BY question_id")
+    rows = []
+    duplicates = 0
+    for question_id, question_text in cur.fetchall():
+        digest = text_hash(question_text)
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+        rows.append((question_id, digest))
+    if rows:
+        execute_values(cur, """
+            UPDATE questions SET text_hash = data.text_hash
+            FROM (VALUES %s) AS data (question_id, text_hash)
+            WHERE questions.question_id = data.question_id
+        """, rows, page_size=5000)
+    if duplicates:
+        logger.warning(f"{duplicates} duplicate questions left without a text_hash")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS questions_text_hash_key ON questions (text_hash)")
@@ -0,0 +1,16 @@
+"""The unique key achievement grants rely on for ON CONFLICT DO NOTHING."""
+
+
+def upgrade(cur) -> None:
+    # Older check-then-insert code could race, so drop duplicates first
+    cur.execute("""
+        DELETE FROM user_achievements a
+        USING user_achievements b
+        WHERE a.user_id = b.user_id
+          AND a.achievement_id = b.achievement_id
+          AND a.ctid > b.ctid
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS user_achievements_user_achievement_key
+        ON user_achievements (user_id, achievement_id)
+    """)
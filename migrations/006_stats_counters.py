@@ -0,0 +1,10 @@
+"""Maintained admin dashboard counters. The reconcile job fills in missing rows."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+    """)
@@ -0,0 +1,21 @@
+"""One row per player per finished battle."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS battle_results (
+            battle_id TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            opponent_id BIGINT NOT NULL,
+            score INTEGER NOT NULL,
+            response_time REAL NOT NULL,
+            won BOOLEAN,
+            finished_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (battle_id, user_id)
+        )
+    """)
+    # A player's recent battles
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS battle_results_user_finished_idx
+        ON battle_results (user_id, finished_at DESC)
+    """)
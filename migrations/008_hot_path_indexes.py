@@ -0,0 +1,15 @@
+"""Indexes for the queries the bot runs per update. scripts/check_query_plans.py guards them."""
+
+
+def upgrade(cur) -> None:
+    # Active questions per category: catalog counts and category sampling
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS questions_category_active_idx
+        ON questions (category, is_active)
+    """)
+
+    # Top-N by score without sorting the whole table
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS user_stats_total_score_idx
+        ON user_stats (total_score DESC)
+    """)
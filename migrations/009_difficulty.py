@@ -0,0 +1,16 @@
+"""Elo ratings for questions and players."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        ALTER TABLE questions
+            ADD COLUMN IF NOT EXISTS difficulty REAL NOT NULL DEFAULT 1000,
+            ADD COLUMN IF NOT EXISTS difficulty_answers INTEGER NOT NULL DEFAULT 0
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_skill (
+            user_id BIGINT PRIMARY KEY,
+            rating REAL NOT NULL DEFAULT 1000,
+            answers INTEGER NOT NULL DEFAULT 0
+        )
+    """)
@@ -0,0 +1,22 @@
+"""Append-only answer log, partitioned by day.
+
+Partitions are created ahead of time and dropped past retention by the
+bot's AnswerLog.maintain job, not here.
+"""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_events (
+            answered_at TIMESTAMPTZ NOT NULL,
+            user_id BIGINT NOT NULL,
+            question_id INTEGER NOT NULL,
+            selected SMALLINT NOT NULL,
+            is_correct BOOLEAN NOT NULL,
+            response_ms INTEGER NOT NULL,
+            mode TEXT NOT NULL
+        ) PARTITION BY RANGE (answered_at)
+    """)
+    # Created on the parent so every partition gets them
+    cur.execute("CREATE INDEX IF NOT EXISTS answer_events_question ON answer_events (question_id, answered_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS answer_events_user ON answer_events (user_id, answered_at)")
@@ -0,0 +1,32 @@
+"""Category catalog. questions.category holds a category's slug.
+
+Seeds the categories the bot used to hard-code, then adopts any other
+category that questions already use, so nothing disappears from /quiz.
+"""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            category_id SERIAL PRIMARY KEY,
+            slug TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            parent_id INTEGER REFERENCES categories (category_id) ON DELETE CASCADE,
+            position INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        INSERT INTO categories (slug, name, position) VALUES
+            ('general', 'General Knowledge', 1),
+            ('science', 'Science', 2),
+            ('history', 'History', 3),
+            ('movies', 'Movies', 4),
+            ('music', 'Music', 5)
+        ON CONFLICT (slug) DO NOTHING
+    """)
+    cur.execute("""
+        INSERT INTO categories (slug, name, position)
+        SELECT DISTINCT category, initcap(category), 100 FROM questions
+        ON CONFLICT (slug) DO NOTHING
+    """)
@@ -0,0 +1,9 @@
+"""Which worker is sending a broadcast, and until when its claim holds."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        ALTER TABLE broadcasts
+            ADD COLUMN IF NOT EXISTS owner TEXT,
+            ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ
+    """)
@@ -0,0 +1,13 @@
+"""When each question last changed, so every worker's bank can pick up the changes."""
+
+
+def upgrade(cur) -> None:
+    cur.execute("""
+        ALTER TABLE questions
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    """)
+    # The bank refresh reads the rows changed since its last pass
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS questions_updated_at_idx
+        ON questions (updated_at)
+    """)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import importlib.util
+import logging
+import os
+import re
+import sys
+from types import ModuleType
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from database import Database
+
+# Configure structured logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler('migrations.log')
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE = re.compile(r'^(\d{3})_(\w+)\.py$')
+
+# Arbitrary key for the advisory lock that keeps two releases from
+# migrating at the same time
+LOCK_KEY = 7_301_915
+
+class MigrationError(Exception):
+    """Custom exception for migration failures."""
+    pass
+
+def discover() -> List[Tuple[int, str, ModuleType]]:
+    """
+    Load every ``NNN_name.py`` migration in this directory.
+
+    Returns:
+        list: (version, name, module) tuples in version order
+    """
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version, name = int(match.group(1)), match.group(2)
+        spec = importlib.util.spec_from_file_location(f"migration_{version:03d}", os.path.join(MIGRATIONS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if not hasattr(module, 'upgrade'):
+            raise MigrationError(f"{filename} has no upgrade(cur) function")
+        migrations.append((version, name, module))
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Two migrations share a version number")
+    return migrations
+
+def run_migrations() -> bool:
+    """
+    Apply every migration that isn't recorded in schema_migrations yet.
+
+    Each migration runs in its own transaction together with the row that
+    records it, so a failure leaves the database at the last good version
+    and the next run picks up from there.
+
+    Returns:
+        bool: True if migrations succeeded, False otherwise
+    """
+    try:
+        logger.info("Starting database migrations")
+        migrations = discover()
+        Database.initialize()
+        logger.info("Database connection established")
+        applied = _perform_migrations(migrations)
+        logger.info(f"Migrations completed successfully ({applied} applied)")
+        return True
+
+    except MigrationError as e:
+        logger.error(f"Migration failed: {e}")
+        return False
+    except Exception as e:
+        logger.critical(f"Unexpected error during migration: {e}", exc_info=True)
+        return False
+    finally:
+        # Cleanup resources
+        Database.close()
+        logger.info("Database connection closed")
+
+def _perform_migrations(migrations: List[Tuple[int, str, ModuleType]]) -> int:
+    """Perform the actual migration steps, returning how many were applied."""
+    count = 0
+    with Database.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+            """)
+            conn.commit()
+
+            cur.execute("SELECT version FROM schema_migrations")
+            done = {version for (version,) in cur.fetchall()}
+
+            for version, name, module in migrations:
+                if version in done:
+                    continue
+                logger.info(f"Applying migration {version:03d}_{name}")
+                try:
+                    module.upgrade(cur)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Migration step failed: {e}")
+                    raise MigrationError(f"Migration {version:03d}_{name} failed") from e
+                count += 1
+        finally:
+            # Session-level lock: release it before the connection goes back to the pool
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+            conn.commit()
+    return count
+
+if __name__ == '__main__':
+    if not run_migrations():
+        exit(1)
@@ -0,0 +1,207 @@
+"""
+Fail if a hot query's plan falls back to a sequential scan.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/quizbot_test python scripts/check_query_plans.py
+    python scripts/check_query_plans.py --users 200000 --questions 100000
+
+Run it against a migrated database. Synthetic users, stats, achievements,
+battles, broadcasts and questions are inserted and ANALYZEd inside a
+transaction that is rolled back at the end, so the plans reflect a
+realistically sized database and nothing is left behind. Exits 1 if any
+query listed in HOT_QUERIES scans one of its tables sequentially, or if a
+leaderboard seeding query in SEED_QUERIES does more than scan its table.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from answer_log import COLUMNS
+from database import Database
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Seeded ids start here so they never collide with real rows
+SEED_BASE = 9_000_000_000_000
+SEED_CATEGORIES = 20
+
+# (name, query, params) for the queries that run per update, per flush or per page
+HOT_QUERIES = [
+    ("stats upsert",
+     "INSERT INTO user_stats (user_id, correct_answers, wrong_answers, highest_streak, total_score, total_quizzes) "
+     "VALUES (%s, 1, 0, 1, 10, 0), (%s, 0, 1, 0, 0, 1) "
+     "ON CONFLICT (user_id) DO UPDATE SET "
+     "correct_answers = user_stats.correct_answers + EXCLUDED.correct_answers, "
+     "wrong_answers = user_stats.wrong_answers + EXCLUDED.wrong_answers, "
+     "highest_streak = GREATEST(user_stats.highest_streak, EXCLUDED.highest_streak), "
+     "total_score = user_stats.total_score + EXCLUDED.total_score, "
+     "total_quizzes = user_stats.total_quizzes + EXCLUDED.total_quizzes",
+     (SEED_BASE + 42, SEED_BASE + 43)),
+    ("category stats upsert",
+     "INSERT INTO user_category_stats (user_id, category, correct_answers, wrong_answers) "
+     "VALUES (%s, 'seed_category_7', 1, 0), (%s, 'seed_category_7', 0, 1) "
+     "ON CONFLICT (user_id, category) DO UPDATE SET "
+     "correct_answers = user_category_stats.correct_answers + EXCLUDED.correct_answers, "
+     "wrong_answers = user_category_stats.wrong_answers + EXCLUDED.wrong_answers",
+     (SEED_BASE + 42, SEED_BASE + 43)),
+    # The log is written with COPY, which has no plan; this is the same insert row by row
+    ("answer log insert",
+     f"INSERT INTO answer_events ({', '.join(COLUMNS)}) VALUES (NOW(), %s, 1, 0, true, 2500, 'quiz')",
+     (SEED_BASE + 42,)),
+    ("broadcast claim",
+     "UPDATE broadcasts SET owner = %s, lease_until = NOW() + %s * INTERVAL '1 second' "
+     "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < NOW()) "
+     "RETURNING broadcast_id",
+     ('check_query_plans', 60)),
+    ("broadcast recipient page",
+     "SELECT user_id FROM users WHERE user_id > %s ORDER BY user_id LIMIT 500",
+     (SEED_BASE + 1000,)),
+    ("one user's stats",
+     "SELECT total_quizzes, correct_answers, wrong_answers, highest_streak, total_score "
+     "FROM user_stats WHERE user_id = %s",
+     (SEED_BASE + 42,)),
+    ("one user's achievements",
+     "SELECT achievement_id FROM user_achievements WHERE user_id = %s",
+     (SEED_BASE + 42,)),
+    ("leaderboard names",
+     "SELECT user_id, username FROM users WHERE user_id = ANY(%s)",
+     ([SEED_BASE + i for i in range(10)],)),
+]
+
+# Queries that read a whole table once, when a worker seeds the leaderboard.
+# A sequential scan is the right plan for them; they fail if the plan grows
+# anything else (a sort, a join) on top of the scan
+SEED_QUERIES = [
+    ("leaderboard seed",
+     "SELECT user_id, total_score FROM user_stats WHERE total_score > 0",
+     ()),
+    ("category leaderboard seed",
+     "SELECT user_id, category, correct_answers * 10 FROM user_category_stats WHERE correct_answers > 0",
+     ()),
+]
+
+SCAN_NODES = {'Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan'}
+
+
+def seed(cur, users, questions):
+    cur.execute("""
+        INSERT INTO users (user_id, username)
+        SELECT %s + i, 'seed_' || i FROM generate_series(0, %s - 1) AS i
+    """, (SEED_BASE, users))
+    cur.execute("""
+        INSERT INTO user_stats (user_id, total_quizzes, correct_answers, wrong_answers, highest_streak, total_score)
+        SELECT %s + i, i %% 50, i %% 400, i %% 300, i %% 20, (i * 7919) %% 100000
+        FROM generate_series(0, %s - 1) AS i
+    """, (SEED_BASE, users))
+    cur.execute("""
+        INSERT INTO user_category_stats (user_id, category, correct_answers, wrong_answers)
+        SELECT %s + i, 'seed_category_' || c, (i + c) %% 40, (i * c) %% 30
+        FROM generate_series(0, %s - 1) AS i, generate_series(0, 4) AS c
+    """, (SEED_BASE, users))
+    cur.execute("""
+        INSERT INTO user_achievements (user_id, achievement_id)
+        SELECT %s + i, a FROM generate_series(0, %s - 1) AS i,
+               unnest(ARRAY['quiz_starter', 'streak_3']) AS a
+    """, (SEED_BASE, users))
+    cur.execute("""
+        INSERT INTO battle_results (battle_id, user_id, opponent_id, score, response_time, won)
+        SELECT 'seed' || i, %s + i, %s + i + 1, 30, 12.5, i %% 2 = 0
+        FROM generate_series(0, %s - 1) AS i
+    """, (SEED_BASE, SEED_BASE, users))
+    cur.execute("""
+        INSERT INTO broadcasts (message, admin_chat_id, status, total, sent)
+        SELECT 'seed', 1, 'finished', 100, 100 FROM generate_series(1, 5000)
+    """)
+    cur.execute("""
+        INSERT INTO broadcasts (message, admin_chat_id, status, total, sent, owner, lease_until)
+        SELECT 'seed', 1, 'running', 100, 50, 'seed', NOW() + INTERVAL '1 minute' FROM generate_series(1, 3)
+    """)
+    cur.execute("""
+        INSERT INTO questions (category, question_text, option1, option2, option3, option4,
+                               correct_option, is_active, text_hash)
+        SELECT 'seed_category_' || (i %% %s), 'Seed question ' || i || '?', 'a', 'b', 'c', 'd',
+               i %% 4, i %% 10 <> 0, md5('seed' || i)
+        FROM generate_series(0, %s - 1) AS i
+    """, (SEED_CATEGORIES, questions))
+    for table in ('users', 'user_stats', 'user_category_stats', 'user_achievements', 'battle_results', 'broadcasts', 'questions'):
+        cur.execute(f"ANALYZE {table}")
+
+
+def seq_scans(plan):
+    """Tables the plan reads with a sequential scan."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def extra_nodes(plan):
+    """Plan nodes other than the scans themselves."""
+    found = [] if plan.get('Node Type') in SCAN_NODES else [plan['Node Type']]
+    for child in plan.get('Plans', []):
+        found.extend(extra_nodes(child))
+    return found
+
+
+def explain(cur, query, params):
+    cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def check(cur):
+    failures = 0
+    for name, query, params in HOT_QUERIES:
+        scanned = seq_scans(explain(cur, query, params))
+        if scanned:
+            failures += 1
+            logger.error(f"FAIL {name}: sequential scan on {', '.join(scanned)}")
+        else:
+            logger.info(f"ok   {name}")
+    for name, query, params in SEED_QUERIES:
+        extra = extra_nodes(explain(cur, query, params))
+        if extra:
+            failures += 1
+            logger.error(f"FAIL {name}: {', '.join(extra)} on top of the scan")
+        else:
+            logger.info(f"ok   {name}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=50000)
+    args = parser.parse_args()
+
+    Database.initialize()
+    try:
+        with Database.connection() as conn, conn.cursor() as cur:
+            try:
+                seed(cur, args.users, args.questions)
+                failures = check(cur)
+            finally:
+                conn.rollback()
+    finally:
+        Database.close()
+
+    if failures:
+        logger.error(f"{failures} hot queries have the wrong plan")
+        sys.exit(1)
+    logger.info("All hot queries have the expected plans")
+
+
+if __name__ == '__main__':
+    main()
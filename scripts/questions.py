@@ -0,0 +1,67 @@
+"""
+Bulk question import/export.
+
+Usage:
+    python scripts/questions.py import questions.csv
+    python scripts/questions.py import questions.jsonl --batch-size 20000
+    python scripts/questions.py export backup.jsonl
+
+The format is taken from the file extension (.csv or .jsonl). Columns are
+category, question_text, option1-option4 and correct_option (1-4).
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from database import Database
+from question_io import import_questions, export_questions
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension not in ('csv', 'jsonl'):
+        raise SystemExit(f"Unsupported file type: {path} (expected .csv or .jsonl)")
+    return extension
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    fmt = file_format(args.path)
+    Database.initialize()
+    start = time.perf_counter()
+    try:
+        if args.command == 'import':
+            with open(args.path, newline='', encoding='utf-8') as stream:
+                stats = import_questions(stream, fmt, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Read {stats['read']} rows in {elapsed:.1f}s ({stats['read'] / elapsed:.0f} rows/s): "
+                f"{stats['inserted']} inserted, {stats['duplicates']} duplicates, {stats['invalid']} invalid"
+            )
+            for error in stats['errors']:
+                logger.warning(error)
+        else:
+            with open(args.path, 'w', newline='', encoding='utf-8') as stream:
+                count = export_questions(stream, fmt)
+            logger.info(f"Exported {count} questions in {time.perf_counter() - start:.1f}s")
+    finally:
+        Database.close()
+
+
+if __name__ == '__main__':
+    main()